@@ -1,8 +1,55 @@
 import os
-from beacon_shared.config import TIMINGS
+import sys
+from datetime import timedelta
+from beacon_shared.config import TIMINGS, HIGH_RATE_PERIOD, scaled_timings
 from pulse_scheduler import PulseScheduler
+from write_behind import WriteBehind, BEACON_JOURNAL_PATH
+from signing_service import get_signing_client
+from beacon_shared.tracing import SpanExporter
+from beacon_shared.metrics_server import MetricsServer
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['simulate']:
+        # eg: python3 /app simulate --pulses 1000000 --workers 8
+        from simulate import main
+        main(sys.argv[2:])
+        exit(0)
+
+    # per-stage spans (see beacon_shared/tracing.py), eg: /db/spans.jsonl
+    exporter = SpanExporter(path=os.getenv('BEACON_TRACE_PATH'))
+    exporter.start()
+    if os.getenv('BEACON_METRICS_PORT'):
+        MetricsServer(exporter, int(os.getenv('BEACON_METRICS_PORT')), os.getenv('BEACON_METRICS_HOST', '127.0.0.1')).start()
+
     use_hsm = int(os.getenv('USE_HSM', 0)) == 1
-    ctrl = PulseScheduler(**TIMINGS, use_hsm=use_hsm)
-    ctrl.start()
+    # eg: tcp://signer:5060 to sign in the signing service container
+    signer_address = os.getenv('SIGNER_ADDRESS')
+    signer = get_signing_client(signer_address) if signer_address else None
+    # eg: 0.99 to start generating just in time for 99% of the generation durations
+    adaptive_anticipation = os.getenv('ADAPTIVE_ANTICIPATION')
+    adaptive_anticipation = float(adaptive_anticipation) if adaptive_anticipation else None
+    if os.getenv('BEACON_PROFILES'):
+        # several chains in one process (see multi_chain.py)
+        from multi_chain import MultiChainScheduler
+        MultiChainScheduler(
+            use_hsm=use_hsm,
+            signer=signer,
+            adaptive_anticipation=adaptive_anticipation,
+            journal_path=BEACON_JOURNAL_PATH
+        ).start()
+        exit(0)
+
+    timings = TIMINGS
+    if os.getenv('BEACON_PERIOD'):
+        # eg: 0.1 for 10 pulses per second
+        timings = scaled_timings(timedelta(seconds=float(os.getenv('BEACON_PERIOD'))))
+    # async: pipelined asyncio scheduler (default for high rate chains), sync: the sequential sched loop
+    default_mode = 'async' if timings['period'] <= HIGH_RATE_PERIOD else 'sync'
+    is_async = os.getenv('SCHEDULER_MODE', default_mode) == 'async'
+    # the sync loop only persists behind the release when the pulses are journaled
+    write_behind = WriteBehind() if is_async or BEACON_JOURNAL_PATH else None
+    ctrl = PulseScheduler(**timings, use_hsm=use_hsm, signer=signer, adaptive_anticipation=adaptive_anticipation, write_behind=write_behind)
+    if is_async:
+        ctrl.start_async()
+    else:
+        ctrl.start()
@@ -0,0 +1,85 @@
+"""
+Adaptive anticipation.
+
+The configured anticipation is a worst case: generation starts that long
+before the pulse timestamp, and the pulse then sits prepared until its
+release. In adaptive mode the scheduler keeps a streaming estimate (P-square)
+of a quantile of the observed generation durations and starts generating
+just early enough for the pulse to be ready at its release time
+(timeStamp + delay) at that quantile.
+
+The anticipation stays between 0 and the configured anticipation, so
+the timings validated against R1-R7 still hold (Table 13 has examples
+with no anticipation). After a late pulse the configured anticipation
+is used again until more durations were observed.
+"""
+from datetime import timedelta
+from beacon_shared.metrics import METRICS
+
+# the estimated quantile is multiplied by this
+ADAPTIVE_ANTICIPATION_MARGIN = 1.5
+# durations observed before (and after a late pulse) leaving the configured anticipation
+ADAPTIVE_ANTICIPATION_MIN_SAMPLES = 20
+
+class AdaptiveAnticipation:
+    """
+    Arguments
+    ---------
+    quantile - target quantile of the generation durations (eg: 0.99)
+    anticipation, delay, max_local_skew_ahead - the scheduler timings
+    margin - safety factor applied to the estimated quantile
+    min_samples - see ADAPTIVE_ANTICIPATION_MIN_SAMPLES
+    name - prefix of the exported metrics
+    """
+    def __init__(self, quantile, anticipation, delay, max_local_skew_ahead,
+                 margin = ADAPTIVE_ANTICIPATION_MARGIN, min_samples = ADAPTIVE_ANTICIPATION_MIN_SAMPLES, name = 'anticipation'):
+        if not 0 < quantile < 1:
+            raise ValueError('The quantile must be between 0 and 1')
+        self.delay = delay
+        self.max_local_skew_ahead = max_local_skew_ahead
+        self.margin = margin
+        self.min_samples = min_samples
+        self.lower_bound = timedelta(0)
+        self.upper_bound = anticipation
+        self.value = anticipation
+        # pulses left to wait before adapting again
+        self.holdoff = min_samples
+
+        self.estimate = METRICS.p2_quantile(name + '_generation_duration', quantile)
+        self.value_gauge = METRICS.gauge(name + '_seconds')
+        self.target_gauge = METRICS.gauge(name + '_target_seconds')
+        METRICS.gauge(name + '_lower_bound_seconds').set(self.lower_bound.total_seconds())
+        METRICS.gauge(name + '_upper_bound_seconds').set(self.upper_bound.total_seconds())
+        self.clamped = METRICS.counter(name + '_clamped')
+        self.resets = METRICS.counter(name + '_resets')
+        self.value_gauge.set(self.value.total_seconds())
+
+    def get_target(self):
+        """
+        Anticipation for the pulse to be ready at its release at the target quantile
+        (generation started late by up to max_local_skew_ahead)
+        """
+        duration = timedelta(seconds=self.estimate.value() * self.margin)
+        return duration + self.max_local_skew_ahead - self.delay
+
+    def observe(self, generation_duration, late = False):
+        """
+        Update the anticipation with the duration (timedelta) of a pulse generation
+        """
+        self.estimate.observe(generation_duration.total_seconds())
+        if late:
+            self.resets.inc()
+            self.holdoff = self.min_samples
+        elif self.holdoff > 0:
+            self.holdoff -= 1
+
+        if self.holdoff > 0:
+            self.value = self.upper_bound
+        else:
+            target = self.get_target()
+            self.target_gauge.set(target.total_seconds())
+            self.value = min(max(target, self.lower_bound), self.upper_bound)
+            if self.value != target:
+                self.clamped.inc()
+        self.value_gauge.set(self.value.total_seconds())
+        return self.value
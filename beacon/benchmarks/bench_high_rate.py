@@ -0,0 +1,102 @@
+"""
+Late pulses of a high rate chain.
+
+Runs the asyncio scheduler on a VirtualClock which counts the time spent
+computing but shortens the waits by the speedup factor. The background
+threads (RSA RNG buffer, external sources...) only get the shortened
+waits, so the speedup must leave them enough time: at 10Hz the RSA RNG
+alone needs about a third of a core, times the speedup. The default is real
+time (speedup 1), a speedup over 1 needs more than one core.
+Exits with 1 if any pulse was late (STATUS_GAP) or missed a randomness
+source (STATUS_SOURCE_MISSING).
+
+usage (from the beacon directory):
+    python3 -m benchmarks.bench_high_rate [--hours 24] [--period 0.1] [--speedup 1] [--cypher-suite 0]
+"""
+import os
+import io
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import timedelta
+from beacon_shared.config import CYPHER_SUITE, scaled_timings
+from beacon_shared.status_codes import STATUS_GAP, STATUS_SOURCE_MISSING
+from beacon_shared.metrics import METRICS
+from beacon_shared.store import BeaconStore
+from pulse_scheduler import PulseScheduler
+from signer import Signer
+from clock import VirtualClock
+
+async def run_until(scheduler, num_pulses):
+    task = asyncio.ensure_future(scheduler.run_async())
+    while getattr(scheduler, 'previous_pulse', None) is None or scheduler.previous_pulse.pulseIndex < num_pulses - 1:
+        await asyncio.sleep(0.5)
+        if task.done():
+            task.result()
+    task.cancel()
+    await task
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='bench_high_rate')
+    parser.add_argument('--hours', type=float, default=24, help='simulated duration')
+    parser.add_argument('--period', type=float, default=0.1, help='pulse period (seconds)')
+    parser.add_argument('--speedup', type=float, default=1, help='simulated time / real waiting time')
+    parser.add_argument('--cypher-suite', type=int, default=CYPHER_SUITE)
+    args = parser.parse_args(argv)
+
+    period = timedelta(seconds=args.period)
+    num_pulses = int(args.hours * 3600 / args.period)
+    directory = tempfile.TemporaryDirectory()
+    db_path = os.path.join(directory.name, 'beacon.db')
+    scheduler = PulseScheduler(
+        **scaled_timings(period),
+        use_hsm = False,
+        signer = Signer(False, args.cypher_suite),
+        clock = VirtualClock(speedup=args.speedup),
+        store = BeaconStore(db_path)
+    )
+
+    late_before = METRICS.counter('pulse_late_variant_used').value
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(run_until(scheduler, num_pulses))
+    wall = time.perf_counter() - started_at
+    sources = scheduler.randomness_sources.get_stats()
+    scheduler.randomness_sources.simpleRSA.stop()
+
+    store = BeaconStore(db_path)
+    released = store.dbConnection.execute('SELECT COUNT(*) FROM {}'.format(store.table)).fetchone()[0]
+    gaps, degraded = (
+        store.dbConnection.execute(
+            'SELECT COUNT(*) FROM {} WHERE statusCode & ?'.format(store.table),
+            (status,)
+        ).fetchone()[0]
+        for status in (STATUS_GAP, STATUS_SOURCE_MISSING)
+    )
+    late = METRICS.counter('pulse_late_variant_used').value - late_before
+    jitter = METRICS.histogram('pulse_release_jitter')
+
+    print('{} pulses ({:.2f} simulated hours at {}s) in {:.1f}s, {:.1f} pulses/s'.format(
+        released, released * args.period / 3600, args.period, wall, released / wall
+    ))
+    print('late pulses: {} (STATUS_GAP in the store: {})'.format(late, gaps))
+    print('pulses missing a randomness source: {} (missed: {}, rsa buffer: {})'.format(
+        degraded,
+        ', '.join('{} {}'.format(name, stats['missed']) for name, stats in sources.items() if 'missed' in stats),
+        sources['rsa_rng_buffer']
+    ))
+    print('release jitter: p50 {:.6f}s, p99 {:.6f}s, max {:.6f}s'.format(
+        jitter.quantile(0.5), jitter.quantile(0.99), jitter.max
+    ))
+    early, late_releases = METRICS.histogram('pulse_release_early'), METRICS.histogram('pulse_release_late')
+    print('releases: {} early (max {}s), {} late (max {}s)'.format(
+        early.count, early.max or 0, late_releases.count, late_releases.max or 0
+    ))
+    store.dbConnection.close()
+    directory.cleanup()
+    return 1 if gaps or late or degraded else 0
+
+if __name__ == '__main__':
+    exit(main())
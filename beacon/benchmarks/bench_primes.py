@@ -0,0 +1,52 @@
+"""
+Prime generation time for the RSA RNG parameters.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_primes [runs]
+"""
+import sys
+import time
+from sympy import nextprime, igcd
+from primes import get_random_int, random_prime, strong_prime, generate_rsa_parameters, build_rsa_parameters
+
+NBITS = 2048
+E = 3
+
+def sympy_prime(nbits, e):
+    """
+    The previous SimpleRSARNG prime generation
+    """
+    p = get_random_int(nbits // 8)
+    while p < pow(2, nbits - 1):
+        p = 2 * p
+    p = nextprime(p)
+    while igcd(e, p - 1) != 1:
+        p = nextprime(p)
+    return p
+
+def measure(name, fn, n):
+    fn()
+    durations = []
+    for _ in range(n):
+        started_at = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started_at)
+    durations.sort()
+    print('{:>28}: mean {:8.1f} ms, p50 {:8.1f} ms, max {:8.1f} ms'.format(
+        name,
+        1000 * sum(durations) / n,
+        1000 * durations[n // 2],
+        1000 * durations[-1]
+    ))
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    nbitsprime = NBITS // 2
+    print('{} bit modulus, e = {}, {} runs'.format(NBITS, E, n))
+    measure('prime (sympy nextprime)', lambda: sympy_prime(nbitsprime, E), n)
+    measure('prime (sieve + MR)', lambda: random_prime(nbitsprime, E), n)
+    measure('strong prime', lambda: strong_prime(nbitsprime, E), max(1, n // 4))
+    measure('parameters (in process)', lambda: generate_rsa_parameters(NBITS, E), n)
+    measure('parameters (process pool)', lambda: build_rsa_parameters(NBITS, E).result(), n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Release error of sleeping until a deadline vs the hybrid sleep/spin ReleaseTimer.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_release_timer [releases] [interval ms]
+"""
+import sys
+import time
+import asyncio
+from datetime import datetime, timedelta
+from clock import SystemClock
+from release_timer import ReleaseTimer
+
+def plain_sleep(deadline):
+    time.sleep(max((deadline - datetime.now()).total_seconds(), 0))
+    return datetime.now()
+
+async def plain_sleep_async(deadline):
+    await asyncio.sleep(max((deadline - datetime.now()).total_seconds(), 0))
+    return datetime.now()
+
+def report(name, errors):
+    errors = sorted(abs(e) for e in errors)
+    n = len(errors)
+    print('{:>22}: p50 {:8.1f} us, p99 {:8.1f} us, max {:8.1f} us'.format(
+        name,
+        1e6 * errors[n // 2],
+        1e6 * errors[min(n - 1, int(n * 0.99))],
+        1e6 * errors[-1]
+    ))
+
+def measure(wait_until, n, interval):
+    errors = []
+    for _ in range(n):
+        deadline = datetime.now() + interval
+        errors.append((wait_until(deadline) - deadline).total_seconds())
+    return errors
+
+async def measure_async(wait_until, n, interval):
+    errors = []
+    for _ in range(n):
+        deadline = datetime.now() + interval
+        errors.append((await wait_until(deadline) - deadline).total_seconds())
+    return errors
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    interval = timedelta(milliseconds=float(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    timer = ReleaseTimer(SystemClock())
+    print('{} releases, {} apart'.format(n, interval))
+    report('sleep', measure(plain_sleep, n, interval))
+    report('release timer', measure(timer.wait_until, n, interval))
+    report('asyncio sleep', asyncio.run(measure_async(plain_sleep_async, n, interval)))
+    report('release timer (async)', asyncio.run(measure_async(timer.wait_until_async, n, interval)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Restart to first pulse time, resuming the chain from its checkpoint vs
+starting a new one (the seal key changed, so the checkpoint can't be unsealed).
+
+The scheduler is stopped after a few pulses then restarted right away.
+Startup is the time to build the scheduler and recall its state; the
+first pulse time also waits for the next pulse of the schedule. The
+chain is only resumed if the restart is over before the next pulse is due.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_resume [--period 5] [--restarts 3]
+"""
+import io
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from datetime import timedelta
+from beacon_shared.config import scaled_timings
+from beacon_shared.store import BeaconStore
+from pulse_scheduler import PulseScheduler
+from signer import Signer
+
+async def run_until(scheduler, index):
+    task = asyncio.ensure_future(scheduler.run_async())
+    while getattr(scheduler, 'previous_pulse', None) is None or scheduler.previous_pulse.pulseIndex < index:
+        await asyncio.sleep(0.01)
+        if task.done():
+            task.result()
+    task.cancel()
+    await task
+
+def restart(db_path, timings, signer, seal_key):
+    """
+    Returns (startup seconds, first pulse seconds, whether the chain was resumed)
+    """
+    started_at = time.perf_counter()
+    s = PulseScheduler(**timings, use_hsm=False, signer=signer, store=BeaconStore(db_path), seal_key=seal_key)
+    s.recall_state()
+    startup = time.perf_counter() - started_at
+    resumed = s.previous_pulse is not None
+    first = 0 if s.previous_pulse is None else s.previous_pulse.pulseIndex + 1
+    asyncio.run(run_until(s, first))
+    first_pulse = time.perf_counter() - started_at
+    s.randomness_sources.simpleRSA.stop()
+    return startup, first_pulse, resumed
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='bench_resume')
+    parser.add_argument('--period', type=float, default=5, help='pulse period (seconds)')
+    parser.add_argument('--restarts', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    timings = scaled_timings(timedelta(seconds=args.period))
+    for name, same_key in [('resume', True), ('new chain', False)]:
+        directory = tempfile.TemporaryDirectory()
+        db_path = os.path.join(directory.name, 'beacon.db')
+        signer = Signer(False)
+        seal_key = os.urandom(32).hex()
+        results = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            restart(db_path, timings, signer, seal_key)
+            for _ in range(args.restarts):
+                results.append(restart(db_path, timings, signer, seal_key if same_key else os.urandom(32).hex()))
+        print('{:>10}: startup {:6.3f}s, first pulse {:6.3f}s (mean of {} restarts, period {}s), {} resumed'.format(
+            name,
+            sum(r[0] for r in results) / len(results),
+            sum(r[1] for r in results) / len(results),
+            len(results),
+            args.period,
+            sum(r[2] for r in results)
+        ))
+        directory.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+End to end overhead of the signing service compared with in-process signing.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_signing_service [num_requests]
+"""
+import sys
+import os
+import time
+import multiprocessing
+from signer import Signer
+from signing_service import SigningService, SigningClient, LocalTransport, ZMQTransport, ZMQSigningServer
+from beacon_shared.hashing import hash_bytes
+
+ADDRESS = 'tcp://127.0.0.1:5962'
+
+def serve():
+    ZMQSigningServer(SigningService(Signer(False), rate=1e9, burst=1e9)).start(ADDRESS)
+
+def measure(name, sign, n):
+    digest = hash_bytes(os.urandom(64))
+    # warm up
+    for _ in range(10):
+        sign(digest)
+    latencies = []
+    for _ in range(n):
+        started_at = time.perf_counter()
+        sign(digest)
+        latencies.append(time.perf_counter() - started_at)
+    latencies.sort()
+    print('{:>22}: mean {:7.3f} ms, p50 {:7.3f} ms, p99 {:7.3f} ms'.format(
+        name,
+        1000 * sum(latencies) / n,
+        1000 * latencies[n // 2],
+        1000 * latencies[min(n - 1, int(n * 0.99))]
+    ))
+    return latencies
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    signer = Signer(False)
+
+    measure('in process', signer.sign_digest, n)
+
+    service = SigningService(signer, rate=1e9, burst=1e9)
+    service.start()
+    measure('service (local)', SigningClient(LocalTransport(service)).sign_digest, n)
+    service.stop()
+
+    server = multiprocessing.Process(target=serve, daemon=True)
+    server.start()
+    transport = ZMQTransport(ADDRESS)
+    client = SigningClient(transport, timeout=30)
+    measure('service (zmq process)', client.sign_digest, n)
+    transport.close()
+    server.terminate()
+
+if __name__ == '__main__':
+    main()
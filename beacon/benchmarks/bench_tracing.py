@@ -0,0 +1,89 @@
+"""
+Overhead of the per-stage spans (beacon_shared/tracing.py) on pulse generation.
+
+Reports the cost of one span, the number of spans per pulse, and the
+generation time (sources to stored pulse) with the tracer enabled vs
+disabled. The overhead estimate is spans per pulse x span cost over the
+generation time, the A/B difference being within the noise.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_tracing [pulses]
+"""
+import os
+import io
+import sys
+import time
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from beacon_shared.config import TIMINGS
+from beacon_shared.store import BeaconStore
+from beacon_shared.tracing import TRACER, Tracer, SpanRing
+from pulse_scheduler import PulseScheduler
+from randomness_sources import RandomnessSources
+from clock import VirtualClock
+
+def span_cost(tracer, n = 200000):
+    started_at = time.perf_counter_ns()
+    for _ in range(n):
+        with tracer.span('bench'):
+            pass
+    return (time.perf_counter_ns() - started_at) / n
+
+def generate(s):
+    s.pulse_generation_started_at = s.now()
+    s.pulse_generation_duration = timedelta(0)
+    s.next_local_random_value, s.next_local_random_value_degraded = s.get_local_random_value()
+    s.generate_pulse(s.next_local_random_value)
+    s.sign_pulse_variants()
+    late_variant = s.late_variant
+    s.use_on_time_variant()
+    s.emit_pulse()
+    s.clock.sleep(TIMINGS['period'].total_seconds())
+    return late_variant
+
+def measure(directory, enabled, n):
+    """
+    Returns the median generation time (seconds) and the number of spans per pulse
+    """
+    TRACER.enabled = enabled
+    TRACER.ring = SpanRing(32 * n)
+    s = PulseScheduler(
+        **TIMINGS,
+        use_hsm = False,
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False),
+        store = BeaconStore(os.path.join(directory, 'tracing-{}.db'.format(enabled))),
+        randomness_sources = RandomnessSources(sources=[('urandom', lambda: os.urandom(64))]),
+        quiet = True
+    )
+    durations = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        s.recall_state()
+        since = len(TRACER.ring.read()[0])
+        for _ in range(n):
+            started_at = time.perf_counter()
+            late_variant = generate(s)
+            durations.append(time.perf_counter() - started_at)
+            # the late variant is signed on a worker thread: keep it out of the next pulse
+            late_variant.result()
+    s.signing_pool.shutdown()
+    durations.sort()
+    return durations[n // 2], len(TRACER.ring.read(since)[0]) / n
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else 500
+    enabled_cost = span_cost(Tracer())
+    disabled_cost = span_cost(Tracer(enabled=False))
+    print('span: {:.0f} ns enabled, {:.0f} ns disabled'.format(enabled_cost, disabled_cost))
+
+    with tempfile.TemporaryDirectory() as directory:
+        off, _ = measure(directory, False, n)
+        on, spans = measure(directory, True, n)
+    print('generation: {:.3f} ms traced, {:.3f} ms untraced (median of {} pulses)'.format(1e3 * on, 1e3 * off, n))
+    print('{:.1f} spans per pulse, overhead {:.3f}% of the generation time'.format(
+        spans,
+        100 * spans * enabled_cost / 1e9 / on
+    ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Release latency (PulseScheduler.emit_pulse) with the pulses persisted
+synchronously, by the write-behind stage, and by the journaled write-behind stage.
+
+usage (from the beacon directory): python3 -m benchmarks.bench_write_behind [pulses]
+"""
+import os
+import io
+import sys
+import time
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from beacon_shared.config import TIMINGS
+from beacon_shared.store import BeaconStore
+from pulse_scheduler import PulseScheduler
+from randomness_sources import RandomnessSources
+from write_behind import WriteBehind
+from clock import VirtualClock
+
+MODES = ['sync', 'write-behind', 'journaled']
+
+def measure(directory, mode, n, quiet):
+    name = '{}-{}'.format(mode, quiet)
+    db_path = os.path.join(directory, name + '.db')
+    write_behind = None
+    if mode != 'sync':
+        write_behind = WriteBehind(db_path, os.path.join(directory, name + '.journal') if mode == 'journaled' else None)
+    s = PulseScheduler(
+        **TIMINGS,
+        use_hsm = False,
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False),
+        store = BeaconStore(db_path),
+        randomness_sources = RandomnessSources(sources=[('urandom', lambda: os.urandom(64))]),
+        quiet = quiet,
+        write_behind = write_behind
+    )
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        if write_behind is not None:
+            write_behind.start()
+        s.recall_state()
+        for _ in range(n):
+            s.pulse_generation_started_at = s.now()
+            s.pulse_generation_duration = timedelta(0)
+            s.next_local_random_value, s.next_local_random_value_degraded = s.get_local_random_value()
+            s.generate_pulse(s.next_local_random_value)
+            s.sign_pulse_variants()
+            s.use_on_time_variant()
+            started_at = time.perf_counter()
+            s.emit_pulse()
+            latencies.append(time.perf_counter() - started_at)
+            # leave the writer time to catch up, as the period would
+            time.sleep(0.005)
+            s.clock.sleep(TIMINGS['period'].total_seconds())
+        if write_behind is not None:
+            write_behind.stop()
+    s.signing_pool.shutdown()
+    return latencies
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    directory = tempfile.TemporaryDirectory()
+    print('{} pulses'.format(n))
+    for quiet in [False, True]:
+        for mode in MODES:
+            latencies = sorted(measure(directory.name, mode, n, quiet))
+            print('{:>13}{:>8}: p50 {:8.1f} us, p99 {:8.1f} us, max {:8.1f} us'.format(
+                mode,
+                ' (quiet)' if quiet else '',
+                1e6 * latencies[n // 2],
+                1e6 * latencies[min(n - 1, int(n * 0.99))],
+                1e6 * latencies[-1]
+            ))
+    directory.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Sealed checkpoints of the chain state.
+
+A pulse commits to the next local random value (precommitmentValue)
+which only lives in the scheduler's memory, so without it a restart has
+to start a new chain. With each released pulse the scheduler checkpoints
+that value, sealed (AES-GCM) and bound to the pulse, in the same
+transaction as the pulse (see PulseScheduler.persist_pulse).
+
+The seal key is BEACON_SEAL_KEY (64 hex digits). It is not derived from the
+signer: the signing service signs any digest for its clients, so anyone who
+can reach it could derive the key and learn the next local random value.
+Without a seal key there are no checkpoints and a restart starts a new chain.
+"""
+import os
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from beacon_shared.types import ByteHash
+from beacon_shared.hashing import hash
+
+BEACON_SEAL_KEY = os.getenv('BEACON_SEAL_KEY')
+NONCE_SIZE = 12
+
+def get_checkpoint_sealer(seal_key = BEACON_SEAL_KEY):
+    """
+    The CheckpointSealer of the seal key (hex), None without one
+    """
+    if seal_key is None:
+        return None
+    return CheckpointSealer(bytes.fromhex(seal_key))
+
+class CheckpointSealer:
+    """
+    key - 32 bytes AES key
+    """
+    def __init__(self, key):
+        self.aead = AESGCM(key)
+
+    def associated_data(self, table, pulse):
+        return '{}:{}:{}:'.format(table, pulse.chainIndex, pulse.pulseIndex).encode() + pulse.precommitmentValue
+
+    def seal(self, table, pulse, local_random_value, degraded):
+        """
+        Seal the local random value of the pulse following `pulse` (committed by its precommitmentValue)
+        """
+        nonce = os.urandom(NONCE_SIZE)
+        plaintext = ByteHash.parse(local_random_value) + bytes([degraded])
+        return nonce + self.aead.encrypt(nonce, plaintext, self.associated_data(table, pulse))
+
+    def unseal(self, table, pulse, sealed):
+        """
+        The (local random value, degraded) sealed with `pulse`, or None if
+        it can't be unsealed or doesn't match the precommitment
+        """
+        try:
+            plaintext = self.aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], self.associated_data(table, pulse))
+        except InvalidTag:
+            return None
+        local_random_value = ByteHash(plaintext[:-1])
+        if hash(local_random_value) != pulse.precommitmentValue:
+            return None
+        return local_random_value, bool(plaintext[-1])
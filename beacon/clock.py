@@ -0,0 +1,78 @@
+"""
+Clocks used by the scheduler.
+
+The SystemClock follows real time. The VirtualClock skips sleeps
+instead of waiting, so a chain can be produced as fast as the pulses
+can be computed (eg: to generate large synthetic chains). By default
+time spent computing still advances it, so the timing checks see real
+durations. With a speedup, sleeps still take a fraction of their
+duration, which leaves time to the background threads (eg: the RSA RNG
+buffer) as they would have in real time.
+"""
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+class SystemClock:
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        # perf_counter doesn't keep track of ntp updates (see PulseScheduler.start)
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def spin_until(self, target):
+        """
+        Busy wait until the monotonic time target (more precise than sleeping)
+        """
+        while time.perf_counter() < target:
+            pass
+
+class VirtualClock:
+    """
+    start - the datetime the clock starts at
+    count_compute - if False, only sleeping advances the clock (fully deterministic)
+    speedup - if set, sleeps really last 1/speedup of their duration instead of being skipped
+    """
+    def __init__(self, start = None, count_compute = True, speedup = None):
+        self.start = datetime.now() if start is None else start
+        self.started_at = time.perf_counter()
+        self.count_compute = count_compute
+        self.speedup = speedup
+        self.skipped = 0.0
+
+    def monotonic(self):
+        if not self.count_compute:
+            return self.skipped
+        return time.perf_counter() - self.started_at + self.skipped
+
+    def now(self):
+        return self.start + timedelta(seconds=self.monotonic())
+
+    def skip(self, seconds):
+        """
+        Skip the part of the sleep that doesn't really happen. Returns the real sleep time.
+        """
+        if seconds <= 0:
+            return 0
+        real = 0 if self.speedup is None else seconds / self.speedup
+        self.skipped += seconds - real if self.count_compute else seconds
+        return real
+
+    def spin_until(self, target):
+        self.sleep(target - self.monotonic())
+
+    def sleep(self, seconds):
+        real = self.skip(seconds)
+        if real:
+            time.sleep(real)
+
+    async def sleep_async(self, seconds):
+        # still give the other tasks a chance to run
+        await asyncio.sleep(self.skip(seconds))
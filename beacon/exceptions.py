@@ -6,3 +6,9 @@ class LatePulseException(BeaconException):
 
 class PulseTimeException(BeaconException):
     pass
+
+class SigningException(BeaconException):
+    pass
+
+class SigningTimeoutException(SigningException):
+    pass
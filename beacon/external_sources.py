@@ -0,0 +1,262 @@
+"""
+External randomness sources (other beacons, entropy services...).
+
+Each source is a plugin (subclass of ExternalSource implementing fetch())
+which runs its own prefetch loop and caches its latest value with the time
+it was fetched, so that pulse generation never waits on the network.
+When a pulse is generated the fresh cached values are combined into the
+externalSourceId, externalStatusCode and externalValue pulse fields.
+
+Sources are configured with EXTERNAL_SOURCES, a comma separated list of
+`<type>:<url>` (eg: `nist:https://beacon.nist.gov/beacon/2.0/pulse/last`).
+"""
+import os
+import json
+import time
+import threading
+import urllib.request
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from beacon_shared.types import ByteHash
+from beacon_shared.hashing import hash_bytes, hash_many
+from beacon_shared.metrics import METRICS
+from beacon_shared.pulse import NO_EXTERNAL_VALUE
+from beacon_shared.status_codes import EXTERNAL_STATUS_OK, EXTERNAL_STATUS_PARTIAL
+
+# how often sources are fetched (seconds)
+EXTERNAL_SOURCE_REFRESH_INTERVAL = 5
+# cached values older than this (seconds) are not used
+EXTERNAL_SOURCE_MAX_AGE = 30
+# network timeout of one fetch (seconds)
+EXTERNAL_SOURCE_TIMEOUT = 5
+
+class ExternalSource:
+    """
+    Base class of the external source plugins
+
+    Arguments
+    ---------
+    name - short name used in the metrics
+    description - identifies the source. Its hash is the source id
+    refresh_interval - seconds between two fetches
+    max_age - seconds after which a fetched value is no longer fresh
+    """
+    def __init__(self, name, description, refresh_interval = EXTERNAL_SOURCE_REFRESH_INTERVAL, max_age = EXTERNAL_SOURCE_MAX_AGE):
+        self.name = name
+        self.description = description
+        self.source_id = hash_bytes(description.encode('utf-8'))
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+
+        self.value = None
+        self.fetched_at = None
+        self.updated = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.duration = METRICS.histogram('external_source_{}_duration'.format(name))
+        self.errors = METRICS.counter('external_source_{}_errors'.format(name))
+        self.stale = METRICS.counter('external_source_{}_stale'.format(name))
+
+    def fetch(self):
+        """
+        Fetch a new value (bytes). Implemented by the plugins.
+        """
+        raise NotImplementedError()
+
+    def refresh(self):
+        started_at = time.perf_counter()
+        try:
+            value = self.fetch()
+        except Exception as e:
+            self.errors.inc()
+            print('External source {} failed: {}'.format(self.name, e), flush=True)
+            return
+        finally:
+            self.duration.observe(time.perf_counter() - started_at)
+
+        with self.updated:
+            self.value = value
+            self.fetched_at = time.monotonic()
+            self.updated.notify_all()
+
+    def run(self):
+        while self.running:
+            self.refresh()
+            with self.updated:
+                if self.running:
+                    self.updated.wait(self.refresh_interval)
+
+    def start(self):
+        if self.thread:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='external-' + self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.updated:
+            self.running = False
+            self.updated.notify_all()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def is_fresh(self, now):
+        return self.fetched_at is not None and now - self.fetched_at <= self.max_age
+
+    def latest(self, deadline = None):
+        """
+        The cached value if it is fresh. If not, wait for the prefetch
+        loop until the deadline (time.monotonic() seconds) at the latest.
+        Returns None if there is no fresh value by then.
+        """
+        with self.updated:
+            while not self.is_fresh(time.monotonic()):
+                remaining = 0 if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stale.inc()
+                    return None
+                self.updated.wait(remaining)
+            return self.value
+
+class HTTPSource(ExternalSource):
+    """
+    The body of an HTTP response. If json_path is given (eg: 'pulse.outputValue'),
+    the response is parsed as json and the hex value at that path is used.
+    """
+    def __init__(self, name, url, json_path = None, timeout = EXTERNAL_SOURCE_TIMEOUT, **kwargs):
+        super().__init__(name, url if json_path is None else '{}#{}'.format(url, json_path), **kwargs)
+        self.url = url
+        self.json_path = json_path
+        self.timeout = timeout
+
+    def fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            body = response.read()
+        if self.json_path is None:
+            return body
+
+        value = json.loads(body)
+        for key in self.json_path.split('.'):
+            value = value[key]
+        return bytes.fromhex(value)
+
+class NISTBeaconSource(HTTPSource):
+    """
+    The output value of the latest pulse of a NIST beacon (v2 api)
+    """
+    def __init__(self, name, url, **kwargs):
+        super().__init__(name, url, json_path='pulse.outputValue', **kwargs)
+
+EXTERNAL_SOURCE_TYPES = {
+    'http': HTTPSource,
+    'nist': NISTBeaconSource
+}
+
+def load_external_sources(config):
+    """
+    Create the sources from a comma separated list of `<type>:<url>`
+    """
+    sources = []
+    for i, spec in enumerate(s.strip() for s in config.split(',') if s.strip()):
+        source_type, url = spec.split(':', 1)
+        if source_type not in EXTERNAL_SOURCE_TYPES:
+            raise ValueError('Unknown external source type {}'.format(source_type))
+        sources.append(EXTERNAL_SOURCE_TYPES[source_type]('{}{}'.format(source_type, i), url))
+    return sources
+
+class ExternalSources:
+    """
+    Combines the fresh values of the external sources into the
+    (externalSourceId, externalStatusCode, externalValue) pulse fields
+    """
+    def __init__(self, sources = None):
+        if sources is None:
+            sources = load_external_sources(os.getenv('EXTERNAL_SOURCES', ''))
+        self.sources = sources
+
+    def start(self):
+        for source in self.sources:
+            source.start()
+
+    def stop(self):
+        for source in self.sources:
+            source.stop()
+
+    def collect(self, timeout = 0):
+        """
+        Get the external pulse fields. Sources without a fresh value by
+        the end of the timeout (seconds) are left out, in which case the
+        status is EXTERNAL_STATUS_PARTIAL (or NONE if no value is left).
+        """
+        if not self.sources:
+            return NO_EXTERNAL_VALUE
+
+        deadline = time.monotonic() + timeout
+        ids = []
+        values = []
+        for source in self.sources:
+            value = source.latest(deadline)
+            if value is None:
+                continue
+            ids.append(ByteHash(source.source_id))
+            values.append(ByteHash(value))
+
+        if not values:
+            return NO_EXTERNAL_VALUE
+
+        status = EXTERNAL_STATUS_OK if len(values) == len(self.sources) else EXTERNAL_STATUS_PARTIAL
+        return (hash_many(ids), status, hash_many(values))
+
+    def get_stats(self):
+        now = time.monotonic()
+        return {
+            source.name: {
+                "fresh": source.is_fresh(now),
+                "p50": source.duration.quantile(0.5),
+                "errors": source.errors.value,
+                "stale": source.stale.value
+            } for source in self.sources
+        }
+
+class LocalEntropyServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP stand-in for an external source (for tests and benchmarks).
+    Serves nbytes of fresh random data, optionally after a delay (seconds).
+    """
+    daemon_threads = True
+
+    def __init__(self, nbytes = 64, delay = 0, port = 0):
+        self.nbytes = nbytes
+        self.delay = delay
+        self.requests_served = 0
+        super().__init__(('127.0.0.1', port), LocalEntropyHandler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='local-entropy-server', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+class LocalEntropyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = os.urandom(self.server.nbytes)
+        self.server.requests_served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
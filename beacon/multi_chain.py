@@ -0,0 +1,185 @@
+"""
+Run several independent chains (profiles) in one process.
+
+Each profile has its own period, its own pulse table and its own uri path
+(eg: /api/fast/1.0/chain/0/pulse/3), and runs its own asyncio scheduler.
+They share what is expensive to duplicate: the signer, the randomness
+sources, the external sources and the write-behind stage of the released
+pulses (see write_behind.py).
+
+Signatures go through a DeadlineSigner which signs the pending requests
+earliest deadline first, so a slow profile can't make a fast one late.
+
+Profiles are configured with BEACON_PROFILES, a comma separated list of
+`<name>:<period in seconds>` (eg: `fast:1,default:10,slow:60`). The
+timings of a profile keep the proportions of TIMINGS. The `default`
+profile uses the original table and uri path. The API serves the chains of
+the profiles listed in its own BEACON_PROFILES (see beacon_api/main.py).
+"""
+import os
+import re
+import math
+import signal
+import asyncio
+import threading
+import itertools
+from queue import PriorityQueue
+from concurrent.futures import Future
+from datetime import timedelta
+from beacon_shared.config import scaled_timings, DEFAULT_PROFILE
+from beacon_shared.store import BeaconStore, profile_table
+from pulse_scheduler import PulseScheduler
+from write_behind import WriteBehind
+from randomness_sources import RandomnessSources
+from external_sources import ExternalSources
+from signer import Signer
+
+PROFILE_NAME = re.compile('^[a-z0-9_]+$')
+
+class DeadlineSigner:
+    """
+    Wraps a signer so that concurrent sign_digest() calls are served one
+    at a time, earliest deadline first (requests without a deadline last)
+    """
+    def __init__(self, signer):
+        self.signer = signer
+        self.requests = PriorityQueue()
+        # ties are served in arrival order
+        self.counter = itertools.count()
+        self.thread = threading.Thread(target=self.run, name='deadline-signer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            _, _, digest, deadline, future = self.requests.get()
+            if digest is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.signer.sign_digest(digest, deadline))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, digest, deadline = None):
+        future = Future()
+        key = math.inf if deadline is None else deadline.timestamp()
+        self.requests.put((key, next(self.counter), digest, deadline, future))
+        return future
+
+    def sign_digest(self, digest, deadline = None):
+        return self.submit(digest, deadline).result()
+
+    def stop(self):
+        self.requests.put((-math.inf, next(self.counter), None, None, None))
+        self.thread.join()
+
+    def get_cypher_suite_id(self):
+        return self.signer.get_cypher_suite_id()
+
+    def get_certificate_id(self):
+        return self.signer.get_certificate_id()
+
+    def get_certificate(self):
+        return self.signer.get_certificate()
+
+class ChainProfile:
+    """
+    name - lowercase letters, digits and underscores
+    timings - PulseScheduler timings (see TIMINGS)
+    """
+    def __init__(self, name, timings):
+        if not PROFILE_NAME.match(name):
+            raise ValueError('Invalid profile name {}'.format(name))
+        self.name = name
+        self.timings = timings
+
+    @property
+    def table(self):
+        return profile_table(self.name)
+
+    @property
+    def uri_path(self):
+        if self.name == DEFAULT_PROFILE:
+            return '/api'
+        return '/api/{}'.format(self.name)
+
+def load_profiles(config):
+    """
+    Create the profiles from a comma separated list of `<name>:<period in seconds>`
+    """
+    profiles = []
+    for spec in (s.strip() for s in config.split(',') if s.strip()):
+        name, period = spec.split(':', 1)
+        profiles.append(ChainProfile(name, scaled_timings(timedelta(seconds=float(period)))))
+    if len(set(p.name for p in profiles)) != len(profiles):
+        raise ValueError('Duplicate profile names in {}'.format(config))
+    return profiles
+
+class MultiChainScheduler:
+    """
+    profiles - ChainProfile list. Defaults to the BEACON_PROFILES profiles
+    use_hsm, signer, clock, adaptive_anticipation - see PulseScheduler
+    db_path - defaults to BEACON_DB_PATH
+    journal_path - see WriteBehind
+    """
+    def __init__(self, profiles = None, use_hsm = True, signer = None, clock = None, db_path = None, adaptive_anticipation = None,
+                 journal_path = None):
+        if profiles is None:
+            profiles = load_profiles(os.getenv('BEACON_PROFILES', ''))
+        if not profiles:
+            raise ValueError('No chain profile')
+        self.profiles = profiles
+        self.signer = DeadlineSigner(Signer(use_hsm) if signer is None else signer)
+        # fetched at least once per period of the fastest profile
+        self.randomness_sources = RandomnessSources(use_hsm, period=min(profile.timings['period'] for profile in profiles).total_seconds())
+        self.external_sources = ExternalSources()
+        self.store = BeaconStore(db_path)
+        self.write_behind = WriteBehind(self.store.db_path, journal_path)
+
+        self.schedulers = [
+            PulseScheduler(
+                **profile.timings,
+                use_hsm = use_hsm,
+                signer = self.signer,
+                clock = clock,
+                store = self.store.withTable(profile.table),
+                randomness_sources = self.randomness_sources,
+                external_sources = self.external_sources,
+                name = profile.name,
+                uri_path = profile.uri_path,
+                adaptive_anticipation = adaptive_anticipation
+            ) for profile in profiles
+        ]
+
+    def start(self):
+        """
+        Run all the chains until SIGTERM or SIGINT
+        """
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        loop = asyncio.get_event_loop()
+        # replays the journal before the schedulers recall their state
+        await loop.run_in_executor(None, self.write_behind.start)
+        tasks = [
+            asyncio.ensure_future(scheduler.run_async(self.write_behind))
+            for scheduler in self.schedulers
+        ]
+
+        def cancel():
+            for task in tasks:
+                task.cancel()
+        loop.add_signal_handler(signal.SIGTERM, cancel)
+        loop.add_signal_handler(signal.SIGINT, cancel)
+
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            loop.remove_signal_handler(signal.SIGINT)
+            # let the released pulses be written
+            await loop.run_in_executor(None, self.write_behind.stop)
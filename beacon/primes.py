@@ -0,0 +1,247 @@
+"""
+Prime generation for the RSA RNG.
+
+Candidates are sieved by the small primes in windows (so that most
+composites never reach a modular exponentiation) and the survivors
+go through Miller-Rabin: one round for the whole window first, then
+the remaining rounds for the few that pass.
+
+RSA parameter sets (n, lam, x0) can be built in a process pool
+(build_rsa_parameters) so that the RNG can rotate its primes without
+blocking.
+"""
+import os
+import random
+import threading
+import concurrent.futures
+from functools import lru_cache
+from math import gcd
+from sympy import totient
+
+# candidates sieved at once (only odd numbers are considered)
+SIEVE_WINDOW = 4096
+# primes below this are used to sieve the candidates
+SIEVE_LIMIT = 1 << 16
+# Miller-Rabin rounds for random candidates (FIPS 186-4, table C.2)
+MILLER_RABIN_ROUNDS = 5
+# processes used to build RSA parameters in the background
+PRIME_WORKERS = 2
+# niceness of these processes, so that they don't delay the pulse generation
+PRIME_WORKERS_NICENESS = 10
+
+def get_random_int(nbytes):
+    return int.from_bytes(os.urandom(nbytes), byteorder="big")
+
+@lru_cache(maxsize=None)
+def small_primes(limit = SIEVE_LIMIT):
+    """
+    All primes below limit (sieve of Eratosthenes)
+    """
+    sieve = bytearray([1]) * limit
+    sieve[0:2] = b'\x00\x00'
+    for i in range(2, int(limit ** 0.5) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i, is_prime in enumerate(sieve) if is_prime]
+
+@lru_cache(maxsize=None)
+def small_primes_product(limit = 2048):
+    product = 1
+    for p in small_primes(limit):
+        product *= p
+    return product
+
+def miller_rabin(n, rounds):
+    """
+    Miller-Rabin test of an odd n > 3 with random bases
+    """
+    d = n - 1
+    s = 0
+    while d & 1 == 0:
+        d >>= 1
+        s += 1
+
+    for _ in range(rounds):
+        x = pow(random.randrange(2, n - 1), d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def is_probable_prime(n, rounds = MILLER_RABIN_ROUNDS):
+    if n < 2:
+        return False
+    if n < 2048:
+        return n in small_primes(2048)
+    if gcd(n, small_primes_product()) != 1:
+        return False
+    return miller_rabin(n, rounds)
+
+def sieve_window(start, window = SIEVE_WINDOW, e = None):
+    """
+    Candidates start + 2*i (start odd) for i < window which have no
+    small prime factor (and with gcd(e, candidate - 1) = 1 if e is given)
+    """
+    candidates = bytearray([1]) * window
+    for p in small_primes():
+        if p == 2:
+            continue
+        # first i such that p divides start + 2*i
+        i = (-start * pow(2, p - 2, p)) % p
+        if start + 2 * i == p:
+            # p itself is a candidate
+            i += p
+        candidates[i::p] = bytes(len(range(i, window, p)))
+        if e is not None and e % p == 0:
+            # p divides the candidate - 1
+            i = ((1 - start) * pow(2, p - 2, p)) % p
+            candidates[i::p] = bytes(len(range(i, window, p)))
+
+    return [start + 2 * i for i, candidate in enumerate(candidates) if candidate]
+
+def find_prime(start, e = None, rounds = MILLER_RABIN_ROUNDS):
+    """
+    The first prime p >= start (with gcd(e, p - 1) = 1 if e is given)
+    """
+    if start <= 3:
+        return next(p for p in small_primes(2048) if p >= start and (e is None or gcd(e, p - 1) == 1))
+    start |= 1
+    while True:
+        candidates = sieve_window(start, e=e)
+        if e is not None:
+            candidates = [p for p in candidates if gcd(e, p - 1) == 1]
+        # one round first so that most composites are rejected early, then the remaining rounds
+        for p in candidates:
+            if miller_rabin(p, 1) and miller_rabin(p, rounds - 1):
+                return p
+        start += 2 * SIEVE_WINDOW
+
+def random_prime(nbits, e = None):
+    """
+    A random nbits prime with its two most significant bits set
+    (so that the product of two of them has 2*nbits bits)
+    """
+    while True:
+        start = get_random_int((nbits + 7) // 8) >> ((8 - nbits % 8) % 8)
+        p = find_prime(start | 3 << (nbits - 2), e)
+        if p.bit_length() == nbits:
+            return p
+
+def strong_prime(nbits, e):
+    """
+    RSAStrongPrime (see external_source_test/strong_primes_rng.py)
+
+    nbits long strong prime p such that:
+        p=2*a1*p1+1
+        p1=2*a2*p2+1
+    with a1 small enough that its factors are known, so that the exponent
+    e has large multiplicative order modulo phi(n), and with p+1 having
+    a large prime factor.
+
+    returns (p, p1, a1)
+    """
+    nbytes = nbits // 8
+    p = get_random_int(nbytes)
+    while p < 2**(nbits - 1):
+        p = 2 * p
+
+    p2 = find_prime(get_random_int(nbytes // 2))
+
+    nbytesa1 = min(nbytes // 4, 10)
+    a1 = get_random_int(nbytesa1)
+    p1 = p // (2 * a1)
+    a2 = (p1 - 1) // (2 * p2)
+    p1 = 2 * a2 * p2 + 1
+    while not is_probable_prime(p1):
+        a2 = a2 + 1
+        p1 = 2 * a2 * p2 + 1
+
+    a1 = (p - 1) // (2 * p1)
+    while True:
+        a1 = a1 - 1
+        if gcd(e, 2 * a1) != 1:
+            continue
+        p = 2 * a1 * p1 + 1
+        if not is_probable_prime(p):
+            continue
+        phi = p - 1
+        phiphi = int(totient(2 * a1)) * (p1 - 1)
+        if pow(e, phiphi // p2, phi) == 1:
+            continue
+        # remove the prime factors of p+1 less than 2^20
+        pplus1 = p + 1
+        for pp in small_primes(1 << 20):
+            while pplus1 % pp == 0:
+                pplus1 = pplus1 // pp
+        if pplus1 > pow(2, nbits // 2):
+            return (p, p1, a1)
+
+def rsa_prime(nbits, e, strong = False):
+    if strong:
+        return strong_prime(nbits, e)[0]
+    return random_prime(nbits, e)
+
+def rsa_parameters(p, q, nbits):
+    """
+    (n, lam, x0, p, q) from two primes
+    """
+    n = p * q
+    lam = (p - 1) * (q - 1) // gcd(p - 1, q - 1)
+    x0 = get_random_int(nbits // 8 - 1)
+    return (n, lam, x0, p, q)
+
+def generate_rsa_parameters(nbits, e, strong = False):
+    """
+    Build a parameter set in the calling process
+    """
+    nbitsprime = nbits // 2
+    p = rsa_prime(nbitsprime, e, strong)
+    q = rsa_prime(nbitsprime, e, strong)
+    while q == p:
+        q = rsa_prime(nbitsprime, e, strong)
+    return rsa_parameters(p, q, nbits)
+
+class PendingParameters:
+    """
+    A parameter set whose primes are being generated in the process pool
+    """
+    def __init__(self, executor, nbits, e, strong):
+        self.nbits = nbits
+        self.primes = [
+            executor.submit(rsa_prime, nbits // 2, e, strong)
+            for _ in range(2)
+        ]
+
+    def done(self):
+        return all(f.done() for f in self.primes)
+
+    def result(self, timeout = None):
+        p, q = (f.result(timeout) for f in self.primes)
+        if p == q:
+            raise ValueError('Generated identical primes')
+        return rsa_parameters(p, q, self.nbits)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                PRIME_WORKERS,
+                initializer=os.nice,
+                initargs=(PRIME_WORKERS_NICENESS,)
+            )
+        return _executor
+
+def build_rsa_parameters(nbits, e, strong = False, executor = None):
+    """
+    Start building a parameter set (n, lam, x0, p, q) in the background
+    """
+    return PendingParameters(executor or get_executor(), nbits, e, strong)
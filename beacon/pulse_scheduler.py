@@ -1,16 +1,31 @@
 import traceback
 import time
 import signal
+import asyncio
 from sched import scheduler
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from randomness_sources import RandomnessSources
+from external_sources import ExternalSources
 from beacon_shared.types import ByteHash
-from beacon_shared.status_codes import STATUS_GAP
+from beacon_shared.status_codes import STATUS_GAP, STATUS_SOURCE_MISSING
 from beacon_shared.hashing import hash_many
-from beacon_shared.pulse import assemble_pulse, sign_pulse, set_pulse_status, pulse_to_json
+from beacon_shared.pulse import assemble_pulse, prepare_pulse_digest, sign_pulse_digest, set_pulse_status, pulse_to_json
 from beacon_shared.store import BeaconStore
+from beacon_shared.config import BEACON_VERSION, HIGH_RATE_PERIOD, STATUS_INTERVAL
+from beacon_shared.metrics import METRICS
+from beacon_shared.tracing import TRACER
 from exceptions import BeaconException, LatePulseException
 from signer import Signer
+from clock import SystemClock
+from anticipation import AdaptiveAnticipation
+from release_timer import ReleaseTimer
+from write_behind import WriteBehind
+from checkpoint import get_checkpoint_sealer, BEACON_SEAL_KEY
+
+# share of the pulse generation budget (see current_pulse_generation_time)
+# the randomness sources have to provide their values. The rest is left for signing.
+RANDOMNESS_SOURCES_TIME_FRACTION = 0.5
 
 class ProgramKilled(Exception):
     pass
@@ -30,8 +45,25 @@ class PulseScheduler:
     delay - The delay for emission after the pulse timestamp (corresponds to $\delta$)
     max_local_skew_ahead - The max allowed local clock skew ahead of UTC (corresponds to $\sigma^+$)
     max_local_skew_behind - The max allowed local clock skew behind UTC (corresponds to $\sigma^-$)
+    signer - Optional signer to use (eg: a SigningClient). Defaults to a local Signer
+    clock - Optional clock (see clock.py). Defaults to the system clock
+    store, randomness_sources, external_sources - Optional, to share them between
+        several schedulers (see multi_chain.py)
+    name - Optional name of the chain profile, shown in the logs
+    uri_path - Path of the pulse uris
+    quiet - Only log a summary every STATUS_INTERVAL instead of every pulse.
+        Defaults to True for high rate chains (period <= HIGH_RATE_PERIOD)
+    adaptive_anticipation - Optional quantile (eg: 0.99) of the generation durations
+        to adapt the anticipation to (see anticipation.py)
+    write_behind - Optional WriteBehind persisting the released pulses off the
+        release path (see write_behind.py). Without it start() persists each pulse
+        before the next one; run_async() always uses one (its own by default)
+    seal_key - Optional key (hex) of the checkpoints. Defaults to BEACON_SEAL_KEY,
+        without one a restart starts a new chain (see checkpoint.py)
     """
-    def __init__(self, period, anticipation, delay, max_local_skew_behind, max_local_skew_ahead, use_hsm = True):
+    def __init__(self, period, anticipation, delay, max_local_skew_behind, max_local_skew_ahead, use_hsm = True, signer = None, clock = None,
+                 store = None, randomness_sources = None, external_sources = None, name = None, uri_path = '/api', quiet = None,
+                 adaptive_anticipation = None, write_behind = None, seal_key = BEACON_SEAL_KEY):
 
         for arg in [period, anticipation, delay, max_local_skew_ahead, max_local_skew_behind]:
             if not isinstance(arg, timedelta):
@@ -62,11 +94,34 @@ class PulseScheduler:
         self.delay = delay
         self.max_local_skew_ahead = max_local_skew_ahead
         self.max_local_skew_behind = max_local_skew_behind
-
-        self.randomness_sources = RandomnessSources(use_hsm)
-        self.signer = Signer(use_hsm)
-
-        self.store = BeaconStore()
+        self.clock = SystemClock() if clock is None else clock
+        self.release_timer = ReleaseTimer(self.clock)
+        self.write_behind = write_behind
+        self.name = name
+        self.uri_path = uri_path
+        self.quiet = period <= HIGH_RATE_PERIOD if quiet is None else quiet
+        # last pulse logged by a quiet scheduler
+        self.logged_pulse = None
+        self.adaptive_anticipation = None
+        if adaptive_anticipation is not None:
+            self.adaptive_anticipation = AdaptiveAnticipation(
+                adaptive_anticipation,
+                anticipation,
+                delay,
+                max_local_skew_ahead,
+                name = 'anticipation' if name is None else 'anticipation_' + name
+            )
+
+        self.randomness_sources = RandomnessSources(use_hsm, period=period.total_seconds()) if randomness_sources is None else randomness_sources
+        self.external_sources = ExternalSources() if external_sources is None else external_sources
+        self.signer = Signer(use_hsm) if signer is None else signer
+        # None if the chain can't be resumed after a restart
+        self.checkpoint_sealer = get_checkpoint_sealer(seal_key)
+        # signs the late variant of each pulse alongside the on-time one
+        self.signing_pool = ThreadPoolExecutor(max_workers=1)
+        self.late_variant = None
+
+        self.store = BeaconStore() if store is None else store
         self.store.initDB()
         # TODO: this should be changed
         self.store.addCertificate(
@@ -75,7 +130,7 @@ class PulseScheduler:
         )
 
     def now(self):
-        return datetime.now()
+        return self.clock.now()
 
     @property
     def max_pulse_generation_time(self):
@@ -84,6 +139,15 @@ class PulseScheduler:
         """
         return self.delay + self.anticipation - self.max_local_skew_ahead
 
+    @property
+    def current_pulse_generation_time(self):
+        """
+        $\gamma$ with the current anticipation: the time the generation of the next
+        pulse has before its release. Smaller than max_pulse_generation_time
+        when the anticipation adapted down
+        """
+        return max(self.delay + self.current_anticipation - self.max_local_skew_ahead, timedelta(0))
+
     def get_tuning_slack(self, pulse_generation_time = None):
         """
         calculation of tuning slack $\eta$ based on Appendix A.1
@@ -109,82 +173,280 @@ class PulseScheduler:
             delta_prime + self.max_local_skew_ahead
         )
 
+    @property
+    def randomness_sources_timeout(self):
+        return self.current_pulse_generation_time * RANDOMNESS_SOURCES_TIME_FRACTION
+
     def get_local_random_value(self):
-        values = self.randomness_sources.fetch()
-        return ByteHash(hash_many(values))
+        """
+        Returns the local random value and whether any source was missing
+        """
+        with TRACER.span('source_fetch'):
+            values, missing = self.randomness_sources.fetch(self.randomness_sources_timeout.total_seconds())
+        return ByteHash(hash_many(values)), len(missing) > 0
 
     def recall_state(self):
         self.chain_index = 0
         self.previous_pulse = None
         self.local_random_value = None
+        self.local_random_value_degraded = False
 
         self.previous_pulse = self.store.fetchLatestPulse()
 
         # print('last pulse', pulse_to_json(self.previous_pulse, sort_keys=True, indent=4))
 
         if self.previous_pulse == None:
+            # first pulse ever: there is no precommitted value to use
+            self.local_random_value, self.local_random_value_degraded = self.get_local_random_value()
             return
 
-        self.chain_index = self.previous_pulse["chainIndex"].get()
+        self.chain_index = self.previous_pulse.chainIndex
+        if self.previous_pulse.version != BEACON_VERSION:
+            # a chain only has pulses of one signed layout
+            print('The latest pulse is of version {}'.format(self.previous_pulse.version), flush=True)
+        elif self.resume_chain():
+            return
 
         if self.local_random_value == None:
-            # TODO: need better handling of picking up where we left off
-            self.local_random_value = self.get_local_random_value()
+            # the value the previous pulse committed to is lost: start a new chain
+            self.local_random_value, self.local_random_value_degraded = self.get_local_random_value()
             self.chain_index += 1
             self.previous_pulse = None
             print('new chain')
 
+    def resume_chain(self):
+        """
+        Go on with the chain of the previous pulse, with the local random value
+        of its checkpoint, if the next pulse isn't overdue yet (see checkpoint.py)
+        """
+        pulse = self.previous_pulse
+        checkpoint = self.store.fetchCheckpoint()
+        if self.checkpoint_sealer is None or checkpoint is None:
+            return False
+        if tuple(checkpoint[:2]) != (pulse.chainIndex, pulse.pulseIndex):
+            print('No checkpoint of pulse {} of chain {}'.format(pulse.pulseIndex, pulse.chainIndex), flush=True)
+            return False
+        if self.now() >= pulse.timeStamp + self.period:
+            print('The next pulse of chain {} is overdue'.format(pulse.chainIndex), flush=True)
+            return False
+        unsealed = self.checkpoint_sealer.unseal(self.store.table, pulse, checkpoint[2])
+        if unsealed is None:
+            print('The checkpoint could not be unsealed (was the seal key changed?)', flush=True)
+            return False
+        self.local_random_value, self.local_random_value_degraded = unsealed
+        METRICS.counter('chain_resumed').inc()
+        print('Resuming chain {} after pulse {}'.format(pulse.chainIndex, pulse.pulseIndex), flush=True)
+        return True
+
+    def seal_checkpoint(self, pulse):
+        """
+        Checkpoint of the local random value the released pulse committed to
+        """
+        if self.checkpoint_sealer is None:
+            return None
+        return self.checkpoint_sealer.seal(self.store.table, pulse, self.local_random_value, self.local_random_value_degraded)
+
     def generate_pulse(self, next_local_random_value):
-        self.current_pulse = assemble_pulse(
-            chain_index = self.chain_index,
-            local_random_value = self.local_random_value,
-            next_local_random_value = next_local_random_value,
-            previous_pulse = self.previous_pulse
-        )
+        with TRACER.span('assemble'):
+            self.current_pulse = assemble_pulse(
+                chain_index = self.chain_index,
+                local_random_value = self.local_random_value,
+                next_local_random_value = next_local_random_value,
+                previous_pulse = self.previous_pulse,
+                period = self.period,
+                now = self.now(),
+                path = self.uri_path,
+                # only the prefetched values, so that no network round trip is added here
+                external = self.external_sources.collect()
+            )
         # first pulse... so modify the timestamp to give enough time to calculate
-        if self.current_pulse['pulseIndex'].get() == 0:
-            self.current_pulse['timeStamp'].set(self.current_pulse['timeStamp'].get() + self.anticipation)
+        if self.current_pulse.pulseIndex == 0:
+            self.current_pulse.timeStamp += self.anticipation
+        # the local random value was gathered without every source
+        if self.local_random_value_degraded:
+            set_pulse_status(self.current_pulse, STATUS_SOURCE_MISSING)
 
-    def emit_pulse(self):
-        self.store.addPulse(self.current_pulse)
-        print("Releasing pulse", pulse_to_json(self.current_pulse, sort_keys=True, indent=4))
-        self.previous_pulse = self.current_pulse
-        self.current_pulse = None
+    def sign_pulse_variants(self):
+        """
+        Sign the current pulse and, on a worker thread, its late (STATUS_GAP)
+        variant. Releasing a late pulse then only needs to pick the late variant.
+        Both variants share the digest of the fields before the status code.
+        The on-time variant is signed first so that the late one never holds
+        the signer (HSM lock, signing service queue) ahead of it.
+        """
+        pulse = self.current_pulse
+        digest = prepare_pulse_digest(self.signer, pulse)
+
+        late_pulse = pulse.copy()
+        set_pulse_status(late_pulse, STATUS_GAP)
+        late_digest = digest.with_status(late_pulse.statusCode)
+
+        try:
+            # the on-time variant is useless after its release time
+            deadline = pulse.timeStamp + self.delay
+            self.current_pulse = sign_pulse_digest(self.signer, pulse, digest, deadline)
+        finally:
+            # also needed when the on-time variant couldn't be signed in time
+            self.late_variant = self.signing_pool.submit(self.sign_late_variant, late_pulse, late_digest)
+
+    def sign_late_variant(self, pulse, digest):
+        started_at = time.perf_counter()
+        # ... and the late variant once the next pulse is due
+        deadline = pulse.timeStamp + self.period
+        sign_pulse_digest(self.signer, pulse, digest, deadline)
+        return pulse, time.perf_counter() - started_at
+
+    def use_on_time_variant(self):
+        METRICS.counter('pulse_on_time_variant_used').inc()
+        self.late_variant = None
+
+    def use_late_variant(self):
+        """
+        Swap the current pulse for its pre-signed late variant
+        """
+        waited_from = time.perf_counter()
+        pulse, signing_duration = self.late_variant.result()
+        waited = time.perf_counter() - waited_from
+        self.current_pulse = pulse
+        self.late_variant = None
+
+        METRICS.counter('pulse_late_variant_used').inc()
+        # signing time that would otherwise have been spent after the pulse was already late
+        METRICS.histogram('pulse_late_variant_time_saved').observe(max(signing_duration - waited, 0))
+
+    def emit_pulse(self, released_at = None):
+        """
+        Release the current pulse then persist and log it, or hand it to the write-behind stage
+        """
+        pulse, release, checkpoint = self.release_pulse(released_at)
+        item = (self, pulse, self.pulse_generation_started_at, self.pulse_generation_duration, release, checkpoint)
+        if self.write_behind is None:
+            self.persist_pulse(self.store, *item[1:])
+        else:
+            self.write_behind.put(item)
+
+    def record_release(self, pulse, released_at = None):
+        """
+        Record the release error (time from the ideal release at timeStamp + delay).
+        released_at defaults to now. Returns (released_at, error in seconds)
+        """
+        if released_at is None:
+            released_at = self.now()
+        error = (released_at - (pulse.timeStamp + self.delay)).total_seconds()
+        METRICS.histogram('pulse_release_jitter').observe(abs(error))
+        METRICS.histogram('pulse_release_late' if error > 0 else 'pulse_release_early').observe(abs(error))
+        return released_at, error
+
+    def log_release(self, pulse, generation_started_at, generation_duration):
+        """
+        Print the released pulse and the status (only every STATUS_INTERVAL if quiet)
+        """
+        if not self.quiet:
+            print("Released pulse", pulse_to_json(pulse, sort_keys=True, indent=4))
+            self.print_status(pulse, generation_started_at, generation_duration)
+            return
+
+        logged = self.logged_pulse
+        if logged is not None and logged.chainIndex == pulse.chainIndex and pulse.timeStamp - logged.timeStamp < STATUS_INTERVAL:
+            return
+        self.logged_pulse = pulse
+        print("Released pulse {} of chain {}".format(pulse.pulseIndex, pulse.chainIndex))
+        self.print_status(pulse, generation_started_at, generation_duration)
+
+    def log_generation(self):
+        if not self.quiet:
+            print('Generating next pulse of {}chain {}'.format(
+                '' if self.name is None else self.name + ' ',
+                self.chain_index
+            ), flush=True)
+
+    def print_status(self, pulse, generation_started_at, generation_duration):
+        idealCalculationTime = pulse.timeStamp - self.anticipation
+        calculationStartDelay = generation_started_at - idealCalculationTime
+        eta = self.get_tuning_slack(generation_duration)
+        etaMax = self.get_tuning_slack()
+        alpha = self.get_time_accuracy(generation_duration)
+        alphaMax = self.get_time_accuracy()
+        print("STATUS{}\n--------".format('' if self.name is None else ' ' + self.name))
+        print("calculation started at: {} (dt from ideal: {}s)".format(
+            generation_started_at,
+            calculationStartDelay.total_seconds()
+        ))
+        print("generation duration: {}s\ntuning slack: {}s ({}s maximum)\ntime accuracy: {}s ({}s maximum)".format(
+            generation_duration.total_seconds(),
+            eta.total_seconds(),
+            etaMax.total_seconds(),
+            alpha.total_seconds(),
+            alphaMax.total_seconds()
+        ), flush=True)
+        if self.adaptive_anticipation is not None:
+            print("anticipation: {}s ({}s maximum)".format(
+                self.current_anticipation.total_seconds(),
+                self.anticipation.total_seconds()
+            ), flush=True)
+        print("late variants used: {} ({}s signing saved)".format(
+            METRICS.counter('pulse_late_variant_used').value,
+            METRICS.histogram('pulse_late_variant_time_saved').sum
+        ), flush=True)
+        release_jitter = METRICS.histogram('pulse_release_jitter')
+        print("release jitter: p50 {}s, p99 {}s, max {}s".format(
+            release_jitter.quantile(0.5),
+            release_jitter.quantile(0.99),
+            release_jitter.max
+        ), flush=True)
+        early, late = METRICS.histogram('pulse_release_early'), METRICS.histogram('pulse_release_late')
+        print("release error: {} early (max {}s), {} late (max {}s)".format(
+            early.count, early.max or 0, late.count, late.max or 0
+        ), flush=True)
+        print("randomness sources: {}".format(self.randomness_sources.get_stats()), flush=True)
+        print("external sources: {}".format(self.external_sources.get_stats()), flush=True)
+
+    @property
+    def current_anticipation(self):
+        """
+        The anticipation used for the next pulse (see adaptive_anticipation)
+        """
+        if self.adaptive_anticipation is None:
+            return self.anticipation
+        return self.adaptive_anticipation.value
+
+    def observe_generation(self, generation_duration, late):
+        if self.adaptive_anticipation is not None:
+            self.adaptive_anticipation.observe(generation_duration, late)
 
     def get_next_pulse_generation_delay(self):
         if self.previous_pulse == None:
             return timedelta(seconds=0)
 
-        next_pulse_time = self.previous_pulse["timeStamp"].get() + self.period
-        return next_pulse_time - self.anticipation - self.now()
+        next_pulse_time = self.previous_pulse.timeStamp + self.period
+        return next_pulse_time - self.current_anticipation - self.now()
 
     def get_pulse_release_delay(self, pulse):
-        return pulse["timeStamp"].get() + self.delay - self.now()
+        return pulse.timeStamp + self.delay - self.now()
 
     def start(self):
         self.chain_index = 0
         self.previous_pulse = None
         self.current_pulse = None
         self.local_random_value = None
+        if self.write_behind is not None:
+            # replays the journal first
+            self.write_behind.start()
+        self.randomness_sources.wait_ready()
         self.recall_state()
+        self.external_sources.start()
 
         self.next_local_random_value = None
-
-        def finalize():
-            self.current_pulse = sign_pulse(self.signer, self.current_pulse)
+        self.next_local_random_value_degraded = False
 
         def generate():
             self.pulse_generation_started_at = self.now()
             started_at = time.perf_counter()
-            self.next_local_random_value = self.get_local_random_value()
+            self.next_local_random_value, self.next_local_random_value_degraded = self.get_local_random_value()
             self.generate_pulse(self.next_local_random_value)
-            finalize()
+            self.sign_pulse_variants()
             self.pulse_generation_duration = timedelta(seconds=(time.perf_counter() - started_at))
 
-        def release():
-            self.emit_pulse()
-            self.local_random_value = self.next_local_random_value
-
         def exit_handler():
             raise ProgramKilled
 
@@ -195,52 +457,33 @@ class PulseScheduler:
         # so we use the perf_counter which doesn't keep track of ntp updates
         # since this only is used to track sleep time and time.time is used schedule pulses it works.
         # TODO: but i think we need to figure out a way to close that hole if someone modifies the system clock.
-        s = scheduler(time.perf_counter, time.sleep)
+        s = scheduler(self.clock.monotonic, self.clock.sleep)
 
         while True:
             try:
-                print('Generating next pulse of chain {}'.format(self.chain_index), flush=True)
+                self.log_generation()
                 # Wait then generate the next pulse
                 wait_for = self.get_next_pulse_generation_delay().total_seconds()
                 s.enter(wait_for, 0, generate)
                 s.run(blocking = True)
 
                 # testing late pulse behaviour
-                # if int.from_bytes(pulse['localRandomValue'].get(), byteorder="big") % 5 == 0:
+                # if int.from_bytes(pulse.localRandomValue, byteorder="big") % 5 == 0:
                 #     time.sleep(3)
 
                 # wait then release the generated pulse
                 pulse = self.current_pulse
                 wait_for = self.get_pulse_release_delay(pulse).total_seconds()
+                self.observe_generation(self.pulse_generation_duration, wait_for < 0)
                 if wait_for < 0:
-                    # if it's late, then set the status flag and resign
-                    set_pulse_status(pulse, STATUS_GAP)
-                    finalize()
-                    release()
-                    print('Warning: pulse {} was late'.format(pulse["pulseIndex"].get()), flush=True)
+                    # if it's late, release the pre-signed variant with the status flag set
+                    self.use_late_variant()
+                    pulse = self.current_pulse
+                    self.emit_pulse()
+                    print('Warning: pulse {} was late'.format(pulse.pulseIndex), flush=True)
                 else:
-                    s.enter(wait_for, 0, release)
-                    s.run(blocking = True)
-
-                # record the status
-                idealCalculationTime = pulse['timeStamp'].get() - self.anticipation
-                calculationStartDelay = self.pulse_generation_started_at - idealCalculationTime
-                eta = self.get_tuning_slack(self.pulse_generation_duration)
-                etaMax = self.get_tuning_slack()
-                alpha = self.get_time_accuracy(self.pulse_generation_duration)
-                alphaMax = self.get_time_accuracy()
-                print("STATUS\n--------")
-                print("calculation started at: {} (dt from ideal: {}s)".format(
-                    self.pulse_generation_started_at,
-                    calculationStartDelay.total_seconds()
-                ))
-                print("generation duration: {}s\ntuning slack: {}s ({}s maximum)\ntime accuracy: {}s ({}s maximum)".format(
-                    self.pulse_generation_duration.total_seconds(),
-                    eta.total_seconds(),
-                    etaMax.total_seconds(),
-                    alpha.total_seconds(),
-                    alphaMax.total_seconds()
-                ), flush=True)
+                    self.use_on_time_variant()
+                    self.emit_pulse(self.release_timer.wait_until(pulse.timeStamp + self.delay))
 
             # TODO handle exceptions
             except BeaconException as e:
@@ -249,6 +492,10 @@ class PulseScheduler:
 
             except ProgramKilled as e:
                 clear_schedule_queue(s)
+                self.signing_pool.shutdown(wait=False)
+                self.external_sources.stop()
+                if self.write_behind is not None:
+                    self.write_behind.stop()
                 exit(0)
 
             except Exception as e:
@@ -256,3 +503,126 @@ class PulseScheduler:
                 traceback.print_exc()
                 clear_schedule_queue(s)
                 exit(1)
+
+    def start_async(self):
+        """
+        Run the asyncio scheduler until SIGTERM or SIGINT
+        """
+        asyncio.run(self.run_async())
+
+    def release_pulse(self, released_at = None):
+        """
+        Make the current pulse the previous one. Persisting it is left to the caller.
+        Returns the pulse, its release (see record_release) and its checkpoint
+        """
+        with TRACER.span('release'):
+            pulse = self.current_pulse
+            release = self.record_release(pulse, released_at)
+            self.previous_pulse = pulse
+            self.current_pulse = None
+            self.local_random_value = self.next_local_random_value
+            self.local_random_value_degraded = self.next_local_random_value_degraded
+            return pulse, release, self.seal_checkpoint(pulse)
+
+    def persist_pulse(self, store, pulse, generation_started_at, generation_duration, release = None, checkpoint = None, commit = True):
+        """
+        Persist the pulse and its checkpoint atomically, then log it
+        """
+        store.addPulse(pulse, False, release)
+        if checkpoint is not None:
+            store.saveCheckpoint(pulse.chainIndex, pulse.pulseIndex, checkpoint, False)
+        if commit:
+            store.dbConnection.commit()
+        self.log_release(pulse, generation_started_at, generation_duration)
+
+    async def run_async(self, write_behind = None):
+        """
+        Pipelined version of start(). Pulse N+1's randomness is gathered while
+        pulse N waits for its release, and released pulses are persisted and
+        logged by the write-behind stage so the release itself only swaps the state.
+        Assembly and signing still happen at the generation time since they
+        depend on the variant of the previous pulse that was released.
+
+        write_behind - WriteBehind shared with other schedulers, started and
+            stopped by the caller. By default the scheduler uses its own
+            (see the write_behind argument) and handles SIGTERM and SIGINT.
+        """
+        loop = asyncio.get_event_loop()
+        standalone = write_behind is None
+        if standalone:
+            main_task = asyncio.current_task()
+            loop.add_signal_handler(signal.SIGTERM, main_task.cancel)
+            loop.add_signal_handler(signal.SIGINT, main_task.cancel)
+            write_behind = WriteBehind(self.store.db_path, None) if self.write_behind is None else self.write_behind
+            # replays the journal first
+            await loop.run_in_executor(None, write_behind.start)
+
+        self.chain_index = 0
+        self.previous_pulse = None
+        self.current_pulse = None
+        self.local_random_value = None
+        await loop.run_in_executor(None, self.randomness_sources.wait_ready)
+        self.recall_state()
+        self.external_sources.start()
+
+        self.next_local_random_value = None
+        self.next_local_random_value_degraded = False
+        randomness = None
+
+        try:
+            while True:
+                try:
+                    self.log_generation()
+                    wait_for = self.get_next_pulse_generation_delay().total_seconds()
+                    await self.clock.sleep_async(max(wait_for, 0))
+
+                    generation_started_at = self.now()
+                    started_at = time.perf_counter()
+                    if randomness is None:
+                        randomness = loop.run_in_executor(None, self.get_local_random_value)
+                    pending, randomness = randomness, None
+                    self.next_local_random_value, self.next_local_random_value_degraded = await pending
+                    self.generate_pulse(self.next_local_random_value)
+                    await loop.run_in_executor(None, self.sign_pulse_variants)
+                    generation_duration = timedelta(seconds=(time.perf_counter() - started_at))
+
+                    # gather the next pulse's randomness while this one waits
+                    randomness = loop.run_in_executor(None, self.get_local_random_value)
+
+                    pulse = self.current_pulse
+                    wait_for = self.get_pulse_release_delay(pulse).total_seconds()
+                    self.observe_generation(generation_duration, wait_for < 0)
+                    released_at = None
+                    if wait_for < 0:
+                        await asyncio.wrap_future(self.late_variant)
+                        self.use_late_variant()
+                        print('Warning: pulse {} was late'.format(self.current_pulse.pulseIndex), flush=True)
+                    else:
+                        self.use_on_time_variant()
+                        released_at = await self.release_timer.wait_until_async(pulse.timeStamp + self.delay)
+
+                    pulse, release, checkpoint = self.release_pulse(released_at)
+                    item = (self, pulse, generation_started_at, generation_duration, release, checkpoint)
+                    # journal (fsync) and backpressure off the event loop
+                    await loop.run_in_executor(None, write_behind.put, item)
+
+                # TODO handle exceptions
+                except BeaconException as e:
+                    print('ERROR:', e)
+                    traceback.print_exc()
+
+        except asyncio.CancelledError:
+            # SIGTERM or SIGINT: let the released pulses be written
+            if standalone:
+                await loop.run_in_executor(None, write_behind.stop)
+
+        except Exception as e:
+            print('UNRECOVERABLE ERROR:', e)
+            traceback.print_exc()
+            exit(1)
+
+        finally:
+            if randomness is not None:
+                randomness.cancel()
+            self.signing_pool.shutdown(wait=False)
+            self.external_sources.stop()
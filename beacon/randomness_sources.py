@@ -1,17 +1,93 @@
+import os
+import math
+import time
+import threading
 from random import getrandbits
+from concurrent.futures import ThreadPoolExecutor, wait
+from beacon_shared.metrics import METRICS
+from beacon_shared.tracing import TRACER
 from beacon_shared.types import ByteHash
 from simple_rsa_rng import SimpleRSARNG
+from rng_buffer import BufferedRNG, steady_max_age
 from yubihsm import YubiHsm
+from exceptions import BeaconException
 
 def to_byte_hash(n):
     if type(n) is not bytes:
         n = n.to_bytes(512, byteorder='big', signed=False)
     return ByteHash(n)
 
+# number of RSA RNG outputs precomputed ahead of the schedule
+RSA_RNG_BUFFER_DEPTH = 3
+# at short periods the buffer holds at least this long (seconds) of outputs, so
+# that a burst of slow outputs (CPU contention) doesn't drain it
+RSA_RNG_BUFFER_SECONDS = 1
+# precomputed outputs older than this (seconds) are never used. Raised to what
+# the fetch period needs (see steady_max_age)
+RSA_RNG_MAX_AGE = 60
+# seconds wait_ready waits for the RSA RNG buffer to fill
+RSA_RNG_FILL_TIMEOUT = 10
+# new RSA RNG parameters (p, q, x0) are swapped in this often (seconds)
+RSA_RNG_ROTATE_PERIOD = 60
+# use the strong prime construction for the RSA RNG
+RSA_RNG_STRONG_PRIMES = int(os.getenv('RSA_STRONG_PRIMES', 0)) == 1
+
+class RandomnessSource:
+    """
+    A named source of randomness. Each source runs on its own worker
+    thread so that a slow source can not hold up the others.
+    """
+    def __init__(self, name, fetch):
+        self.name = name
+        self.fetch = fetch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='source-' + name)
+        self.pending = None
+        self.duration = METRICS.histogram('randomness_source_{}_duration'.format(name))
+        self.missed = METRICS.counter('randomness_source_{}_missed'.format(name))
+        self.span_name = 'source_' + name
+
+    def run(self):
+        started_at = time.perf_counter()
+        try:
+            with TRACER.span(self.span_name):
+                return self.fetch()
+        finally:
+            self.duration.observe(time.perf_counter() - started_at)
+
+    def submit(self):
+        """
+        Start fetching a value. Returns the fetch still running if there is
+        one (eg: a hung connection, or started for another scheduler) rather
+        than queueing behind it.
+        """
+        if self.pending is None or self.pending.done():
+            self.pending = self.executor.submit(self.run)
+        return self.pending
+
 class RandomnessSources:
-    def __init__(self, use_hsm = True):
-        self.simpleRSA = SimpleRSARNG(2048, 3)
+    """
+    Gathers the randomness sources concurrently. A source that fails
+    or misses the deadline is left out of the local random value and
+    reported as missing.
+    period - the longest time (seconds) between two fetches, eg: the pulse period
+    """
+    def __init__(self, use_hsm = True, sources = None, period = None):
+        self.simpleRSA = None
         self.hsm_session = None
+        # fetches can come from several schedulers (see multi_chain.py)
+        self.lock = threading.Lock()
+        if sources is not None:
+            self.sources = [RandomnessSource(name, fetch) for name, fetch in sources]
+            return
+
+        depth = RSA_RNG_BUFFER_DEPTH if period is None else max(RSA_RNG_BUFFER_DEPTH, math.ceil(RSA_RNG_BUFFER_SECONDS / period))
+        self.simpleRSA = BufferedRNG(
+            SimpleRSARNG(2048, 3, strong_primes=RSA_RNG_STRONG_PRIMES, rotate_period=RSA_RNG_ROTATE_PERIOD),
+            nbits=512,
+            depth=depth,
+            max_age=RSA_RNG_MAX_AGE if period is None else steady_max_age(period, depth, RSA_RNG_MAX_AGE),
+            name='rsa_rng_buffer'
+        )
 
         if use_hsm:
             # using the default port
@@ -22,16 +98,60 @@ class RandomnessSources:
             # Create an authenticated session with the HSM
             self.hsm_session = hsm.create_session_derived(1, 'password')
 
-    def fetch(self):
+        # the order here is the order the values are hashed in
+        self.sources = [
+            RandomnessSource('system', lambda: getrandbits(512)),
+            RandomnessSource('rsa', self.simpleRSA.get_rng)
+        ]
+        if self.hsm_session:
+            self.sources.append(RandomnessSource('hsm', lambda: self.hsm_session.get_pseudo_random(512)))
+
+    def wait_ready(self, timeout = RSA_RNG_FILL_TIMEOUT):
+        """
+        Wait for the RSA RNG buffer to fill, so that the first pulses after
+        a start don't miss the source while it computes its first outputs
+        """
+        if self.simpleRSA is not None:
+            self.simpleRSA.wait_filled(timeout)
+
+    def fetch(self, timeout = None):
+        """
+        Fetch a value from every source, waiting at most timeout (seconds).
+        Returns the values (ByteHash) of the sources that made it, in the
+        order of the sources, and the names of the sources that did not.
+        """
+        # only the submissions are serialized: each caller waits for the
+        # (possibly shared) fetches with its own timeout
+        with self.lock:
+            futures = [source.submit() for source in self.sources]
+        wait(futures, timeout=timeout)
+
         values = []
-        values.append( getrandbits(512) )
-        values.append( self.simpleRSA.get_rng() )
+        missing = []
+        for source, future in zip(self.sources, futures):
+            if not future.done() or future.exception() is not None:
+                if future.done():
+                    print('Randomness source {} failed: {}'.format(source.name, future.exception()), flush=True)
+                else:
+                    print('Randomness source {} missed the deadline'.format(source.name), flush=True)
+                source.missed.inc()
+                missing.append(source.name)
+                continue
+            values.append(to_byte_hash(future.result()))
 
-        if self.hsm_session:
-            values.append( self.hsm_session.get_pseudo_random(512) )
+        if not values:
+            raise BeaconException('No randomness source provided a value')
 
-        # convert to ByteHash
-        return map(
-            to_byte_hash,
-            values
-        )
+        return values, missing
+
+    def get_stats(self):
+        stats = {
+            source.name: {
+                "p50": source.duration.quantile(0.5),
+                "p99": source.duration.quantile(0.99),
+                "missed": source.missed.value
+            } for source in self.sources
+        }
+        if self.simpleRSA is not None:
+            stats['rsa_rng_buffer'] = self.simpleRSA.get_stats()
+        return stats
@@ -0,0 +1,64 @@
+"""
+High precision release timer.
+
+Release deadlines are UTC datetimes (timeStamp + delay) but sleeping on
+wall clock deltas is coarse and follows ntp steps. The timer maps the
+deadline onto the clock's monotonic time once, sleeps until
+RELEASE_TIMER_SPIN before it, then spins for the rest. The release
+instant is mapped back to UTC through the same anchor so its error
+against the deadline is measured on the monotonic timeline.
+"""
+from datetime import timedelta
+
+# time (seconds) spent spinning before a release instead of sleeping
+RELEASE_TIMER_SPIN = 0.0005
+# the asyncio (epoll) timeouts have a millisecond resolution
+RELEASE_TIMER_ASYNC_SPIN = 0.0015
+
+class ReleaseTimer:
+    """
+    clock - see clock.py
+    spin, async_spin - see RELEASE_TIMER_SPIN and RELEASE_TIMER_ASYNC_SPIN
+    """
+    def __init__(self, clock, spin = RELEASE_TIMER_SPIN, async_spin = RELEASE_TIMER_ASYNC_SPIN):
+        self.clock = clock
+        self.spin = spin
+        self.async_spin = async_spin
+        self.anchor()
+
+    def anchor(self):
+        """
+        Map the monotonic time to the current UTC time (eg: after an ntp update)
+        """
+        self.monotonic_anchor = self.clock.monotonic()
+        self.utc_anchor = self.clock.now()
+
+    def to_monotonic(self, dt):
+        return self.monotonic_anchor + (dt - self.utc_anchor).total_seconds()
+
+    def to_utc(self, t):
+        return self.utc_anchor + timedelta(seconds=t - self.monotonic_anchor)
+
+    def wait_until(self, deadline):
+        """
+        Wait until the deadline (datetime). Returns the release instant (datetime)
+        """
+        self.anchor()
+        target = self.to_monotonic(deadline)
+        coarse = target - self.clock.monotonic() - self.spin
+        if coarse > 0:
+            self.clock.sleep(coarse)
+        self.clock.spin_until(target)
+        return self.to_utc(self.clock.monotonic())
+
+    async def wait_until_async(self, deadline):
+        """
+        Same as wait_until() but the coarse sleep lets the other tasks run
+        """
+        self.anchor()
+        target = self.to_monotonic(deadline)
+        coarse = target - self.clock.monotonic() - self.async_spin
+        if coarse > 0:
+            await self.clock.sleep_async(coarse)
+        self.clock.spin_until(target)
+        return self.to_utc(self.clock.monotonic())
@@ -0,0 +1,120 @@
+"""
+Background precomputation of RNG outputs.
+
+A producer thread keeps a small bounded buffer of the next outputs of a
+generator (eg: SimpleRSARNG) so that the pulse generation only has to pop
+one. Outputs are produced in the same order as calling get_rng() directly.
+
+Read at a steady interval, a value is about depth + 1 intervals old when it
+is used (the buffered values and the one the producer is waiting to put), so
+max_age has to allow for it (see steady_max_age).
+"""
+import time
+import queue
+import threading
+from beacon_shared.metrics import METRICS
+
+# seconds between the checks of wait_filled
+FILL_POLL_INTERVAL = 0.01
+
+class BufferedRNG:
+    """
+    Arguments
+    ---------
+    rng - generator with a get_rng() method returning a non-negative int
+    nbits - number of bits of each output
+    depth - the maximum number of precomputed outputs
+    max_age - outputs older than this (seconds) are discarded instead of used
+    name - prefix of the exported metrics
+    """
+    def __init__(self, rng, nbits = 512, depth = 3, max_age = 60, name = 'rng_buffer'):
+        self.rng = rng
+        self.nbytes = nbits // 8
+        self.max_age = max_age
+        self.buffer = queue.Queue(maxsize=depth)
+        self.running = True
+
+        self.depth_gauge = METRICS.gauge(name + '_depth')
+        self.underruns = METRICS.counter(name + '_underruns')
+        self.stale = METRICS.counter(name + '_stale')
+
+        self.producer = threading.Thread(target=self.produce, name=name, daemon=True)
+        self.producer.start()
+
+    def produce(self):
+        while self.running:
+            value = self.rng.get_rng()
+            # kept as a mutable buffer so it can be zeroized once consumed
+            entry = (bytearray(value.to_bytes(self.nbytes, byteorder='big')), time.monotonic())
+            del value
+            while self.running:
+                try:
+                    self.buffer.put(entry, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                zeroize(entry[0])
+            self.depth_gauge.set(self.buffer.qsize())
+
+    def wait_filled(self, timeout = None):
+        """
+        Wait until the buffer is full, at most timeout seconds. Returns whether it is
+        """
+        started_at = time.monotonic()
+        while not self.buffer.full():
+            if timeout is not None and time.monotonic() - started_at >= timeout:
+                return False
+            time.sleep(FILL_POLL_INTERVAL)
+        return True
+
+    def pop(self, timeout = None):
+        """
+        Pop the next buffered value, waiting for the producer if the buffer is empty
+        """
+        try:
+            return self.buffer.get_nowait()
+        except queue.Empty:
+            self.underruns.inc()
+            return self.buffer.get(timeout=timeout)
+
+    def get_rng(self, timeout = None):
+        while True:
+            data, produced_at = self.pop(timeout)
+            self.depth_gauge.set(self.buffer.qsize())
+            if time.monotonic() - produced_at <= self.max_age:
+                break
+            # too old to be used
+            self.stale.inc()
+            zeroize(data)
+
+        value = int.from_bytes(data, byteorder='big')
+        zeroize(data)
+        return value
+
+    def get_stats(self):
+        return {
+            "depth": self.buffer.qsize(),
+            "underruns": self.underruns.value,
+            "stale": self.stale.value
+        }
+
+    def stop(self):
+        self.running = False
+        self.producer.join()
+        while True:
+            try:
+                data, _ = self.buffer.get_nowait()
+            except queue.Empty:
+                break
+            zeroize(data)
+
+def steady_max_age(interval, depth, minimum = 0):
+    """
+    A max_age (seconds) that keeps the values of a buffer read every interval
+    (seconds) usable, with one interval of slack for a late read
+    """
+    return max(minimum, (depth + 2) * interval)
+
+def zeroize(data):
+    data[:] = bytes(len(data))
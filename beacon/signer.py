@@ -1,7 +1,9 @@
+import struct
+import threading
 from datetime import datetime, timedelta
 
 from yubihsm import YubiHsm
-from yubihsm.defs import CAPABILITY, ALGORITHM
+from yubihsm.defs import CAPABILITY, ALGORITHM, COMMAND
 from yubihsm.objects import AsymmetricKey
 
 from cryptography.hazmat.backends import default_backend
@@ -14,13 +16,25 @@ from cryptography.x509.oid import NameOID
 
 from beacon_shared.serialization import concat_serialize
 from beacon_shared.types import ByteHash
-from beacon_shared.hashing import hash
+from beacon_shared.hashing import hash, hash_bytes
+from beacon_shared.config import CYPHER_SUITE
+from beacon_shared.cypher_suites import get_cypher_suite
+from beacon_shared.tracing import TRACER
+
+# HSM key algorithm, signing capability and key label for the cypher suites the YubiHSM supports
+HSM_CYPHER_SUITES = {
+    0: (ALGORITHM.RSA_2048, CAPABILITY.SIGN_PKCS, 'RSA pkcs1v15'),
+    2: (ALGORITHM.EC_P384, CAPABILITY.SIGN_ECDSA, 'ECDSA P-384')
+}
 
 # Utility class for signing, with or without HSM support
 class Signer:
-    def __init__(self, use_hsm = True):
+    def __init__(self, use_hsm = True, cypher_suite = CYPHER_SUITE):
         self.use_hsm = use_hsm
-        self.signing_hash_strategy = hashes.SHA512()
+        self.cypher_suite = get_cypher_suite(cypher_suite)
+        self.signing_hash_strategy = self.cypher_suite.hash_strategy
+        # the hsm session is not safe to use from several threads at once
+        self.hsm_lock = threading.Lock()
 
         self.generate_private_key()
         self.store_certificate()
@@ -32,13 +46,18 @@ class Signer:
 
 
     def generate_private_key(self):
-        self.private_key = rsa.generate_private_key(public_exponent=0x10001, key_size=2048, backend=default_backend())
+        self.private_key = self.cypher_suite.generate_private_key()
+
+    def get_cypher_suite_id(self):
+        return self.cypher_suite.id
 
     def get_public_key(self):
         return self.public_key
 
     def get_public_key_bytes(self):
-        return self.public_key.public_bytes(Encoding.PEM, PublicFormat.PKCS1)
+        if isinstance(self.public_key, rsa.RSAPublicKey):
+            return self.public_key.public_bytes(Encoding.PEM, PublicFormat.PKCS1)
+        return self.public_key.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
 
     def store_public_key(self):
         self.public_key = self.hsm_asym_key.get_public_key() if self.use_hsm else self.private_key.public_key()
@@ -91,7 +110,7 @@ class Signer:
         ).add_extension(
             x509.SubjectAlternativeName([x509.DNSName(u'localhost')]),
             critical=False,
-        ).sign(key, self.signing_hash_strategy, default_backend())
+        ).sign(key, self.cypher_suite.certificate_hash_strategy, default_backend())
 
         self.certificate = cert
         self.certificate_bytes = cert.public_bytes(serialization.Encoding.PEM)
@@ -100,6 +119,10 @@ class Signer:
     # TODO: make this better
     # ref: https://thekernel.com/wp-content/uploads/2018/11/YubiHSM2-EN.pdf
     def init_hsm(self):
+        if self.cypher_suite.id not in HSM_CYPHER_SUITES:
+            raise ValueError('Cypher suite {} is not supported with the HSM'.format(self.cypher_suite.id))
+        algorithm, sign_capability, key_label = HSM_CYPHER_SUITES[self.cypher_suite.id]
+
         # using the default port
         hsm_port = 12345
         # Return a YubiHsm connected to the backend specified by the URL
@@ -116,7 +139,7 @@ class Signer:
         objs = self.hsm_session.list_objects(object_id=2)
         if len(objs) > 0:
             key = objs[0]
-            if key.get_info().label == 'Beacon Generated RSA pkcs1v15':
+            if key.get_info().label == 'Beacon Generated ' + key_label:
                 self.hsm_asym_key_self = key
             else:
                 for key in objs:
@@ -125,7 +148,7 @@ class Signer:
         if not self.hsm_asym_key_self:
             self.hsm_asym_key_self = AsymmetricKey.put(
                 self.hsm_session, 2,
-                'Beacon Generated RSA pkcs1v15',
+                'Beacon Generated ' + key_label,
                 0xffff,
                 CAPABILITY.SIGN_ATTESTATION_CERTIFICATE,
                 self.private_key
@@ -140,7 +163,7 @@ class Signer:
         objs = self.hsm_session.list_objects(object_id=3)
         if len(objs) > 0:
             key = objs[0]
-            if key.get_info().label == 'HSM Generated RSA pkcs1v15':
+            if key.get_info().label == 'HSM Generated ' + key_label:
                 self.hsm_asym_key = objs[0]
             else:
                 for key in objs:
@@ -149,38 +172,53 @@ class Signer:
         if not self.hsm_asym_key:
             self.hsm_asym_key = AsymmetricKey.generate(
                 self.hsm_session, 3,
-                'HSM Generated RSA pkcs1v15',
+                'HSM Generated ' + key_label,
                 0xffff,
-                CAPABILITY.SIGN_PKCS,
-                ALGORITHM.RSA_2048
+                sign_capability,
+                algorithm
             )
 
         self.hsm_key_cert = self.hsm_asym_key.attest(2)
         self.hsm_key_cert_bytes = self.hsm_key_cert.public_bytes(serialization.Encoding.PEM)
         self.hsm_key_cert_id = hash(ByteHash(self.hsm_key_cert_bytes))
 
-    def sign_values_hsm(self, values):
-        # Line 579-583  The hashing is not repeated inside the illustrated Signing module
-        #
-        # however, the python yubihsm hashes locally, before sending the
-        # value to the HSM, so this is fine... and why we pass unhashed bytes
-        data = concat_serialize(values)
-        return self.hsm_asym_key.sign_pkcs1v1_5(
-            data,
-            self.signing_hash_strategy
-        )
+    # Line 579-583  The hashing is not repeated inside the illustrated Signing module
+    #
+    # the python yubihsm would hash locally before sending the value to
+    # the HSM, so we send the (locally computed) digest with the raw commands
+    def sign_digest_hsm(self, digest):
+        if self.cypher_suite.id == 0:
+            # same as AsymmetricKey.sign_pkcs1v1_5, but the data is already hashed
+            command = COMMAND.SIGN_PKCS1
+        else:
+            # same as AsymmetricKey.sign_ecdsa, but the data is already hashed
+            command = COMMAND.SIGN_ECDSA
+        msg = struct.pack('!H', self.hsm_asym_key.id) + digest
+        with self.hsm_lock:
+            return self.hsm_session.send_secure_cmd(command, msg)
 
     # NOT WITH HSM...
-    def sign_values_no_hsm(self, values):
-        data = concat_serialize(values)
-        return self.private_key.sign(
-            data,
-            padding.PKCS1v15(),
-            self.signing_hash_strategy
-        )
+    def sign_digest_no_hsm(self, digest):
+        return self.cypher_suite.sign_digest(self.private_key, digest)
 
-    def sign_values(self, values):
+    def sign_digest(self, digest, deadline = None):
+        """
+        Sign a digest of serialized data, computed with the signing hash
+        strategy (eg: from a PulseDigest).
+        The deadline is only used by the signing service client.
+        """
         if self.use_hsm:
-            return self.sign_values_hsm(values)
+            with TRACER.span('sign_hsm'):
+                return self.sign_digest_hsm(digest)
         else:
-            return self.sign_values_no_hsm(values)
+            with TRACER.span('sign_local'):
+                return self.sign_digest_no_hsm(digest)
+
+    def sign_data(self, data):
+        """
+        Sign already serialized data (bytes or a memoryview)
+        """
+        return self.sign_digest(hash_bytes(data, self.signing_hash_strategy))
+
+    def sign_values(self, values):
+        return self.sign_data(concat_serialize(values))
@@ -0,0 +1,344 @@
+"""
+Out of process signing.
+
+The SigningService wraps a Signer behind a bounded request queue with
+per caller rate limiting and deadlines. It can be served over ZMQ
+(ZMQSigningServer) so that signing runs in its own process or container,
+and is used by the scheduler through a SigningClient that has the same
+interface as the Signer.
+
+The LocalTransport is an in-process stand-in for the ZMQ transport
+(for tests and benchmarks).
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import traceback
+import zmq
+from beacon_shared.metrics import METRICS
+from beacon_shared.tracing import TRACER
+from exceptions import SigningException, SigningTimeoutException
+from clock import SystemClock
+
+# how many sign requests can wait for the signer
+SIGNING_QUEUE_SIZE = 16
+# sustained sign requests per second allowed for each caller
+SIGNING_RATE_LIMIT = 20
+SIGNING_RATE_BURST = 10
+# how long a client waits for a reply when there is no deadline (seconds)
+SIGNING_DEFAULT_TIMEOUT = 5
+
+class RateLimiter:
+    """
+    Token bucket per caller
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, caller):
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(caller, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[caller] = (tokens, now)
+            return allowed
+
+def json_bytes(message):
+    return json.dumps(message).encode('utf-8')
+
+def error_response(code, message):
+    return { "error": { "code": code, "message": message } }
+
+class SigningService:
+    """
+    Serves requests of the form { command: '<string>', caller: '<string>', data: {} }
+    and replies (through the provided callback) with { ok: True, data: {} }
+    or { error: { code, message } }.
+
+    Sign requests may carry a `budget`: the seconds left, when sent, until
+    the signature is useless. It is relative so that the clocks of the
+    client (eg: a VirtualClock) and of the service don't have to agree.
+    A request whose budget has run out (counted from its reception) by the
+    time it reaches the signer is rejected without being signed.
+    """
+    def __init__(self, signer, queue_size = SIGNING_QUEUE_SIZE, rate = SIGNING_RATE_LIMIT, burst = SIGNING_RATE_BURST):
+        self.signer = signer
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.rate_limiter = RateLimiter(rate, burst)
+        self.worker = None
+
+        self.sign_duration = METRICS.histogram('signing_service_sign_duration')
+        self.request_duration = METRICS.histogram('signing_service_request_duration')
+        self.queue_depth = METRICS.gauge('signing_service_queue_depth')
+
+    def start(self):
+        if self.worker:
+            raise Exception('Signing service already started')
+        self.worker = threading.Thread(target=self.run, name='signing-service', daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        if not self.worker:
+            return
+        self.requests.put(None)
+        self.worker.join()
+        self.worker = None
+
+    def reject(self, reason, reply):
+        METRICS.counter('signing_service_rejected_' + reason).inc()
+        reply(error_response(reason, 'Sign request rejected ({})'.format(reason)))
+
+    def submit(self, request, reply):
+        """
+        Handle a request. The reply callback may be called from the worker thread.
+        """
+        command = request.get('command')
+        try:
+            if command == 'get_certificate_id':
+                return reply({ "ok": True, "data": self.signer.get_certificate_id().hex() })
+            if command == 'get_certificate':
+                return reply({ "ok": True, "data": self.signer.get_certificate().hex() })
+            if command == 'get_cypher_suite_id':
+                return reply({ "ok": True, "data": self.signer.get_cypher_suite_id() })
+            if command == 'get_metrics':
+                return reply({ "ok": True, "data": METRICS.snapshot() })
+            if command != 'sign_digest':
+                return reply(error_response('bad_request', 'No handler defined for command "{}"'.format(command)))
+
+            data = request['data']
+            digest = bytes.fromhex(data['digest'])
+            budget = data.get('budget')
+        except Exception as e:
+            return reply(error_response('bad_request', str(e)))
+
+        if budget is not None and budget <= 0:
+            return self.reject('expired', reply)
+        deadline = None if budget is None else time.monotonic() + budget
+
+        if not self.rate_limiter.allow(request.get('caller')):
+            return self.reject('rate_limited', reply)
+
+        try:
+            self.requests.put_nowait((time.perf_counter(), digest, deadline, reply))
+        except queue.Full:
+            return self.reject('busy', reply)
+        self.queue_depth.set(self.requests.qsize())
+
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            self.queue_depth.set(self.requests.qsize())
+            received_at, digest, deadline, reply = item
+
+            if deadline is not None and time.monotonic() >= deadline:
+                self.reject('expired', reply)
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                signature = self.signer.sign_digest(digest)
+                response = { "ok": True, "data": signature.hex() }
+            except Exception as e:
+                traceback.print_exc(file=sys.stdout)
+                response = error_response('signer_error', str(e))
+            finished_at = time.perf_counter()
+
+            self.sign_duration.observe(finished_at - started_at)
+            self.request_duration.observe(finished_at - received_at)
+            reply(response)
+
+class LocalTransport:
+    """
+    In-process stand-in for the ZMQ transport
+    """
+    def __init__(self, service):
+        self.service = service
+
+    def request(self, message, timeout):
+        done = threading.Event()
+        result = []
+
+        def reply(response):
+            result.append(response)
+            done.set()
+
+        self.service.submit(message, reply)
+        if not done.wait(timeout):
+            raise SigningTimeoutException('Signing service did not reply in time')
+        return result[0]
+
+class ZMQTransport:
+    """
+    Client side ZMQ transport (REQ socket). The socket is recreated
+    after a timeout so that a lost reply does not block the next request.
+    """
+    def __init__(self, address):
+        self.address = address
+        self.context = zmq.Context.instance()
+        self.socket = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(self.address)
+
+    def request(self, message, timeout):
+        with self.lock:
+            if self.socket is None:
+                self.connect()
+            self.socket.send_json(message)
+            if not self.socket.poll(timeout * 1000, zmq.POLLIN):
+                self.socket.close()
+                self.socket = None
+                raise SigningTimeoutException('Signing service did not reply in time')
+            return self.socket.recv_json()
+
+    def close(self):
+        with self.lock:
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+class ZMQSigningServer:
+    """
+    Serves a SigningService on a ZMQ ROUTER socket. Replies produced by
+    the signing worker are passed back to the socket thread over an
+    inproc socket since zmq sockets are not thread safe.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.context = zmq.Context.instance()
+        self.socket = None
+        self.running = False
+
+    def start(self, address):
+        if self.socket:
+            raise Exception('ZMQ signing server already started')
+
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.bind(address)
+        replies_address = 'inproc://signing-replies-{}'.format(id(self))
+        replies = self.context.socket(zmq.PULL)
+        replies.bind(replies_address)
+        reply_sockets = threading.local()
+        pushes = []
+
+        def make_reply(identity):
+            def reply(response):
+                # one PUSH socket per replying thread
+                push = getattr(reply_sockets, 'push', None)
+                if push is None:
+                    push = reply_sockets.push = self.context.socket(zmq.PUSH)
+                    push.connect(replies_address)
+                    pushes.append(push)
+                push.send_multipart([identity, b'', json_bytes(response)])
+            return reply
+
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(replies, zmq.POLLIN)
+
+        self.service.start()
+        self.running = True
+        while self.running:
+            events = dict(poller.poll(100))
+            if replies in events:
+                self.socket.send_multipart(replies.recv_multipart())
+            if self.socket in events:
+                identity, _, body = self.socket.recv_multipart()
+                try:
+                    request = json.loads(body)
+                except Exception as e:
+                    self.socket.send_multipart([identity, b'', json_bytes(error_response('bad_request', str(e)))])
+                    continue
+                self.service.submit(request, make_reply(identity))
+
+        self.service.stop()
+        for push in pushes:
+            push.close()
+        self.socket.close()
+        replies.close()
+        self.socket = None
+
+    def stop(self):
+        self.running = False
+
+class SigningClient:
+    """
+    Drop in replacement for the Signer that uses a signing service
+    clock - the clock of the deadlines (the scheduler's, see clock.py). Defaults to the system clock
+    """
+    def __init__(self, transport, caller = 'scheduler', timeout = SIGNING_DEFAULT_TIMEOUT, clock = None):
+        self.transport = transport
+        self.caller = caller
+        self.timeout = timeout
+        self.clock = SystemClock() if clock is None else clock
+        self.request_duration = METRICS.histogram('signing_client_request_duration')
+
+        # these do not change for the lifetime of the service
+        self.certificate_id = bytes.fromhex(self.call('get_certificate_id'))
+        self.certificate = bytes.fromhex(self.call('get_certificate'))
+        self.cypher_suite_id = self.call('get_cypher_suite_id')
+
+    def call(self, command, data = None, timeout = None):
+        response = self.transport.request({
+            "command": command,
+            "caller": self.caller,
+            "data": data or {}
+        }, self.timeout if timeout is None else timeout)
+
+        if 'error' in response:
+            error = response['error']
+            raise SigningException('{} ({})'.format(error.get('message'), error.get('code')))
+        return response.get('data')
+
+    def get_certificate_id(self):
+        return self.certificate_id
+
+    def get_certificate(self):
+        return self.certificate
+
+    def get_cypher_suite_id(self):
+        return self.cypher_suite_id
+
+    def sign_digest(self, digest, deadline = None):
+        """
+        Sign a digest. The deadline is a datetime (of the clock of the client)
+        after which the signature is no longer useful. It is sent as a budget.
+        """
+        data = { "digest": digest.hex() }
+        timeout = self.timeout
+        if deadline is not None:
+            data['budget'] = (deadline - self.clock.now()).total_seconds()
+            timeout = max(0, min(timeout, data['budget']))
+
+        started_at = time.perf_counter()
+        with TRACER.span('sign_remote'):
+            signature = self.call('sign_digest', data, timeout)
+        self.request_duration.observe(time.perf_counter() - started_at)
+        return bytes.fromhex(signature)
+
+def get_signing_client(address, clock = None):
+    return SigningClient(ZMQTransport(address), clock=clock)
+
+if __name__ == '__main__':
+    from signer import Signer
+
+    use_hsm = int(os.getenv('USE_HSM', 0)) == 1
+    port = os.getenv('SIGNER_PORT', 5060)
+    service = SigningService(Signer(use_hsm))
+    server = ZMQSigningServer(service)
+    print('Signing service listening on port {}'.format(port), flush=True)
+    server.start('tcp://*:{}'.format(port))
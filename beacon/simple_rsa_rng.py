@@ -1,11 +1,16 @@
-from sympy import *
-import os
+import sys
 import time
+import traceback
+from beacon_shared.metrics import METRICS
+from primes import generate_rsa_parameters, build_rsa_parameters
 
 TWO_POW_32 = 4294967296
-
-def get_random_int(nbytes):
-    return int.from_bytes(os.urandom(nbytes), byteorder="big")
+# the generator jumps M steps each tick
+M = 1048576 # 2**20
+# number of bits in each output
+N = 512
+# bits of the exponent processed per multiplication in pow_mod
+WINDOW_BITS = 5
 
 # USE RSA PSRBG to generate sequence of 512 pseudorandom bis each second
 # t=time in epoch (seconds since 00:00:00 01/01/1970)
@@ -26,8 +31,37 @@ def get_random_int(nbytes):
 #     and e has provably large order modulo lambda(n).
 #  this requires more complicated determination of primes
 
+def pow_mod(x, exponent, modulus):
+    """
+    pow(x, exponent, modulus) with fixed windows. About as fast as pow(),
+    but made of many small multiplications instead of one long call holding
+    the GIL, so the generator can run in a background thread (see
+    rng_buffer.py) without stalling the scheduler for the whole exponentiation.
+    """
+    table = [1, x % modulus]
+    for _ in range(2, 1 << WINDOW_BITS):
+        table.append(table[-1] * x % modulus)
+    mask = (1 << WINDOW_BITS) - 1
+    result = 1 % modulus
+    for shift in range((exponent.bit_length() - 1) // WINDOW_BITS * WINDOW_BITS, -1, -WINDOW_BITS):
+        for _ in range(WINDOW_BITS):
+            result = result * result % modulus
+        digit = (exponent >> shift) & mask
+        if digit:
+            result = result * table[digit] % modulus
+    return result
+
 class SimpleRSARNG:
-    def __init__(self, nbits = 2048, e = 3):
+    """
+    Arguments
+    ---------
+    nbits - number of bits of the modulus n
+    e - the exponent
+    strong_primes - use the RSAStrongPrime construction for p and q
+    rotate_period - if set, new parameters (p, q, x0) are built in the
+        background and swapped in after this many seconds
+    """
+    def __init__(self, nbits = 2048, e = 3, strong_primes = False, rotate_period = None):
 
         # calculate initial parameters p, q, lambda, etc
         self.e = int(e)
@@ -35,58 +69,118 @@ class SimpleRSARNG:
         self.nbytes = nbits//8
         self.nbitsprime = nbits//2
         self.nbytesprime = self.nbitsprime//8
+        self.strong_primes = strong_primes
         self.t = int(time.time())
         self.reset_primes()
 
+        self.rotate_period = rotate_period
+        self.next_parameters = None
+        self.rotate_at = time.monotonic() + (rotate_period or 0)
+        self.rotations = METRICS.counter('rsa_rng_rotations')
+        self.rotations_delayed = METRICS.counter('rsa_rng_rotations_delayed')
+
     def reset_primes(self):
         """
         choose 2048 bit composite n=p*q
         choose two 1024 bit primes p and q without any special properties or checks other than
         the exponent e must be coprime to phi(n) by requiring gcd(e,p-1)=gcd(e,q-1)=1
+        (or strong primes if strong_primes is set)
         """
-        nbitsprime = self.nbitsprime
-        nbytesprime = self.nbytesprime
-        nbytes = self.nbytes
-        e = self.e
-
-        p=get_random_int(nbytesprime)
-        twonprimebitsminus1=pow(2, nbitsprime - 1)
-        while p < twonprimebitsminus1:
-        	p = 2 * p
-
-        p = nextprime(p)
-        while igcd(e, p - 1) != 1:
-        	p = nextprime(p)
-
-        q = get_random_int(nbytesprime)
-        while q < twonprimebitsminus1:
-        	q = 2 * q
-
-        q = nextprime(q)
-        while igcd(e, q - 1) != 1:
-        	q = nextprime(q)
-
-        n = p * q
-        lam = (p - 1) * (q - 1) // igcd(p - 1, q - 1)
-        x0 = get_random_int(nbytes - 1)
+        self.set_parameters(*generate_rsa_parameters(self.nbits, self.e, self.strong_primes))
 
+    def rotate(self):
+        """
+        Swap in the parameters built in the background once the rotation
+        period has passed. If they are not ready yet, the current
+        parameters are kept rather than waiting.
+        """
+        if self.rotate_period is None:
+            return
+        if self.next_parameters is None:
+            self.next_parameters = build_rsa_parameters(self.nbits, self.e, self.strong_primes)
+        if time.monotonic() < self.rotate_at:
+            return
+        if not self.next_parameters.done():
+            self.rotations_delayed.inc()
+            return
+
+        pending, self.next_parameters = self.next_parameters, None
+        try:
+            self.set_parameters(*pending.result())
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            return
+        self.rotate_at = time.monotonic() + self.rotate_period
+        self.rotations.inc()
+
+    def set_parameters(self, n, lam, x0, p = None, q = None):
+        """
+        Set the generator parameters. If the primes are provided,
+        the state is advanced using the CRT (two half size exponentiations).
+        """
         self.n = n
         self.lam = lam
         self.x0 = x0
+        self.crt = None
+        if p is not None and q is not None:
+            # q^-1 mod p
+            self.crt = (p, q, pow(q, p - 2, p))
+        # running state, computed from x0 on the next tick
+        self.xt = None
+        # exponent to advance the state by one tick
+        self.step = self.get_jump_exponent(1)
+
+    def get_jump_exponent(self, k):
+        """
+        The exponent e^(M*k), reduced mod lam (or mod p-1 and q-1 for the CRT)
+        """
+        if self.crt is None:
+            return pow(self.e, M * k, self.lam)
+        p, q, _ = self.crt
+        return (pow(self.e, M * k, p - 1), pow(self.e, M * k, q - 1))
 
-    def get_rng(self):
-        M=1048576 # 2**20
-        N=512
+    def power(self, x, exponent):
+        """
+        x^exponent mod n, where the exponent comes from get_jump_exponent()
+        """
+        if self.crt is None:
+            return pow_mod(x, exponent, self.n)
+        p, q, qinv = self.crt
+        ep, eq = exponent
+        xp = pow_mod(x, ep, p)
+        xq = pow_mod(x, eq, q)
+        return xq + q * (((xp - xq) * qinv) % p)
+
+    def get_xt(self, t):
+        """
+        Compute the secret pseudorandom number for time t from the seed
+        xt=pow(x0,pow(e,M*t,lam),n)
+        """
+        return self.power(self.x0, self.get_jump_exponent(t))
+
+    def jump(self, k = 1):
+        """
+        Advance the generator state by k ticks.
+        Since x_{t+k} = x_t^(e^(M*k)) mod n and exponents can be reduced
+        mod lam, one step is a single fixed size exponentiation by the
+        precomputed e^M mod lam rather than recomputing from x0.
+        """
+        self.t += k
+        if self.xt is None:
+            self.xt = self.get_xt(self.t)
+            return
 
-        self.t += 1
+        exponent = self.step if k == 1 else self.get_jump_exponent(k)
+        self.xt = self.power(self.xt, exponent)
 
-        t = self.t
-        x0 = self.x0
+    def extract(self, xt):
+        """
+        zt = Sum[2**k (pow(xt,pow(e,k,lam),n) mod 2),{k,0,511}]
+        """
+        if self.crt is not None:
+            return self.extract_crt(xt)
         e = self.e
         n = self.n
-        lam = self.lam
-
-        xt = pow(x0, pow(e, M * t, lam), n)
         zt = 0
         twok = 1
         x = xt
@@ -96,3 +190,25 @@ class SimpleRSARNG:
             twok = twok << 1
 
         return zt
+
+    def extract_crt(self, xt):
+        """
+        extract() with the successive powers computed mod p and mod q,
+        and only recombined to get their low bit
+        """
+        e = self.e
+        p, q, qinv = self.crt
+        xp = xt % p
+        xq = xt % q
+        zt = 0
+        for k in range(0, N):
+            zt |= ((xq + q * (((xp - xq) * qinv) % p)) & 1) << k
+            xp = pow(xp, e, p)
+            xq = pow(xq, e, q)
+
+        return zt
+
+    def get_rng(self):
+        self.rotate()
+        self.jump(1)
+        return self.extract(self.xt)
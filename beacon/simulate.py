@@ -0,0 +1,147 @@
+"""
+Generate synthetic chains as fast as possible.
+
+Pulses go through the same assemble_pulse / sign_pulse path as the
+scheduler, and are stored with addPulses in batches, but on a VirtualClock (no waiting for the period) and
+with local random values from a seeded generator, so the same seed
+gives the same random values.
+
+A chain is inherently sequential (each pulse needs the output value
+of the previous one), so with several workers each worker process
+builds its own chain in its own database (shard).
+
+usage: python3 /app simulate --pulses 1000000 --workers 8 --out /db/simulated
+"""
+import os
+import time
+import random
+import argparse
+import multiprocessing
+from datetime import datetime, timedelta
+from beacon_shared.types import ByteHash
+from beacon_shared.pulse import assemble_pulse, sign_pulse
+from beacon_shared.store import BeaconStore
+from beacon_shared.config import TIMINGS, CYPHER_SUITE
+from signer import Signer
+from clock import VirtualClock
+
+STAGES = ['randomness', 'assemble', 'sign', 'store']
+# default time of the first pulse (so that the same seed gives the same chain)
+SIMULATION_START = datetime(2020, 1, 1)
+# pulses stored per transaction (see BeaconStore.addPulses)
+SIMULATION_STORE_BATCH = 1000
+
+def seeded_random_value(rand):
+    return ByteHash(rand.getrandbits(512).to_bytes(64, byteorder='big'))
+
+def simulate_chain(shard, num_pulses, seed, db_path, period = TIMINGS['period'], cypher_suite = CYPHER_SUITE, start = SIMULATION_START):
+    """
+    Build one chain of num_pulses pulses into the store at db_path.
+    Returns the time spent in each stage (seconds) and the total wall time.
+    """
+    rand = random.Random('{}-{}'.format(seed, shard))
+    clock = VirtualClock(start, count_compute=False)
+    signer = Signer(False, cypher_suite)
+    store = BeaconStore(db_path)
+    store.initDB()
+    store.addCertificate(signer.get_certificate_id().hex(), signer.get_certificate().hex())
+
+    durations = dict.fromkeys(STAGES, 0.0)
+    previous_pulse = None
+    batch = []
+    local_random_value = seeded_random_value(rand)
+    started_at = time.perf_counter()
+
+    for _ in range(num_pulses):
+        t0 = time.perf_counter()
+        next_local_random_value = seeded_random_value(rand)
+        t1 = time.perf_counter()
+        pulse = assemble_pulse(
+            chain_index = 0,
+            local_random_value = local_random_value,
+            next_local_random_value = next_local_random_value,
+            previous_pulse = previous_pulse,
+            period = period,
+            now = clock.now()
+        )
+        t2 = time.perf_counter()
+        sign_pulse(signer, pulse)
+        t3 = time.perf_counter()
+        batch.append(pulse)
+        if len(batch) >= SIMULATION_STORE_BATCH:
+            store.addPulses(batch)
+            batch = []
+        t4 = time.perf_counter()
+
+        durations['randomness'] += t1 - t0
+        durations['assemble'] += t2 - t1
+        durations['sign'] += t3 - t2
+        durations['store'] += t4 - t3
+
+        previous_pulse = pulse
+        local_random_value = next_local_random_value
+        # skip ahead to the next pulse
+        clock.sleep((pulse.timeStamp + period - clock.now()).total_seconds())
+
+    t0 = time.perf_counter()
+    store.addPulses(batch)
+    durations['store'] += time.perf_counter() - t0
+    store.dbConnection.close()
+    return {
+        "shard": shard,
+        "pulses": num_pulses,
+        "wall": time.perf_counter() - started_at,
+        "stages": durations
+    }
+
+def simulate_shard(args):
+    return simulate_chain(*args)
+
+def print_report(results, wall):
+    total = sum(r['pulses'] for r in results)
+    print('{} pulses in {} shard(s), {:.1f}s'.format(total, len(results), wall))
+    print('overall: {:10.1f} pulses/s'.format(total / wall if wall else 0))
+    for stage in STAGES:
+        spent = sum(r['stages'][stage] for r in results)
+        # per worker rate of the stage alone
+        print('{:>10}: {:10.1f} pulses/s per worker'.format(stage, total / spent if spent else float('inf')))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='simulate', description='Generate synthetic chains on a virtual clock')
+    parser.add_argument('--pulses', type=int, default=10000, help='total number of pulses')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (one chain and database each)')
+    parser.add_argument('--seed', default='0', help='seed of the local random values')
+    parser.add_argument('--out', default='./simulated', help='directory of the databases')
+    parser.add_argument('--period', type=float, default=TIMINGS['period'].total_seconds(), help='pulse period (seconds)')
+    parser.add_argument('--cypher-suite', type=int, default=CYPHER_SUITE)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    period = timedelta(seconds=args.period)
+    per_worker, remainder = divmod(args.pulses, args.workers)
+    shards = [
+        (
+            shard,
+            per_worker + (1 if shard < remainder else 0),
+            args.seed,
+            os.path.join(args.out, 'chain-{}.db'.format(shard)),
+            period,
+            args.cypher_suite
+        )
+        for shard in range(args.workers)
+    ]
+    for shard in shards:
+        if os.path.exists(shard[3]):
+            raise ValueError('{} already exists'.format(shard[3]))
+
+    started_at = time.perf_counter()
+    if args.workers == 1:
+        results = [simulate_shard(shards[0])]
+    else:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(simulate_shard, shards)
+    print_report(results, time.perf_counter() - started_at)
+    return results
+
+if __name__ == '__main__':
+    main()
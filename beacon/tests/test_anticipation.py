@@ -0,0 +1,51 @@
+import unittest
+from datetime import timedelta
+from anticipation import AdaptiveAnticipation
+from beacon_shared.metrics import METRICS
+
+ANTICIPATION = timedelta(seconds=7)
+DELAY = timedelta(seconds=1)
+SKEW_AHEAD = timedelta(milliseconds=500)
+
+class TestAdaptiveAnticipation(unittest.TestCase):
+
+    def create(self, name, **kwargs):
+        return AdaptiveAnticipation(0.99, ANTICIPATION, DELAY, SKEW_AHEAD, name=name, **kwargs)
+
+    def test_args(self):
+        self.assertRaises(ValueError, lambda: AdaptiveAnticipation(0, ANTICIPATION, DELAY, SKEW_AHEAD))
+        self.assertRaises(ValueError, lambda: AdaptiveAnticipation(1, ANTICIPATION, DELAY, SKEW_AHEAD))
+
+    def test_adapts(self):
+        a = self.create('test_adapts', min_samples=5)
+        for _ in range(4):
+            self.assertEqual(a.observe(timedelta(seconds=2)), ANTICIPATION)
+        # 2s * 1.5 + 0.5s - 1s
+        self.assertEqual(a.observe(timedelta(seconds=2)), timedelta(seconds=2.5))
+        self.assertEqual(METRICS.gauge('test_adapts_seconds').value, 2.5)
+        self.assertEqual(METRICS.gauge('test_adapts_upper_bound_seconds').value, 7)
+
+    def test_bounds(self):
+        a = self.create('test_bounds', min_samples=1)
+        # ready long before the release: no anticipation
+        self.assertEqual(a.observe(timedelta(milliseconds=10)), timedelta(0))
+        self.assertEqual(METRICS.counter('test_bounds_clamped').value, 1)
+        for _ in range(10):
+            a.observe(timedelta(seconds=10))
+        self.assertEqual(a.value, ANTICIPATION)
+        self.assertGreater(METRICS.gauge('test_bounds_target_seconds').value, 7)
+
+    def test_late_pulse(self):
+        a = self.create('test_late_pulse', min_samples=3)
+        for _ in range(3):
+            a.observe(timedelta(seconds=1))
+        self.assertLess(a.value, ANTICIPATION)
+        # back to the configured anticipation until min_samples more durations
+        self.assertEqual(a.observe(timedelta(seconds=1), late=True), ANTICIPATION)
+        self.assertEqual(METRICS.counter('test_late_pulse_resets').value, 1)
+        for _ in range(2):
+            self.assertEqual(a.observe(timedelta(seconds=1)), ANTICIPATION)
+        self.assertLess(a.observe(timedelta(seconds=1)), ANTICIPATION)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import io
+import os
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+import pulse_scheduler
+from checkpoint import CheckpointSealer, get_checkpoint_sealer
+from pulse_scheduler import PulseScheduler
+from randomness_sources import RandomnessSources
+from signer import Signer
+from clock import VirtualClock
+from beacon_shared.config import TIMINGS
+from beacon_shared.store import BeaconStore
+from beacon_shared.types import ByteHash
+from beacon_shared.hashing import hash
+from beacon_shared.pulse import assert_next_in_chain
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'beacon.db')
+        self.clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        self.signer = Signer(False)
+        self.seal_key = os.urandom(32).hex()
+
+    def start_scheduler(self, seal_key = None):
+        s = PulseScheduler(
+            **TIMINGS,
+            use_hsm=False,
+            signer=self.signer,
+            seal_key=self.seal_key if seal_key is None else seal_key,
+            clock=self.clock,
+            store=BeaconStore(self.db_path),
+            randomness_sources=RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))]),
+            quiet=True
+        )
+        self.addCleanup(s.store.dbConnection.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.recall_state()
+        return s
+
+    def release_next(self, s):
+        s.pulse_generation_started_at = s.now()
+        s.pulse_generation_duration = timedelta(0)
+        s.next_local_random_value, s.next_local_random_value_degraded = s.get_local_random_value()
+        s.generate_pulse(s.next_local_random_value)
+        s.sign_pulse_variants()
+        s.use_on_time_variant()
+        self.clock.sleep(s.get_pulse_release_delay(s.current_pulse).total_seconds())
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.emit_pulse()
+        return s.previous_pulse
+
+    def test_seal(self):
+        s = self.start_scheduler()
+        pulse = self.release_next(s)
+        sealer = CheckpointSealer(os.urandom(32))
+        sealed = sealer.seal('table', pulse, s.local_random_value, True)
+        value, degraded = sealer.unseal('table', pulse, sealed)
+        self.assertEqual(value.get(), s.local_random_value.get())
+        self.assertTrue(degraded)
+        self.assertIsNone(sealer.unseal('other_table', pulse, sealed))
+        self.assertIsNone(CheckpointSealer(os.urandom(32)).unseal('table', pulse, sealed))
+        # doesn't match the precommitment
+        other = CheckpointSealer(os.urandom(32))
+        self.assertIsNone(other.unseal('table', pulse, other.seal('table', pulse, os.urandom(64), False)))
+
+    def test_seal_key(self):
+        s = self.start_scheduler()
+        pulse = self.release_next(s)
+        sealed = get_checkpoint_sealer(self.seal_key).seal('table', pulse, s.local_random_value, False)
+        self.assertIsNotNone(get_checkpoint_sealer(self.seal_key).unseal('table', pulse, sealed))
+        # never derived from the signer
+        self.assertIsNone(get_checkpoint_sealer(None))
+
+    def test_no_seal_key(self):
+        s = self.start_scheduler()
+        self.release_next(s)
+        s = PulseScheduler(
+            **TIMINGS,
+            use_hsm=False,
+            signer=self.signer,
+            seal_key=None,
+            clock=self.clock,
+            store=BeaconStore(self.db_path),
+            randomness_sources=RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))]),
+            quiet=True
+        )
+        self.addCleanup(s.store.dbConnection.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.recall_state()
+        self.assertEqual(s.chain_index, 1)
+
+    def test_resume(self):
+        s = self.start_scheduler()
+        for _ in range(3):
+            last = self.release_next(s)
+
+        # restarted within the period
+        s = self.start_scheduler()
+        self.assertEqual(s.previous_pulse, last)
+        pulse = self.release_next(s)
+        self.assertEqual((pulse.chainIndex, pulse.pulseIndex), (0, 3))
+        assert_next_in_chain(last, pulse)
+        self.assertEqual(hash(ByteHash(pulse.localRandomValue)), last.precommitmentValue)
+
+    def test_new_chain(self):
+        s = self.start_scheduler()
+        self.release_next(s)
+        # the seal key changed
+        self.assertEqual(self.start_scheduler(os.urandom(32).hex()).chain_index, 1)
+        # the pulses of another version are signed over another layout
+        version = pulse_scheduler.BEACON_VERSION
+        self.addCleanup(setattr, pulse_scheduler, 'BEACON_VERSION', version)
+        pulse_scheduler.BEACON_VERSION = '9.9'
+        self.assertEqual(self.start_scheduler().chain_index, 1)
+        pulse_scheduler.BEACON_VERSION = version
+        self.assertEqual(self.start_scheduler().chain_index, 0)
+        # the next pulse is overdue
+        self.clock.sleep(TIMINGS['period'].total_seconds())
+        self.assertEqual(self.start_scheduler().chain_index, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import time
+import asyncio
+from datetime import datetime, timedelta
+from clock import VirtualClock
+
+class TestVirtualClock(unittest.TestCase):
+
+    def test_sleep_is_skipped(self):
+        clock = VirtualClock(datetime(2020, 1, 1))
+        clock.sleep(3600)
+        self.assertGreaterEqual(clock.now(), datetime(2020, 1, 1, 1))
+        self.assertLess(clock.now(), datetime(2020, 1, 1, 1, 0, 1))
+        self.assertGreaterEqual(clock.monotonic(), 3600)
+
+    def test_deterministic(self):
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        self.assertEqual(clock.now(), datetime(2020, 1, 1))
+        clock.sleep(1.5)
+        self.assertEqual(clock.now(), datetime(2020, 1, 1, 0, 0, 1, 500000))
+
+    def test_negative_sleep(self):
+        clock = VirtualClock(datetime(2020, 1, 1))
+        clock.sleep(-10)
+        self.assertGreaterEqual(clock.now(), datetime(2020, 1, 1))
+
+    def test_sleep_async(self):
+        clock = VirtualClock(datetime(2020, 1, 1))
+        asyncio.run(clock.sleep_async(60))
+        self.assertGreaterEqual(clock.now() - datetime(2020, 1, 1), timedelta(seconds=60))
+
+    def test_speedup(self):
+        clock = VirtualClock(datetime(2020, 1, 1), speedup=100)
+        started_at = time.perf_counter()
+        clock.sleep(10)
+        # really slept 0.1s
+        self.assertGreaterEqual(time.perf_counter() - started_at, 0.1)
+        self.assertGreaterEqual(clock.now(), datetime(2020, 1, 1, 0, 0, 10))
+        self.assertLess(clock.now(), datetime(2020, 1, 1, 0, 0, 11))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import time
+from external_sources import ExternalSource, ExternalSources, HTTPSource, LocalEntropyServer, load_external_sources, NISTBeaconSource
+from beacon_shared.types import ByteHash
+from beacon_shared.hashing import hash_many
+from beacon_shared.pulse import NO_EXTERNAL_VALUE
+from beacon_shared.status_codes import EXTERNAL_STATUS_OK, EXTERNAL_STATUS_PARTIAL
+
+class FixedSource(ExternalSource):
+    def __init__(self, name, value, delay = 0, **kwargs):
+        super().__init__(name, 'fixed source ' + name, **kwargs)
+        self.fixed_value = value
+        self.delay = delay
+
+    def fetch(self):
+        time.sleep(self.delay)
+        return self.fixed_value
+
+class TestExternalSources(unittest.TestCase):
+
+    def start(self, sources):
+        external = ExternalSources(sources)
+        external.start()
+        self.addCleanup(external.stop)
+        return external
+
+    def test_no_sources(self):
+        self.assertEqual(ExternalSources([]).collect(), NO_EXTERNAL_VALUE)
+
+    def test_collect(self):
+        a = FixedSource('test_a', b'a')
+        b = FixedSource('test_b', b'b')
+        external = self.start([a, b])
+        source_id, status, value = external.collect(1)
+        self.assertEqual(status, EXTERNAL_STATUS_OK)
+        self.assertEqual(source_id, hash_many([ByteHash(a.source_id), ByteHash(b.source_id)]))
+        self.assertEqual(value, hash_many([ByteHash(b'a'), ByteHash(b'b')]))
+
+    def test_deadline(self):
+        slow = FixedSource('test_slow', b'slow', delay=1)
+        fast = FixedSource('test_fast', b'fast')
+        external = self.start([slow, fast])
+        started_at = time.monotonic()
+        source_id, status, value = external.collect(0.2)
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(status, EXTERNAL_STATUS_PARTIAL)
+        self.assertEqual(source_id, hash_many([ByteHash(fast.source_id)]))
+        self.assertEqual(value, hash_many([ByteHash(b'fast')]))
+
+    def test_freshness(self):
+        source = FixedSource('test_fresh', b'x', refresh_interval=60, max_age=0.1)
+        external = self.start([source])
+        self.assertEqual(external.collect(1)[1], EXTERNAL_STATUS_OK)
+        time.sleep(0.2)
+        # the only value is too old
+        self.assertEqual(external.collect(), NO_EXTERNAL_VALUE)
+        self.assertGreater(external.get_stats()['test_fresh']['stale'], 0)
+
+    def test_http(self):
+        server = LocalEntropyServer(nbytes=32)
+        server.start()
+        self.addCleanup(server.stop)
+        source = HTTPSource('test_http', server.url)
+        value = source.fetch()
+        self.assertEqual(len(value), 32)
+        self.assertNotEqual(source.fetch(), value)
+        self.assertEqual(server.requests_served, 2)
+
+    def test_load(self):
+        sources = load_external_sources('http:http://localhost:1/, nist:https://beacon.nist.gov/beacon/2.0/pulse/last')
+        self.assertEqual([type(s) for s in sources], [HTTPSource, NISTBeaconSource])
+        self.assertEqual(sources[1].json_path, 'pulse.outputValue')
+        with self.assertRaises(ValueError):
+            load_external_sources('ftp:ftp://localhost')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import io
+import os
+import asyncio
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta
+from multi_chain import DeadlineSigner, ChainProfile, MultiChainScheduler, load_profiles
+from beacon_shared.config import scaled_timings, profile_names
+from beacon_shared.store import BEACON_DB_TABLE
+from beacon_shared.pulse import assert_next_in_chain
+
+class SlowSigner:
+    def __init__(self):
+        self.signed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def sign_digest(self, digest, deadline = None):
+        self.started.set()
+        self.release.wait()
+        self.signed.append(digest)
+        return digest
+
+class TestMultiChain(unittest.TestCase):
+
+    def test_deadline_order(self):
+        stub = SlowSigner()
+        signer = DeadlineSigner(stub)
+        self.addCleanup(signer.stop)
+        now = datetime.now()
+
+        # blocks the signer while the others are queued
+        first = signer.submit(b'first', now)
+        stub.started.wait()
+        futures = [
+            signer.submit(b'none'),
+            signer.submit(b'late', now + timedelta(seconds=10)),
+            signer.submit(b'early', now + timedelta(seconds=1))
+        ]
+        stub.release.set()
+        for f in [first] + futures:
+            f.result(timeout=5)
+        self.assertEqual(stub.signed, [b'first', b'early', b'late', b'none'])
+
+    def test_profiles(self):
+        fast, default = load_profiles('fast:1, default:10')
+        self.assertEqual(fast.timings, scaled_timings(timedelta(seconds=1)))
+        self.assertEqual(fast.table, BEACON_DB_TABLE + '_fast')
+        self.assertEqual(fast.uri_path, '/api/fast')
+        self.assertEqual(default.table, BEACON_DB_TABLE)
+        self.assertEqual(default.uri_path, '/api')
+        self.assertRaises(ValueError, lambda: load_profiles('a:1,a:2'))
+        self.assertRaises(ValueError, lambda: ChainProfile('drop table', {}))
+        # the names the API serves the chains of
+        self.assertEqual(profile_names('fast:1, default:10'), ['fast', 'default'])
+
+    def test_run(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiles = [
+            ChainProfile('fast', scaled_timings(timedelta(seconds=1))),
+            ChainProfile('slow', scaled_timings(timedelta(seconds=2)))
+        ]
+        s = MultiChainScheduler(profiles, use_hsm=False, db_path=os.path.join(directory.name, 'beacon.db'))
+        self.addCleanup(s.randomness_sources.simpleRSA.stop)
+
+        async def run():
+            task = asyncio.ensure_future(s.run_async())
+            await asyncio.sleep(4.5)
+            task.cancel()
+            await task
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(run())
+
+        fast, slow = (scheduler.store for scheduler in s.schedulers)
+        for store, count in [(fast, 3), (slow, 1)]:
+            previous = None
+            for i in range(count):
+                pulse = store.fetchPulse(0, i)
+                self.assertIsNotNone(pulse)
+                assert_next_in_chain(previous, pulse)
+                previous = pulse
+        self.assertIn('/api/fast/', fast.fetchPulse(0, 0).uri)
+        self.assertIn('/api/slow/', slow.fetchPulse(0, 0).uri)
+        self.assertEqual(fast.fetchPulse(0, 0).period, timedelta(seconds=1))
+        self.assertEqual(slow.fetchPulse(0, 0).period, timedelta(seconds=2))
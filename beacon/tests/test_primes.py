@@ -0,0 +1,60 @@
+import unittest
+import concurrent.futures
+from math import gcd
+from sympy import isprime, primerange
+import primes
+
+class TestPrimes(unittest.TestCase):
+
+    def test_small_primes(self):
+        self.assertEqual(primes.small_primes(1000), list(primerange(2, 1000)))
+
+    def test_is_probable_prime(self):
+        for n in range(0, 3000):
+            self.assertEqual(primes.is_probable_prime(n), isprime(n), n)
+        self.assertTrue(primes.is_probable_prime(2**127 - 1))
+        self.assertFalse(primes.is_probable_prime((2**61 - 1) * (2**89 - 1)))
+
+    def test_sieve_keeps_primes(self):
+        start = 2**100 + 1
+        candidates = set(primes.sieve_window(start, 1000))
+        for p in primerange(start, start + 2000):
+            self.assertIn(p, candidates)
+
+    def test_find_prime(self):
+        start = 2**200
+        p = primes.find_prime(start, e=3)
+        self.assertTrue(isprime(p))
+        self.assertNotEqual((p - 1) % 3, 0)
+        # no prime (with gcd(3, p-1) = 1) was skipped
+        for q in primerange(start, p):
+            self.assertEqual((q - 1) % 3, 0)
+
+    def test_random_prime(self):
+        for nbits in [64, 129, 512]:
+            p = primes.random_prime(nbits, 3)
+            self.assertTrue(isprime(p))
+            self.assertEqual(p.bit_length(), nbits)
+            self.assertEqual(gcd(3, p - 1), 1)
+
+    def test_strong_prime(self):
+        p, p1, a1 = primes.strong_prime(256, 3)
+        self.assertTrue(isprime(p))
+        self.assertTrue(isprime(p1))
+        self.assertEqual(p, 2 * a1 * p1 + 1)
+        self.assertEqual(gcd(3, p - 1), 1)
+
+    def test_parameters(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            pending = primes.build_rsa_parameters(256, 3, executor=executor)
+            n, lam, x0, p, q = pending.result()
+        self.assertTrue(pending.done())
+        self.assertEqual(n, p * q)
+        self.assertEqual(n.bit_length(), 256)
+        self.assertEqual(lam % (p - 1), 0)
+        self.assertEqual(lam % (q - 1), 0)
+        self.assertEqual(gcd(3, lam), 1)
+        self.assertLess(x0, n)
+
+if __name__ == '__main__':
+    unittest.main()
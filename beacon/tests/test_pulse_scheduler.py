@@ -1,6 +1,31 @@
 import unittest
-from datetime import timedelta
-from pulse_scheduler import PulseScheduler
+import io
+import os
+import asyncio
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from pulse_scheduler import PulseScheduler, RANDOMNESS_SOURCES_TIME_FRACTION
+from signer import Signer
+from clock import VirtualClock
+from beacon_shared.config import TIMINGS, scaled_timings
+from beacon_shared.store import BeaconStore
+from randomness_sources import RandomnessSources
+from beacon_shared import store as beacon_store
+from beacon_shared.pulse import assert_next_in_chain
+from beacon_shared.metrics import METRICS
+
+class RecordingSigner(Signer):
+    """
+    Keeps the deadline of each signature, in the order they were signed
+    """
+    def __init__(self):
+        super().__init__(False)
+        self.deadlines = []
+
+    def sign_digest(self, digest, deadline = None):
+        self.deadlines.append(deadline)
+        return super().sign_digest(digest, deadline)
 
 class TestPulseScheduler(unittest.TestCase):
 
@@ -51,6 +76,147 @@ class TestPulseScheduler(unittest.TestCase):
             args = [timedelta(seconds=x) for x in timing]
             self.assertRaises(ValueError, lambda: PulseScheduler(*args))
 
+    def test_async_scheduler(self):
+        period = timedelta(seconds=1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        original_path = beacon_store.BEACON_DB_PATH
+        beacon_store.BEACON_DB_PATH = os.path.join(directory.name, 'beacon.db')
+        self.addCleanup(setattr, beacon_store, 'BEACON_DB_PATH', original_path)
+
+        s = PulseScheduler(
+            period,
+            timedelta(seconds=0.3),
+            timedelta(seconds=0.1),
+            timedelta(seconds=0.05),
+            timedelta(seconds=0.05),
+            use_hsm=False
+        )
+        released_before = METRICS.histogram('pulse_release_jitter').count
+
+        async def run():
+            task = asyncio.ensure_future(s.run_async())
+            await asyncio.sleep(3.5)
+            task.cancel()
+            await task
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(run())
+
+        pulses = [s.store.fetchPulse(0, i) for i in range(3)]
+        previous = None
+        for pulse in pulses:
+            self.assertIsNotNone(pulse)
+            assert_next_in_chain(previous, pulse)
+            previous = pulse
+        self.assertGreaterEqual(METRICS.histogram('pulse_release_jitter').count - released_before, 3)
+        for pulse in pulses:
+            released_at, error = s.store.fetchRelease(0, pulse.pulseIndex)
+            self.assertAlmostEqual((released_at - pulse.timeStamp).total_seconds() - 0.1, error, places=6)
+        s.randomness_sources.simpleRSA.stop()
+
+    def test_virtual_clock(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        original_path = beacon_store.BEACON_DB_PATH
+        beacon_store.BEACON_DB_PATH = os.path.join(directory.name, 'beacon.db')
+        self.addCleanup(setattr, beacon_store, 'BEACON_DB_PATH', original_path)
+
+        clock = VirtualClock()
+        s = PulseScheduler(**TIMINGS, use_hsm=False, clock=clock)
+        self.addCleanup(s.randomness_sources.simpleRSA.stop)
+
+        async def run():
+            task = asyncio.ensure_future(s.run_async())
+            await asyncio.sleep(1)
+            task.cancel()
+            await task
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(run())
+
+        # 10s periods, in much less than one real period
+        latest = s.store.fetchLatestPulse()
+        self.assertGreater(latest.pulseIndex, 5)
+        self.assertEqual(latest.timeStamp - s.store.fetchPulse(0, latest.pulseIndex - 1).timeStamp, TIMINGS['period'])
+
+    def test_variant_signing_order(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        signer = RecordingSigner()
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        s = PulseScheduler(
+            **TIMINGS,
+            use_hsm=False,
+            signer=signer,
+            clock=clock,
+            store=BeaconStore(os.path.join(directory.name, 'beacon.db')),
+            randomness_sources=RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))]),
+            quiet=True
+        )
+        self.addCleanup(s.store.dbConnection.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.recall_state()
+        s.pulse_generation_started_at = s.now()
+        s.pulse_generation_duration = timedelta(0)
+        s.next_local_random_value, s.next_local_random_value_degraded = s.get_local_random_value()
+        s.generate_pulse(s.next_local_random_value)
+        del signer.deadlines[:]
+        s.sign_pulse_variants()
+        s.late_variant.result()
+        # the on-time variant takes the signer before the late one
+        timeStamp = s.current_pulse.timeStamp
+        self.assertEqual(signer.deadlines, [timeStamp + s.delay, timeStamp + s.period])
+
+    def test_adaptive_budgets(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        s = PulseScheduler(
+            **TIMINGS,
+            use_hsm=False,
+            store=BeaconStore(os.path.join(directory.name, 'beacon.db')),
+            randomness_sources=RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))]),
+            adaptive_anticipation=0.99
+        )
+        self.addCleanup(s.store.dbConnection.close)
+        self.assertEqual(s.current_pulse_generation_time, s.max_pulse_generation_time)
+        # the sources have less time once generation starts later
+        s.adaptive_anticipation.value = timedelta(0)
+        self.assertEqual(s.current_pulse_generation_time, s.delay - s.max_local_skew_ahead)
+        self.assertEqual(s.randomness_sources_timeout, (s.delay - s.max_local_skew_ahead) * RANDOMNESS_SOURCES_TIME_FRACTION)
+
+    def test_high_rate(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = BeaconStore(os.path.join(directory.name, 'beacon.db'))
+        sources = RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))])
+        # R1-R4 hold for the high rate timings
+        for ms in [100, 250, 1000]:
+            s = PulseScheduler(**scaled_timings(timedelta(milliseconds=ms)), use_hsm=False, store=store, randomness_sources=sources)
+            self.assertTrue(s.quiet)
+
+        s = PulseScheduler(**scaled_timings(timedelta(milliseconds=100)), use_hsm=False, store=store, randomness_sources=sources)
+
+        async def run():
+            task = asyncio.ensure_future(s.run_async())
+            await asyncio.sleep(2)
+            task.cancel()
+            await task
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            asyncio.run(run())
+
+        latest = s.store.fetchLatestPulse()
+        self.assertGreater(latest.pulseIndex, 10)
+        self.assertEqual(latest.period, timedelta(milliseconds=100))
+        previous = None
+        for i in range(latest.pulseIndex + 1):
+            pulse = s.store.fetchPulse(0, i)
+            assert_next_in_chain(previous, pulse)
+            previous = pulse
+        # only the first pulse is logged (then every STATUS_INTERVAL)
+        self.assertEqual(output.getvalue().count('Released pulse'), 1)
 
 if __name__ == '__main__':
     unittest.main()
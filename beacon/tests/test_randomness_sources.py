@@ -0,0 +1,84 @@
+import unittest
+import threading
+import time
+from randomness_sources import RandomnessSources, to_byte_hash
+from exceptions import BeaconException
+
+def raw(values):
+    return [v.get() for v in values]
+
+def failing():
+    raise Exception('source failure')
+
+class TestRandomnessSources(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def hung(self):
+        self.release.wait(5)
+        return 3
+
+    def test_all_sources(self):
+        sources = RandomnessSources(sources=[('test_a', lambda: 1), ('test_b', lambda: 2)])
+        values, missing = sources.fetch(1)
+        self.assertEqual(raw(values), raw([to_byte_hash(1), to_byte_hash(2)]))
+        self.assertEqual(missing, [])
+
+    def test_deadline(self):
+        sources = RandomnessSources(sources=[
+            ('test_hung', self.hung),
+            ('test_ok', lambda: 2),
+            ('test_failing', failing)
+        ])
+        values, missing = sources.fetch(0.1)
+        self.assertEqual(raw(values), raw([to_byte_hash(2)]))
+        self.assertEqual(missing, ['test_hung', 'test_failing'])
+
+        # the hung source is not queued behind its previous call
+        values, missing = sources.fetch(0.1)
+        self.assertEqual(missing, ['test_hung', 'test_failing'])
+        self.assertEqual(sources.get_stats()['test_hung']['missed'], 2)
+
+        # ...and is used again once it recovers
+        self.release.set()
+        sources.sources[0].pending.result()
+        values, missing = sources.fetch(1)
+        self.assertEqual(raw(values), raw([to_byte_hash(3), to_byte_hash(2)]))
+        self.assertEqual(missing, ['test_failing'])
+
+    def test_concurrent_fetches(self):
+        sources = RandomnessSources(sources=[('test_shared', self.hung), ('test_ok', lambda: 2)])
+        results = []
+        thread = threading.Thread(target=lambda: results.append(sources.fetch(5)))
+        thread.start()
+        time.sleep(0.05)
+        # not held up by the other caller's timeout
+        started_at = time.perf_counter()
+        values, missing = sources.fetch(0.1)
+        self.assertLess(time.perf_counter() - started_at, 1)
+        self.assertEqual(missing, ['test_shared'])
+
+        # the other caller still gets the fetch they share once it returns
+        self.release.set()
+        thread.join()
+        values, missing = results[0]
+        self.assertEqual(raw(values), raw([to_byte_hash(3), to_byte_hash(2)]))
+        self.assertEqual(missing, [])
+
+    def test_rsa_buffer_depth(self):
+        # about a second of outputs at short periods
+        for period, depth in [(0.1, 10), (60, 3)]:
+            sources = RandomnessSources(use_hsm=False, period=period)
+            sources.simpleRSA.stop()
+            self.assertEqual(sources.simpleRSA.buffer.maxsize, depth)
+            self.assertGreaterEqual(sources.simpleRSA.max_age, (depth + 2) * period)
+
+    def test_no_sources(self):
+        sources = RandomnessSources(sources=[('test_none', failing)])
+        with self.assertRaises(BeaconException):
+            sources.fetch(1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import asyncio
+from datetime import datetime, timedelta
+from clock import SystemClock, VirtualClock
+from release_timer import ReleaseTimer
+
+class TestReleaseTimer(unittest.TestCase):
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        timer = ReleaseTimer(clock)
+        deadline = datetime(2020, 1, 1, 0, 0, 10)
+        self.assertEqual(timer.wait_until(deadline), deadline)
+        self.assertEqual(clock.now(), deadline)
+        deadline += timedelta(seconds=10)
+        self.assertEqual(asyncio.run(timer.wait_until_async(deadline)), deadline)
+
+    def test_past_deadline(self):
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        clock.sleep(5)
+        released_at = ReleaseTimer(clock).wait_until(datetime(2020, 1, 1))
+        self.assertEqual(released_at, datetime(2020, 1, 1, 0, 0, 5))
+
+    def test_system_clock(self):
+        clock = SystemClock()
+        timer = ReleaseTimer(clock)
+        deadline = clock.now() + timedelta(milliseconds=20)
+        released_at = timer.wait_until(deadline)
+        self.assertGreaterEqual(released_at, deadline)
+        self.assertGreaterEqual(clock.now(), deadline)
+        deadline = clock.now() + timedelta(milliseconds=20)
+        self.assertGreaterEqual(asyncio.run(timer.wait_until_async(deadline)), deadline)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import time
+from rng_buffer import BufferedRNG, steady_max_age
+
+class CountingRNG:
+    def __init__(self, delay = 0):
+        self.t = 0
+        self.delay = delay
+
+    def get_rng(self):
+        time.sleep(self.delay)
+        self.t += 1
+        return self.t
+
+class TestBufferedRNG(unittest.TestCase):
+
+    def test_order(self):
+        rng = BufferedRNG(CountingRNG(), depth=2, name='test_rng_order')
+        self.addCleanup(rng.stop)
+        self.assertEqual([rng.get_rng() for _ in range(10)], list(range(1, 11)))
+
+    def test_stale(self):
+        rng = BufferedRNG(CountingRNG(), depth=2, max_age=0.05, name='test_rng_stale')
+        self.addCleanup(rng.stop)
+        time.sleep(0.2)
+        # the buffered values are too old
+        self.assertGreater(rng.get_rng(), 2)
+        self.assertGreater(rng.get_stats()['stale'], 0)
+
+    def test_steady_rate(self):
+        # a value waits about depth + 1 reads in the buffer, more than 0.6s at this rate
+        rng = BufferedRNG(CountingRNG(), depth=3, max_age=steady_max_age(0.2, 3, 0.6), name='test_rng_steady_rate')
+        self.addCleanup(rng.stop)
+        values = []
+        for _ in range(8):
+            time.sleep(0.2)
+            values.append(rng.get_rng())
+        self.assertEqual(values, list(range(1, 9)))
+        self.assertEqual(rng.get_stats()['stale'], 0)
+
+    def test_wait_filled(self):
+        rng = BufferedRNG(CountingRNG(0.01), depth=3, name='test_rng_wait_filled')
+        self.addCleanup(rng.stop)
+        self.assertFalse(rng.wait_filled(0))
+        self.assertTrue(rng.wait_filled(5))
+        self.assertEqual(rng.get_stats()['depth'], 3)
+
+    def test_underrun(self):
+        rng = BufferedRNG(CountingRNG(0.05), depth=1, name='test_rng_underrun')
+        self.addCleanup(rng.stop)
+        self.assertEqual(rng.get_rng(), 1)
+        self.assertGreater(rng.get_stats()['underruns'], 0)
+
+    def test_zeroize(self):
+        rng = BufferedRNG(CountingRNG(), depth=1, name='test_rng_zeroize')
+        while rng.buffer.empty():
+            time.sleep(0.01)
+        entry = rng.buffer.queue[0]
+        self.assertEqual(rng.get_rng(), 1)
+        self.assertEqual(entry[0], bytearray(64))
+        rng.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import os
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidSignature
+from signer import Signer
+from beacon_shared.cypher_suites import CYPHER_SUITES
+from beacon_shared.pulse import assemble_pulse, sign_pulse, verify_pulse
+
+class TestSigner(unittest.TestCase):
+
+    def test_cypher_suites(self):
+        for suite_id in CYPHER_SUITES:
+            signer = Signer(False, suite_id)
+            cert = x509.load_pem_x509_certificate(signer.get_certificate(), default_backend())
+
+            pulse = assemble_pulse(0, os.urandom(64), os.urandom(64), None)
+            sign_pulse(signer, pulse)
+            self.assertEqual(pulse.cypherSuite, suite_id)
+            verify_pulse(pulse, cert.public_key())
+
+            pulse.statusCode = 2
+            self.assertRaises(InvalidSignature, lambda: verify_pulse(pulse, cert.public_key()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import time
+import threading
+from datetime import datetime, timedelta
+from signing_service import SigningService, SigningClient, LocalTransport, ZMQTransport, ZMQSigningServer
+from exceptions import SigningException
+from clock import VirtualClock
+
+class StubSigner:
+    def __init__(self, delay = 0):
+        self.delay = delay
+
+    def get_certificate_id(self):
+        return b'\x01' * 64
+
+    def get_certificate(self):
+        return b'certificate'
+
+    def get_cypher_suite_id(self):
+        return 0
+
+    def sign_digest(self, digest, deadline = None):
+        time.sleep(self.delay)
+        return digest[::-1]
+
+class TestSigningService(unittest.TestCase):
+
+    def make_client(self, signer, clock = None, **kwargs):
+        service = SigningService(signer, **kwargs)
+        service.start()
+        self.addCleanup(service.stop)
+        return SigningClient(LocalTransport(service), clock=clock)
+
+    def test_sign(self):
+        client = self.make_client(StubSigner())
+        self.assertEqual(client.get_certificate_id(), b'\x01' * 64)
+        self.assertEqual(client.get_certificate(), b'certificate')
+        self.assertEqual(client.sign_digest(b'\x01\x02\x03'), b'\x03\x02\x01')
+
+    def test_expired_deadline(self):
+        client = self.make_client(StubSigner())
+        deadline = datetime.now() - timedelta(seconds=1)
+        self.assertRaises(SigningException, lambda: client.sign_digest(b'\x01', deadline))
+
+    def test_virtual_clock_deadline(self):
+        # the deadlines of a virtual clock are far from the service's time
+        clock = VirtualClock(datetime(2020, 1, 1), count_compute=False)
+        client = self.make_client(StubSigner(), clock)
+        self.assertEqual(client.sign_digest(b'\x01\x02', clock.now() + timedelta(seconds=1)), b'\x02\x01')
+        self.assertRaises(SigningException, lambda: client.sign_digest(b'\x01', clock.now() - timedelta(seconds=1)))
+        # the budget is counted by the service while the request waits for the signer
+        client = self.make_client(StubSigner(0.2), clock)
+        thread = threading.Thread(target=lambda: client.sign_digest(b'\x01'))
+        thread.start()
+        time.sleep(0.05)
+        self.assertRaises(SigningException, lambda: client.sign_digest(b'\x01', clock.now() + timedelta(seconds=0.1)))
+        thread.join()
+
+    def test_rate_limit(self):
+        client = self.make_client(StubSigner(), rate=0.001, burst=2)
+        client.sign_digest(b'\x01')
+        client.sign_digest(b'\x01')
+        self.assertRaises(SigningException, lambda: client.sign_digest(b'\x01'))
+
+    def test_queue_bound(self):
+        service = SigningService(StubSigner(0.2), queue_size=1)
+        service.start()
+        self.addCleanup(service.stop)
+        responses = []
+        for _ in range(3):
+            service.submit({ "command": "sign_digest", "caller": "test", "data": { "digest": "01" } }, responses.append)
+        # one is being signed, one waits in the queue, the last is rejected
+        time.sleep(0.05)
+        self.assertEqual(responses[0]['error']['code'], 'busy')
+
+    def test_zmq_transport(self):
+        service = SigningService(StubSigner())
+        server = ZMQSigningServer(service)
+        thread = threading.Thread(target=server.start, args=('tcp://127.0.0.1:5961',), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.stop)
+
+        transport = ZMQTransport('tcp://127.0.0.1:5961')
+        self.addCleanup(transport.close)
+        client = SigningClient(transport)
+        self.assertEqual(client.get_certificate_id(), b'\x01' * 64)
+        self.assertEqual(client.sign_digest(b'\x0a\x0b'), b'\x0b\x0a')
+
+if __name__ == '__main__':
+    unittest.main()
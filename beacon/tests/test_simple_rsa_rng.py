@@ -0,0 +1,78 @@
+import random
+import unittest
+from simple_rsa_rng import SimpleRSARNG, pow_mod
+
+def reference_rng(rng, t):
+    """
+    The original implementation: recompute x_t from x0 for each tick
+    """
+    M=1048576 # 2**20
+    N=512
+
+    xt = pow(rng.x0, pow(rng.e, M * t, rng.lam), rng.n)
+    zt = 0
+    twok = 1
+    x = xt
+    for k in range(0, N):
+        zt = zt + twok * (x&1)
+        x = pow(x, rng.e, rng.n)
+        twok = twok << 1
+
+    return zt
+
+class TestSimpleRSARNG(unittest.TestCase):
+
+    def setUp(self):
+        # small modulus to keep prime generation fast
+        self.rng = SimpleRSARNG(256, 3)
+
+    def test_matches_reference(self):
+        t0 = self.rng.t
+        for i in range(1, 30):
+            self.assertEqual(self.rng.get_rng(), reference_rng(self.rng, t0 + i))
+
+    def test_jump(self):
+        t0 = self.rng.t
+        self.rng.get_rng()
+        self.rng.jump(1000)
+        self.assertEqual(self.rng.t, t0 + 1001)
+        self.assertEqual(self.rng.get_rng(), reference_rng(self.rng, t0 + 1002))
+
+    def test_reset(self):
+        self.rng.get_rng()
+        self.rng.reset_primes()
+        t = self.rng.t
+        self.assertEqual(self.rng.get_rng(), reference_rng(self.rng, t + 1))
+        self.assertEqual(self.rng.get_rng(), reference_rng(self.rng, t + 2))
+
+    def test_without_primes(self):
+        # same outputs when stepping mod lam instead of with the CRT
+        t0 = self.rng.t
+        self.rng.set_parameters(self.rng.n, self.rng.lam, self.rng.x0)
+        self.assertIsNone(self.rng.crt)
+        for i in range(1, 5):
+            self.assertEqual(self.rng.get_rng(), reference_rng(self.rng, t0 + i))
+
+    def test_pow_mod(self):
+        rand = random.Random(0)
+        for _ in range(100):
+            modulus = rand.getrandbits(rand.randint(1, 300)) | 1
+            x = rand.getrandbits(310)
+            exponent = rand.getrandbits(rand.randint(0, 200))
+            self.assertEqual(pow_mod(x, exponent, modulus), pow(x, exponent, modulus))
+
+    def test_rotate(self):
+        rng = SimpleRSARNG(256, 3, rotate_period=0)
+        n = rng.n
+        rng.get_rng()
+        pending = rng.next_parameters
+        # the current parameters are used until the new ones are ready
+        pending.result(30)
+        self.assertEqual(rng.n, n)
+        t = rng.t
+        self.assertEqual(rng.get_rng(), reference_rng(rng, t + 1))
+        self.assertNotEqual(rng.n, n)
+        self.assertEqual(rng.n, pending.result()[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import os
+import tempfile
+from datetime import timedelta
+from simulate import simulate_chain, SIMULATION_START
+from beacon_shared.store import BeaconStore
+from beacon_shared.pulse import assert_next_in_chain
+
+class TestSimulate(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def fetch_chain(self, db_path, n):
+        store = BeaconStore(db_path)
+        self.addCleanup(store.dbConnection.close)
+        return [store.fetchPulse(0, i) for i in range(n)]
+
+    def test_chain(self):
+        period = timedelta(seconds=0.5)
+        path = os.path.join(self.directory, 'a.db')
+        result = simulate_chain(0, 20, 'seed', path, period, 1)
+        self.assertEqual(result['pulses'], 20)
+
+        pulses = self.fetch_chain(path, 20)
+        previous = None
+        for pulse in pulses:
+            assert_next_in_chain(previous, pulse)
+            if previous is not None:
+                self.assertEqual(pulse.timeStamp - previous.timeStamp, period)
+            previous = pulse
+        self.assertEqual(pulses[0].timeStamp, SIMULATION_START)
+
+    def simulate(self, shard, name):
+        path = os.path.join(self.directory, name)
+        simulate_chain(shard, 5, 'seed', path, cypher_suite=1)
+        return self.fetch_chain(path, 5)
+
+    def test_seed(self):
+        a = self.simulate(0, 'a.db')
+        b = self.simulate(0, 'b.db')
+        c = self.simulate(1, 'c.db')
+        self.assertEqual([p.localRandomValue for p in a], [p.localRandomValue for p in b])
+        self.assertEqual([p.timeStamp for p in a], [p.timeStamp for p in b])
+        self.assertNotEqual([p.localRandomValue for p in a], [p.localRandomValue for p in c])
+
+if __name__ == '__main__':
+    unittest.main()
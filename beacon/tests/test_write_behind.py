@@ -0,0 +1,118 @@
+import unittest
+import io
+import os
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta
+from pulse_scheduler import PulseScheduler
+from randomness_sources import RandomnessSources
+from write_behind import WriteBehind, PulseJournal
+from clock import VirtualClock
+from beacon_shared.config import TIMINGS
+from beacon_shared.store import BeaconStore
+from beacon_shared.pulse import assert_next_in_chain
+from beacon_shared.metrics import METRICS
+
+class TestWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'beacon.db')
+        self.journal_path = os.path.join(directory.name, 'beacon.journal')
+        self.seal_key = os.urandom(32).hex()
+
+    def create_scheduler(self, write_behind = None):
+        s = PulseScheduler(
+            **TIMINGS,
+            use_hsm=False,
+            clock=VirtualClock(datetime(2020, 1, 1), count_compute=False),
+            store=BeaconStore(self.db_path),
+            randomness_sources=RandomnessSources(sources=[('test_urandom', lambda: os.urandom(64))]),
+            quiet=True,
+            write_behind=write_behind,
+            # the checkpoints are journaled with the pulses
+            seal_key=self.seal_key
+        )
+        s.recall_state()
+        return s
+
+    def next_pulse(self, s):
+        s.pulse_generation_started_at = s.now()
+        s.pulse_generation_duration = timedelta(0)
+        s.next_local_random_value, s.next_local_random_value_degraded = s.get_local_random_value()
+        s.generate_pulse(s.next_local_random_value)
+        s.sign_pulse_variants()
+        s.use_on_time_variant()
+        s.clock.sleep(TIMINGS['period'].total_seconds())
+
+    def assert_chain(self, count):
+        store = BeaconStore(self.db_path)
+        self.addCleanup(store.dbConnection.close)
+        previous = None
+        for i in range(count):
+            pulse = store.fetchPulse(0, i)
+            self.assertIsNotNone(pulse)
+            self.assertIsNotNone(store.fetchRelease(0, i))
+            assert_next_in_chain(previous, pulse)
+            previous = pulse
+        self.assertIsNone(store.fetchPulse(0, count))
+
+    def test_write_behind(self):
+        write_behind = WriteBehind(self.db_path, self.journal_path)
+        s = self.create_scheduler(write_behind)
+        write_behind.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(5):
+                self.next_pulse(s)
+                s.emit_pulse()
+            write_behind.stop()
+        self.assert_chain(5)
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_replay(self):
+        s = self.create_scheduler()
+        journal = PulseJournal(self.journal_path)
+        # released then crashed before the commit
+        for _ in range(3):
+            self.next_pulse(s)
+            journal.append(s.store.table, *s.release_pulse())
+        journal.file.write(b'{"table": "beacon_rec')
+        journal.close()
+
+        write_behind = WriteBehind(self.db_path, self.journal_path)
+        self.addCleanup(write_behind.journal.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(write_behind.replay(), 3)
+        self.assert_chain(3)
+        self.assertEqual(s.store.fetchCheckpoint()[:2], (0, 2))
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+        # nothing left to replay
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_behind = WriteBehind(self.db_path, self.journal_path)
+            self.addCleanup(write_behind.journal.close)
+            self.assertEqual(write_behind.replay(), 0)
+
+    def test_backpressure(self):
+        write_behind = WriteBehind(self.db_path, None, max_pending=1)
+        s = self.create_scheduler(write_behind)
+        before = METRICS.counter('write_behind_backpressure').value
+        with contextlib.redirect_stdout(io.StringIO()):
+            # the writer isn't started: the second pulse waits for room in the queue
+            self.next_pulse(s)
+            s.emit_pulse()
+            self.next_pulse(s)
+            blocked = threading.Thread(target=s.emit_pulse)
+            blocked.start()
+            blocked.join(0.2)
+            self.assertTrue(blocked.is_alive())
+            write_behind.start()
+            blocked.join(5)
+            self.assertFalse(blocked.is_alive())
+            write_behind.stop()
+        self.assertEqual(METRICS.counter('write_behind_backpressure').value - before, 1)
+        self.assert_chain(2)
+
+if __name__ == '__main__':
+    unittest.main()
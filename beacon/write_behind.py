@@ -0,0 +1,210 @@
+"""
+Write-behind persistence of the released pulses.
+
+Released pulses are handed to a writer thread which applies them to
+sqlite (fetchLatestPulse, chain check, INSERT, commit) and logs them, so
+none of it is on the release path. The pulses queued while a commit runs
+are committed together. The queue is bounded: when the writer falls
+behind by WRITE_BEHIND_MAX_PENDING pulses, releasing blocks
+(backpressure) rather than buffering without limit.
+
+With a journal (BEACON_JOURNAL_PATH) each pulse is first appended to
+a small fsync'd file, so a released pulse survives a crash before its
+commit: the journal is replayed into sqlite on startup and truncated
+whenever everything it holds is committed.
+"""
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+from beacon_shared.pulse import pulse_from_dict, pulse_to_plain_dict
+from beacon_shared.store import BeaconStore
+from beacon_shared.metrics import METRICS
+
+WRITE_BEHIND_MAX_PENDING = 64
+BEACON_JOURNAL_PATH = os.getenv('BEACON_JOURNAL_PATH')
+
+class PulseJournal:
+    """
+    Append only file of (table, pulse, release, checkpoint) records, one JSON per line
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        # make the file itself durable
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def append(self, table, pulse, release = None, checkpoint = None):
+        record = {
+            "table": table,
+            "pulse": pulse_to_plain_dict(pulse),
+            "release": None if release is None else [release[0].isoformat(), release[1]],
+            "checkpoint": None if checkpoint is None else checkpoint.hex()
+        }
+        self.file.write(json.dumps(record).encode() + b'\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def records(self):
+        """
+        The (table, pulse, release, checkpoint) records. A torn last record (crash while appending) is ignored
+        """
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                release = record['release']
+                if release is not None:
+                    release = (datetime.fromisoformat(release[0]), release[1])
+                checkpoint = record.get('checkpoint')
+                if checkpoint is not None:
+                    checkpoint = bytes.fromhex(checkpoint)
+                yield record['table'], pulse_from_dict(record['pulse']), release, checkpoint
+
+    def truncate(self):
+        self.file.truncate(0)
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+class WriteBehind:
+    """
+    db_path - defaults to BEACON_DB_PATH
+    journal_path - Optional journal file (see PulseJournal). Defaults to BEACON_JOURNAL_PATH
+    max_pending - see WRITE_BEHIND_MAX_PENDING
+
+    Items are (scheduler, pulse, generation_started_at, generation_duration, release, checkpoint)
+    and each pulse goes to its scheduler's table (see PulseScheduler.persist_pulse).
+    """
+    def __init__(self, db_path = None, journal_path = BEACON_JOURNAL_PATH, max_pending = WRITE_BEHIND_MAX_PENDING):
+        self.db_path = db_path
+        self.journal = None if journal_path is None else PulseJournal(journal_path)
+        self.queue = queue.Queue(max_pending)
+        # journaled pulses not committed yet
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.error = None
+        self.thread = None
+
+        self.pending_gauge = METRICS.gauge('write_behind_pending')
+        self.backpressure = METRICS.counter('write_behind_backpressure')
+        self.journal_duration = METRICS.histogram('write_behind_journal_duration')
+        self.commit_duration = METRICS.histogram('write_behind_commit_duration')
+
+    def start(self):
+        """
+        Replay the journal then start the writer. Does nothing if already started
+        """
+        if self.thread is not None:
+            return
+        if self.journal is not None:
+            self.replay()
+        self.thread = threading.Thread(target=self.run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def replay(self):
+        """
+        Commit the journaled pulses missing from the store (released before a crash)
+        """
+        store = BeaconStore(self.db_path)
+        replayed = 0
+        try:
+            stores = {}
+            for table, pulse, release, checkpoint in self.journal.records():
+                if table not in stores:
+                    stores[table] = store.withTable(table)
+                    stores[table].initDB()
+                if stores[table].fetchPulse(pulse.chainIndex, pulse.pulseIndex) is None:
+                    stores[table].addPulse(pulse, False, release)
+                    if checkpoint is not None:
+                        stores[table].saveCheckpoint(pulse.chainIndex, pulse.pulseIndex, checkpoint, False)
+                    replayed += 1
+            store.dbConnection.commit()
+        finally:
+            store.dbConnection.close()
+        self.journal.truncate()
+        if replayed:
+            print('Replayed {} pulse(s) from the journal'.format(replayed), flush=True)
+        METRICS.counter('write_behind_replayed').inc(replayed)
+        return replayed
+
+    def put(self, item):
+        """
+        Journal the released pulse and queue it. Blocks while max_pending pulses are queued.
+        Raises the error of the writer if it failed.
+        """
+        if self.error is not None:
+            raise self.error
+        scheduler, pulse, _, _, release, checkpoint = item
+        with self.lock:
+            if self.journal is not None:
+                started_at = time.perf_counter()
+                self.journal.append(scheduler.store.table, pulse, release, checkpoint)
+                self.journal_duration.observe(time.perf_counter() - started_at)
+            self.pending += 1
+        if self.queue.full():
+            self.backpressure.inc()
+        self.queue.put(item)
+        self.pending_gauge.set(self.queue.qsize())
+
+    def run(self):
+        connection = BeaconStore(self.db_path)
+        stores = {}
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self.queue.get()]
+                while not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                if None in batch:
+                    stopping = True
+                    batch = batch[:batch.index(None)]
+                if not batch:
+                    continue
+
+                started_at = time.perf_counter()
+                for scheduler, *item in batch:
+                    table = scheduler.store.table
+                    if table not in stores:
+                        stores[table] = connection.withTable(table)
+                    scheduler.persist_pulse(stores[table], *item, commit=False)
+                connection.dbConnection.commit()
+                self.commit_duration.observe(time.perf_counter() - started_at)
+
+                with self.lock:
+                    self.pending -= len(batch)
+                    if self.pending == 0 and self.journal is not None:
+                        self.journal.truncate()
+                self.pending_gauge.set(self.queue.qsize())
+        except Exception as e:
+            # the journal keeps the pulses for the next start
+            self.error = e
+            raise
+        finally:
+            connection.dbConnection.close()
+
+    def stop(self):
+        """
+        Write the queued pulses and stop the writer
+        """
+        if self.thread is None:
+            return
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        self.thread = None
+        if self.journal is not None:
+            self.journal.close()
@@ -1,19 +1,21 @@
 import traceback
 import sys
+import os
 import falcon
 import json
 from datetime import datetime
 from beacon_shared.pulse import pulse_to_plain_dict
-from beacon_shared.store import BeaconStore
+from beacon_shared.store import BeaconStore, BEACON_DB_TABLE, profile_table
 from beacon_shared.skiplist import SkipLayers
-from beacon_shared.config import SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS, BEACON_VERSION
+from beacon_shared.config import SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS, BEACON_VERSION, DEFAULT_PROFILE, profile_names
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 from cryptography import x509
 
 class BeaconResource(object):
-    def __init__(self):
-        self.store = BeaconStore()
+    def __init__(self, table = BEACON_DB_TABLE):
+        # the resources share the connection of the worker thread
+        self.store = BeaconStore(table=table, read_only=True, pooled=True)
 
 class PulseResource(BeaconResource):
     def on_get(self, req, resp, chainId, pulseId):
@@ -73,8 +75,8 @@ class PulseResource(BeaconResource):
 
 
 class SkipListResource(BeaconResource):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, table = BEACON_DB_TABLE):
+        super().__init__(table)
         self.skiplayers = SkipLayers(SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS)
 
     def on_get(self, req, resp, chainId, pulseIdFrom, pulseIdTo):
@@ -95,8 +97,9 @@ class SkipListResource(BeaconResource):
         except ValueError as e:
             raise falcon.HTTPBadRequest('Invalid date string. Must be a valid ISO date string.') from e
 
-        pulse_from = self.store.fetchPulseByExactTime(dfrom)
-        pulse_to = self.store.fetchPulseByExactTime(dto)
+        # (chainIndex, pulseIndex), from the chain catalog: the pulses are only fetched with the path
+        pulse_from = self.store.fetchPulseIdByExactTime(dfrom)
+        pulse_to = self.store.fetchPulseIdByExactTime(dto)
 
         if pulse_from is None:
             raise falcon.HTTPBadRequest('Could not find "from" pulse')
@@ -104,12 +107,12 @@ class SkipListResource(BeaconResource):
         if pulse_to is None:
             raise falcon.HTTPBadRequest('Could not find "to" pulse')
 
-        pulseIdFrom = pulse_from["pulseIndex"].get()
-        pulseIdTo = pulse_to["pulseIndex"].get()
-        chainId = pulse_from["chainIndex"].get()
-        if chainId is not pulse_to["chainIndex"].get():
+        chainId, pulseIdFrom = pulse_from
+        if chainId != pulse_to[0]:
             raise falcon.HTTPBadRequest('Can not generate skiplist. Timestamps span multiple chains.')
 
+        pulseIdTo = pulse_to[1]
+
         pulseIds = self.skiplayers.getSkiplistPath(int(pulseIdFrom), int(pulseIdTo))
         if len(pulseIds) == 0:
             resp.body = '[]'
@@ -148,14 +151,26 @@ api = falcon.API()
 
 api.add_route('/', ServerStatusResource())
 
-api.add_route('/chain/{chainId}/pulse/{pulseId}', PulseResource())
-api.add_route('/pulse/time/{isotimestr}', PulseResource(), suffix='by_time')
-api.add_route('/pulse/time/next/{isotimestr}', PulseResource(), suffix='by_next_time')
-api.add_route('/pulse/time/previous/{isotimestr}', PulseResource(), suffix='by_previous_time')
-api.add_route('/pulse/last', PulseResource(), suffix='last')
-
-api.add_route('/skiplist/chain/{chainId}/{pulseIdFrom}/{pulseIdTo}', SkipListResource())
-api.add_route('/skiplist/time/{isotimestr_from}/{isotimestr_to}', SkipListResource(), suffix='by_timestamps')
+def add_chain_routes(api, prefix = '', table = BEACON_DB_TABLE):
+    """
+    The pulse and skiplist routes of the chains of a pulse table
+    """
+    api.add_route(prefix + '/chain/{chainId}/pulse/{pulseId}', PulseResource(table))
+    api.add_route(prefix + '/pulse/time/{isotimestr}', PulseResource(table), suffix='by_time')
+    api.add_route(prefix + '/pulse/time/next/{isotimestr}', PulseResource(table), suffix='by_next_time')
+    api.add_route(prefix + '/pulse/time/previous/{isotimestr}', PulseResource(table), suffix='by_previous_time')
+    api.add_route(prefix + '/pulse/last', PulseResource(table), suffix='last')
+
+    api.add_route(prefix + '/skiplist/chain/{chainId}/{pulseIdFrom}/{pulseIdTo}', SkipListResource(table))
+    api.add_route(prefix + '/skiplist/time/{isotimestr_from}/{isotimestr_to}', SkipListResource(table), suffix='by_timestamps')
+
+add_chain_routes(api)
+
+# the chains of the other profiles (see beacon/multi_chain.py). Their pulse uris are
+# /api/<name>/<version>/..., served under /<name> as /api/<version>/... is under /
+for name in profile_names(os.getenv('BEACON_PROFILES', '')):
+    if name != DEFAULT_PROFILE:
+        add_chain_routes(api, '/' + name, profile_table(name))
 
 api.add_route('/certificate/{id}', CertificateResource())
 
@@ -0,0 +1,65 @@
+"""
+Insert throughput of BeaconStore.addPulses by batch size, one transaction
+(and one commit) per batch, vs the previous addPulse path querying the
+latest pulse before every insert (the tip kept in memory is reset).
+
+The chain has real skiplist anchors (outputValue is random, not the pulse
+hash), so the anchors are stored by reference as the beacon does.
+
+usage: python3 -m beacon_shared.benchmarks.bench_add_pulses [min pulses per batch size] [max batch size]
+"""
+import os
+import sys
+import time
+import tempfile
+from ..pulse import pulse_from_dict, get_skip_list_anchors
+from ..store import BeaconStore
+from .bench_pulse import example_dict
+
+def example_chain(n):
+    pulses = []
+    previous = None
+    for i in range(n):
+        previous = pulse_from_dict(example_dict(i))
+        previous.skipListAnchors = get_skip_list_anchors(pulses[-1] if pulses else None)
+        pulses.append(previous)
+    return pulses
+
+def open_store(directory, name):
+    store = BeaconStore(os.path.join(directory, name + '.db'))
+    store.initDB()
+    return store
+
+def measure_uncached(store, pulses):
+    started_at = time.perf_counter()
+    for pulse in pulses:
+        store.resetTip()
+        store.addPulse(pulse)
+    return len(pulses) / (time.perf_counter() - started_at)
+
+def measure(store, pulses, size):
+    started_at = time.perf_counter()
+    for i in range(0, len(pulses), size):
+        store.addPulses(pulses[i:i + size])
+    return len(pulses) / (time.perf_counter() - started_at)
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if len(argv) > 0 else 10000
+    largest = int(argv[1]) if len(argv) > 1 else 100000
+    sizes = [size for size in [1, 10, 100, 1000, 10000, 100000] if size <= largest]
+    pulses = example_chain(max([n] + sizes))
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(directory, 'uncached')
+        rate = measure_uncached(store, pulses[:n])
+        store.dbConnection.close()
+        print('addPulse, latest pulse queried: {:9.0f} pulses/s ({} pulses)'.format(rate, n))
+        for size in sizes:
+            store = open_store(directory, 'batch-{}'.format(size))
+            count = max(n, size)
+            rate = measure(store, pulses[:count], size)
+            store.dbConnection.close()
+            print('addPulses, batch {:>6}:        {:9.0f} pulses/s ({} pulses)'.format(size, rate, count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Storage of the skiplist anchors as they are vs by reference (see
+get_anchor_references in store.py) in a version 2 pulse table, and the
+read cost of looking the referenced anchors up.
+
+The rows are bulk inserted (outputValue is random, not the pulse hash),
+then the anchors are compacted with the migration tool. The bytes per
+pulse don't depend on the chain length: pass 10000000 to measure a 10M
+pulse chain (~14 GB of disk).
+
+usage: python3 -m beacon_shared.benchmarks.bench_anchor_refs [num_pulses]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from ..pulse import PULSE_KEYS, pulse_from_dict, get_skip_list_anchors
+from ..store import BeaconStore, connect, to_row_v2
+from ..skiplist import SkipLayers
+from ..config import SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS
+from ..migrate import compact_anchors
+from .bench_pulse import example_dict
+
+BATCH = 10000
+
+def build(path, n):
+    store = BeaconStore(path)
+    store.initDB()
+    con = store.dbConnection
+    query = 'INSERT INTO {}({}) VALUES ({})'.format(store.table, ', '.join(PULSE_KEYS), ', '.join(['?'] * len(PULSE_KEYS)))
+    previous = None
+    rows = []
+    for i in range(n):
+        pulse = pulse_from_dict(example_dict(i))
+        pulse.skipListAnchors = get_skip_list_anchors(previous)
+        rows.append(to_row_v2(pulse))
+        previous = pulse
+        if len(rows) == BATCH or i == n - 1:
+            con.executemany(query, rows)
+            con.commit()
+            rows = []
+    con.close()
+
+def compact(path):
+    con = connect(path)
+    con.isolation_level = None
+    started_at = time.perf_counter()
+    compacted = compact_anchors(BeaconStore(path, connection=con), BATCH)
+    duration = time.perf_counter() - started_at
+    con.close()
+    return compacted, duration
+
+def measure(name, path, n):
+    con = connect(path)
+    con.execute('VACUUM')
+    con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    con.close()
+    size = os.path.getsize(path)
+
+    store = BeaconStore(path)
+    rand = random.Random(0)
+    started_at = time.perf_counter()
+    for _ in range(5000):
+        store.fetchPulse(0, rand.randrange(n))
+    lookup = (time.perf_counter() - started_at) / 5000
+
+    layers = SkipLayers(SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS)
+    paths = []
+    for _ in range(500):
+        src = rand.randrange(n)
+        paths.append(layers.getSkiplistPath(src, rand.randrange(src, n)))
+    started_at = time.perf_counter()
+    for path_ids in paths:
+        if path_ids:
+            store.fetchManyPulses(0, path_ids)
+    skiplist = (time.perf_counter() - started_at) / len(paths)
+    store.dbConnection.close()
+
+    print('{:>13}: {:8.2f} MB, {:6.0f} bytes/pulse, fetchPulse {:6.1f} us, skiplist path {:7.1f} us'.format(
+        name, size / 1e6, size / n, 1e6 * lookup, 1e6 * skiplist
+    ))
+    return size
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else 200000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'beacon.db')
+        build(path, n)
+        as_they_are = measure('as they are', path, n)
+        compacted, duration = compact(path)
+        print('{} of {} pulses compacted in {:.1f}s'.format(compacted, n, duration))
+        by_reference = measure('by reference', path, n)
+    print('{:.1f}% smaller'.format(100 * (1 - by_reference / as_they_are)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Bulk sign and verify cost per pulse for each cypher suite.
+
+usage: python3 -m beacon_shared.benchmarks.bench_cypher_suites [num_pulses]
+"""
+import sys
+import time
+from ..cypher_suites import CYPHER_SUITES
+from ..pulse import pulse_from_dict, get_pulse_digest, verify_pulse
+from .bench_pulse import example_dict
+
+class LocalSigner:
+    def __init__(self, suite):
+        self.suite = suite
+        self.private_key = suite.generate_private_key()
+
+    def sign(self, pulse):
+        pulse.cypherSuite = self.suite.id
+        digest = get_pulse_digest(pulse)
+        pulse.signatureValue = self.suite.sign_digest(self.private_key, digest.signature_digest())
+        pulse.outputValue = digest.output_value(pulse.signatureValue)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    pulses = [pulse_from_dict(example_dict(i)) for i in range(n)]
+
+    for suite in CYPHER_SUITES.values():
+        signer = LocalSigner(suite)
+        public_key = signer.private_key.public_key()
+
+        started_at = time.perf_counter()
+        for pulse in pulses:
+            signer.sign(pulse)
+        sign_time = (time.perf_counter() - started_at) / n
+
+        started_at = time.perf_counter()
+        for pulse in pulses:
+            verify_pulse(pulse, public_key)
+        verify_time = (time.perf_counter() - started_at) / n
+
+        print('{} ({}): sign {:8.1f} us/pulse, verify {:8.1f} us/pulse, signature {} bytes'.format(
+            suite.id,
+            suite.description,
+            sign_time * 1e6,
+            verify_time * 1e6,
+            len(pulses[0].signatureValue)
+        ))
+
+if __name__ == '__main__':
+    main()
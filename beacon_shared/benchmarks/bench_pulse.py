@@ -0,0 +1,91 @@
+"""
+Benchmark pulse record construction and memory use.
+
+Compares the compact `Pulse` record with the previous representation
+(an OrderedDict of BeaconType wrappers).
+
+usage: python3 -m beacon_shared.benchmarks.bench_pulse [num_pulses]
+"""
+import sys
+import os
+import resource
+import subprocess
+import timeit
+from collections import OrderedDict
+from ..pulse import PULSE_FIELD_TYPES, pulse_from_dict, get_pulse_uri
+from ..store import from_row, to_row
+from ..config import BEACON_VERSION
+
+def legacy_pulse_from_dict(fields):
+    return OrderedDict([(key, T(fields[key])) for key, T in PULSE_FIELD_TYPES.items()])
+
+def example_dict(i):
+    return {
+        'uri': get_pulse_uri(0, i),
+        'version': BEACON_VERSION,
+        'cypherSuite': 0,
+        'period': 10000,
+        'certificateId': os.urandom(64).hex(),
+        'chainIndex': 0,
+        'pulseIndex': i,
+        'timeStamp': '2019-04-03T13:34:23.234234',
+        'localRandomValue': os.urandom(64).hex(),
+        'externalSourceId': os.urandom(64).hex(),
+        'externalStatusCode': 0,
+        'externalValue': os.urandom(64).hex(),
+        'skipListLayerSize': 27,
+        'skipListNumLayers': 5,
+        'skipListAnchors': [os.urandom(64).hex() for _ in range(5)],
+        'precommitmentValue': os.urandom(64).hex(),
+        'statusCode': 0,
+        'signatureValue': os.urandom(256).hex(),
+        'outputValue': os.urandom(64).hex()
+    }
+
+BUILDERS = {
+    'legacy': legacy_pulse_from_dict,
+    'pulse': pulse_from_dict
+}
+
+def max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KiB, OS X reports bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def measure_rss(name, n):
+    """
+    Run in a fresh interpreter so the peak RSS only includes one variant
+    """
+    build = BUILDERS[name]
+    sources = [example_dict(i) for i in range(n)]
+    before = max_rss_bytes()
+    pulses = [build(d) for d in sources]
+    after = max_rss_bytes()
+    return (after - before) * 1000000 / n
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--rss':
+        name, n = sys.argv[2], int(sys.argv[3])
+        print(measure_rss(name, n))
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    d = example_dict(1)
+    row = to_row(pulse_from_dict(d))
+    repeat = 20000
+
+    print('pulses: {}'.format(n))
+    for name, build in BUILDERS.items():
+        t_dict = min(timeit.repeat(lambda: build(d), number=repeat, repeat=3)) / repeat
+        rss = float(subprocess.check_output([
+            sys.executable, '-m', __spec__.name, '--rss', name, str(n)
+        ]))
+        print('{:>8}: construct from dict {:7.2f} us/pulse, RSS {:8.1f} MiB per million pulses'.format(
+            name, t_dict * 1e6, rss / 2**20
+        ))
+
+    t_row = min(timeit.repeat(lambda: from_row(row), number=repeat, repeat=3)) / repeat
+    print('from_row: {:7.2f} us/pulse'.format(t_row * 1e6))
+
+if __name__ == '__main__':
+    main()
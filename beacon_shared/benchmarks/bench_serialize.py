@@ -0,0 +1,30 @@
+"""
+Microbenchmark of whole pulse serialization.
+
+Compares the per-field path (concat_serialize of BeaconType wrappers)
+with the single pass PulseSerializer.
+
+usage: python3 -m beacon_shared.benchmarks.bench_serialize
+"""
+import timeit
+from ..pulse import pulse_from_dict, get_pulse_values, serialize_pulse
+from ..serialization import concat_serialize
+from ..hashing import hash_many, hash_bytes
+from .bench_pulse import example_dict
+
+def report(name, fn, number = 20000):
+    t = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print('{:>40}: {:7.2f} us/pulse'.format(name, t * 1e6))
+
+def main():
+    pulse = pulse_from_dict(example_dict(12345))
+
+    report('concat_serialize (signed prefix)', lambda: concat_serialize(get_pulse_values(pulse, 'signatureValue')))
+    report('PulseSerializer (signed prefix)', lambda: serialize_pulse(pulse, 'signatureValue').view())
+    report('concat_serialize (whole pulse)', lambda: concat_serialize(get_pulse_values(pulse)))
+    report('PulseSerializer (whole pulse)', lambda: serialize_pulse(pulse).view())
+    report('hash_many (output value)', lambda: hash_many(get_pulse_values(pulse, 'outputValue')))
+    report('hash_bytes + PulseSerializer (output value)', lambda: hash_bytes(serialize_pulse(pulse).output_view()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Read throughput of API-like reader processes while a writer inserts pulses.
+
+rollback: the previous setup, default rollback journal connections. Readers
+and the writer block each other on the database file lock.
+wal: the writer in WAL mode, the readers on pooled read-only connections.
+
+usage: python3 -m beacon_shared.benchmarks.bench_store_load [readers] [seconds] [insert interval ms]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import multiprocessing
+from ..pulse import pulse_from_dict
+from ..store import BeaconStore
+from .bench_pulse import example_dict
+
+PRELOADED = 1000
+
+def example_chain(start, n, previous = None):
+    for i in range(start, start + n):
+        d = example_dict(i)
+        if previous is not None:
+            d['skipListAnchors'][0] = previous.outputValue.hex()
+        previous = pulse_from_dict(d)
+        yield previous
+
+def open_store(path, mode, read_only):
+    if mode == 'rollback':
+        return BeaconStore(path, connection=sqlite3.connect(path))
+    return BeaconStore(path, read_only=read_only, pooled=read_only)
+
+def read(path, mode, seconds, results):
+    store = open_store(path, mode, True)
+    rand = random.Random()
+    reads = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started_at = time.perf_counter()
+        latest = store.fetchLatestPulse()
+        store.fetchPulse(0, rand.randrange(latest.pulseIndex + 1))
+        latencies.append(time.perf_counter() - started_at)
+        reads += 2
+    results.put((reads, latencies))
+
+def write(path, mode, seconds, interval):
+    store = open_store(path, mode, False)
+    previous = store.fetchLatestPulse()
+    inserted = 0
+    deadline = time.perf_counter() + seconds
+    for pulse in example_chain(previous.pulseIndex + 1, sys.maxsize, previous):
+        if time.perf_counter() >= deadline:
+            break
+        store.addPulse(pulse)
+        inserted += 1
+        time.sleep(interval)
+    return inserted
+
+def measure(directory, mode, readers, seconds, interval):
+    path = os.path.join(directory, mode + '.db')
+    store = open_store(path, mode, False)
+    store.initDB()
+    for pulse in example_chain(0, PRELOADED):
+        store.addPulse(pulse, False)
+    store.dbConnection.commit()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=read, args=(path, mode, seconds, results)) for _ in range(readers)]
+    for p in processes:
+        p.start()
+    inserted = write(path, mode, seconds, interval)
+    reads, latencies = 0, []
+    for _ in processes:
+        r, l = results.get()
+        reads += r
+        latencies += l
+    for p in processes:
+        p.join()
+    latencies.sort()
+    print('{:>8}: {:8.0f} reads/s, request p50 {:7.3f} ms, p99 {:7.3f} ms, {:6.0f} inserts/s'.format(
+        mode,
+        reads / seconds,
+        1e3 * latencies[len(latencies) // 2],
+        1e3 * latencies[int(len(latencies) * 0.99)],
+        inserted / seconds
+    ))
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    readers = int(argv[0]) if len(argv) > 0 else 4
+    seconds = float(argv[1]) if len(argv) > 1 else 3
+    interval = float(argv[2]) / 1000 if len(argv) > 2 else 0.001
+    print('{} readers, one insert every {} ms'.format(readers, 1000 * interval))
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ['rollback', 'wal']:
+            measure(directory, mode, readers, seconds, interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Database size and row decoding of the version 1 (hex text) and version 2
+(blob) pulse tables, the version 2 database being migrated from the version 1 one.
+
+usage: python3 -m beacon_shared.benchmarks.bench_store_v2 [num_pulses]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+from ..pulse import PULSE_KEYS, pulse_from_dict
+from ..store import BeaconStore, connect, from_row, from_row_v2
+from ..migrate import migrate_table
+from .bench_pulse import example_dict
+
+def build_v1(path, n):
+    store = BeaconStore(path)
+    store.initDB(1)
+    previous = None
+    for i in range(n):
+        d = example_dict(i)
+        if previous is not None:
+            d['skipListAnchors'][0] = previous.outputValue.hex()
+        previous = pulse_from_dict(d)
+        store.addPulse(previous, False, (previous.timeStamp, 0.0001))
+    store.dbConnection.commit()
+    store.dbConnection.close()
+
+def migrate(path):
+    con = connect(path)
+    con.isolation_level = None
+    started_at = time.perf_counter()
+    migrate_table(con, BeaconStore(path).table, drop=True)
+    duration = time.perf_counter() - started_at
+    con.execute('VACUUM')
+    con.close()
+    return duration
+
+def measure(name, path, decode, n):
+    store = BeaconStore(path)
+    con = store.dbConnection
+    con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    size = os.path.getsize(path)
+
+    rows = con.execute('SELECT {} FROM {}'.format(', '.join(PULSE_KEYS), store.table)).fetchall()
+    started_at = time.perf_counter()
+    for row in rows:
+        decode(row)
+    decoding = time.perf_counter() - started_at
+
+    rand = random.Random(0)
+    lookups = [rand.randrange(n) for _ in range(10000)]
+    started_at = time.perf_counter()
+    for i in lookups:
+        store.fetchPulse(0, i)
+    lookup = (time.perf_counter() - started_at) / len(lookups)
+    con.close()
+
+    print('{:>3}: {:7.2f} MB ({:4.0f} bytes/pulse), decode {:7.0f} rows/s, fetchPulse {:5.1f} us'.format(
+        name,
+        size / 1e6,
+        size / n,
+        len(rows) / decoding,
+        1e6 * lookup
+    ))
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    n = int(argv[0]) if argv else 20000
+    with tempfile.TemporaryDirectory() as directory:
+        v1 = os.path.join(directory, 'v1.db')
+        v2 = os.path.join(directory, 'v2.db')
+        build_v1(v1, n)
+        connect(v1).execute('VACUUM')
+        shutil.copy(v1, v2)
+        print('{} pulses migrated in {:.2f}s'.format(n, migrate(v2)))
+        measure('v1', v1, from_row, n)
+        measure('v2', v2, from_row_v2, n)
+
+if __name__ == '__main__':
+    main()
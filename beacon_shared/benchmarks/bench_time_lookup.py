@@ -0,0 +1,146 @@
+"""
+Latency of the time lookups of the API endpoints on a multi-year chain, with
+the chain catalog (see chain_catalog.py) vs the timeStamp index (the catalog
+switched off, the previous queries).
+
+Each endpoint is its store calls plus the JSON response (see beacon_api/main.py):
+/pulse/time, /pulse/time/next, /pulse/time/previous fetch one pulse by time,
+/skiplist/time locates the pulses at both times then fetches the path.
+The location of one pulse at an exact time (fetchPulseIdByExactTime) is
+also measured alone.
+
+The pulses are 60 s apart, with a late pulse (a gap) every 997 pulses and
+a new chain every 100000 pulses.
+
+usage: python3 -m beacon_shared.benchmarks.bench_time_lookup [years] [lookups]
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import tempfile
+from datetime import datetime, timedelta
+from ..pulse import pulse_from_dict, pulse_to_plain_dict, get_skip_list_anchors
+from ..store import BeaconStore
+from ..skiplist import SkipLayers
+from ..config import SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS
+from .bench_pulse import example_dict
+
+PERIOD = timedelta(seconds=60)
+GAP_EVERY = 997
+CHAIN_LENGTH = 100000
+BATCH = 10000
+
+def example_chain(n):
+    template = pulse_from_dict(example_dict(0))
+    template.period = PERIOD
+    timeStamp = datetime(2020, 1, 1)
+    previous = None
+    for i in range(n):
+        pulse = template.copy()
+        timeStamp += PERIOD
+        if i % CHAIN_LENGTH == 0:
+            timeStamp += timedelta(minutes=5)
+            previous = None
+        elif i % GAP_EVERY == 0:
+            timeStamp += timedelta(seconds=3)
+        pulse.chainIndex = i // CHAIN_LENGTH
+        pulse.pulseIndex = i % CHAIN_LENGTH
+        pulse.timeStamp = timeStamp
+        pulse.skipListAnchors = get_skip_list_anchors(previous)
+        pulse.outputValue = os.urandom(64)
+        previous = pulse
+        yield pulse
+
+def build(path, n):
+    store = BeaconStore(path)
+    store.initDB()
+    pulses = example_chain(n)
+    while store.addPulses(itertools.islice(pulses, BATCH)):
+        pass
+    return store
+
+def endpoints(store, skiplayers):
+    def by_time(dt):
+        return json.dumps(pulse_to_plain_dict(store.fetchPulseByGeaterEqualTime(dt)))
+    def by_next_time(dt):
+        return json.dumps(pulse_to_plain_dict(store.fetchNextPulseByTime(dt)))
+    def by_previous_time(dt):
+        return json.dumps(pulse_to_plain_dict(store.fetchPreviousPulseByTime(dt)))
+    def skiplist(times):
+        (chain, start), (_, end) = store.fetchPulseIdByExactTime(times[0]), store.fetchPulseIdByExactTime(times[1])
+        pulses = store.fetchManyPulses(chain, skiplayers.getSkiplistPath(start, end))
+        return json.dumps([pulse_to_plain_dict(p) for p in pulses])
+    def locate(times):
+        return store.fetchPulseIdByExactTime(times[0])
+    return [
+        ('fetchPulseIdByExactTime', locate),
+        ('/pulse/time', by_time),
+        ('/pulse/time/next', by_next_time),
+        ('/pulse/time/previous', by_previous_time),
+        ('/skiplist/time', skiplist)
+    ]
+
+def measure(fetch, queries):
+    latencies = []
+    for query in queries:
+        started_at = time.perf_counter()
+        fetch(query)
+        latencies.append(time.perf_counter() - started_at)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    years = float(argv[0]) if len(argv) > 0 else 2
+    lookups = int(argv[1]) if len(argv) > 1 else 2000
+    n = int(years * timedelta(days=365) / PERIOD)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'beacon.db')
+        started_at = time.perf_counter()
+        store = build(path, n)
+        print('{} pulses ({} chains) stored in {:.0f}s'.format(n, -(-n // CHAIN_LENGTH), time.perf_counter() - started_at))
+        started_at = time.perf_counter()
+        store.buildCatalog()
+        catalog = store.chainCatalog()
+        print('catalog: {} chains, {} gaps, rebuilt in {:.2f}s'.format(
+            len(catalog.chains),
+            sum(len(chain.gaps) for chain in catalog.chains),
+            time.perf_counter() - started_at
+        ))
+
+        # random times, and for the skiplists the times of two pulses of a chain
+        rand = random.Random(0)
+        first, last = catalog.chains[0].firstTime, catalog.chains[-1].lastTime
+        times = [datetime(1970, 1, 1) + timedelta(microseconds=rand.randrange(first, last)) for _ in range(lookups)]
+        ends = []
+        for _ in range(lookups):
+            chain = rand.choice(catalog.chains)
+            start = rand.randrange(chain.lastIndex)
+            end = rand.randrange(start, chain.lastIndex + 1)
+            ends.append(tuple(datetime(1970, 1, 1) + timedelta(microseconds=chain.time(i)) for i in (start, end)))
+
+        indexed = BeaconStore(path)
+        indexed.chainCatalog = lambda: None
+        skiplayers = SkipLayers(SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS)
+        for (name, catalogFetch), (_, indexFetch) in zip(endpoints(store, skiplayers), endpoints(indexed, skiplayers)):
+            queries = times if name.startswith('/pulse') else ends
+            # same responses
+            for query in queries[:50]:
+                assert catalogFetch(query) == indexFetch(query), (name, query)
+            catalogLatency = measure(catalogFetch, queries)
+            indexLatency = measure(indexFetch, queries)
+            print('{:>23}: catalog p50 {:7.1f} us p99 {:7.1f} us, timeStamp index p50 {:7.1f} us p99 {:7.1f} us'.format(
+                name,
+                1e6 * catalogLatency[0],
+                1e6 * catalogLatency[1],
+                1e6 * indexLatency[0],
+                1e6 * indexLatency[1]
+            ))
+        store.dbConnection.close()
+        indexed.dbConnection.close()
+
+if __name__ == '__main__':
+    main()
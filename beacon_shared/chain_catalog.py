@@ -0,0 +1,154 @@
+"""
+Where the pulses of each chain of a pulse table are in time, so that the pulse
+of a timestamp is found with arithmetic on pulseIndex and a primary key lookup
+instead of a search of the timeStamp column (see BeaconStore.chainCatalog).
+
+Inside a chain pulse i is at firstTime + i * period. A new segment starts at
+each gap: a pulse whose timestamp isn't the previous one plus the period (eg:
+the period was changed, an imported chain). The catalog is kept in the
+BEACON_DB_CHAIN_TABLE table (one row per chain) and maintained by addPulses.
+
+Times and periods are integer microseconds (see to_epoch in store.py).
+"""
+import struct
+from bisect import bisect_left, bisect_right
+
+# (pulseIndex, time, period) of the first pulse of each segment after the first one
+_GAP = struct.Struct('>qqq')
+
+def pack_gaps(gaps):
+    return b''.join(_GAP.pack(*gap) for gap in gaps)
+
+def unpack_gaps(data):
+    return [_GAP.unpack_from(data, i) for i in range(0, len(data), _GAP.size)]
+
+class ChainCatalog:
+    """
+    chainIndex - the chain
+    segments - [(pulseIndex, time, period)] of the first pulse of each segment, starting with pulse 0
+    lastIndex - pulseIndex of the latest pulse of the chain
+    ordered - False if the chain can't be searched: a timestamp isn't after the previous one or pulses are missing
+    """
+    def __init__(self, chainIndex, segments, lastIndex, ordered = True):
+        self.chainIndex = chainIndex
+        self.segments = list(segments)
+        self.starts = [segment[0] for segment in self.segments]
+        self.times = [segment[1] for segment in self.segments]
+        self.lastIndex = lastIndex
+        self.ordered = ordered
+
+    @classmethod
+    def start(cls, chainIndex, pulseIndex, time, period):
+        """
+        A chain from its first pulse
+        """
+        return cls(chainIndex, [(pulseIndex, time, period)], pulseIndex, pulseIndex == 0 and period > 0)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        row - (chainIndex, firstTime, period, lastIndex, gaps, ordered) of the catalog table
+        """
+        chainIndex, firstTime, period, lastIndex, gaps, ordered = row
+        return cls(chainIndex, [(0, firstTime, period)] + unpack_gaps(gaps), lastIndex, bool(ordered))
+
+    def to_row(self):
+        _, firstTime, period = self.segments[0]
+        return (self.chainIndex, firstTime, period, self.lastIndex, pack_gaps(self.gaps), int(self.ordered))
+
+    @property
+    def firstTime(self):
+        return self.times[0]
+
+    @property
+    def lastTime(self):
+        return self.time(self.lastIndex)
+
+    @property
+    def gaps(self):
+        return self.segments[1:]
+
+    def time(self, pulseIndex):
+        """
+        Time of a pulse of the chain
+        """
+        start, time, period = self.segments[bisect_right(self.starts, pulseIndex) - 1]
+        return time + (pulseIndex - start) * period
+
+    def append(self, pulseIndex, time, period):
+        """
+        Add the next pulse of the chain
+        """
+        lastTime = self.lastTime
+        _, _, segmentPeriod = self.segments[-1]
+        if pulseIndex != self.lastIndex + 1 or time <= lastTime or period <= 0:
+            self.ordered = False
+        if period != segmentPeriod or time != lastTime + segmentPeriod:
+            self.segments.append((pulseIndex, time, period))
+            self.starts.append(pulseIndex)
+            self.times.append(time)
+        self.lastIndex = pulseIndex
+
+    def countBefore(self, time):
+        """
+        The number of pulses of an ordered chain before a time
+        """
+        # the last segment starting before that time
+        i = bisect_left(self.times, time) - 1
+        if i < 0:
+            return 0
+        start, segmentTime, period = self.segments[i]
+        end = self.starts[i + 1] if i + 1 < len(self.starts) else self.lastIndex + 1
+        # ceil((time - segmentTime) / period) pulses of the segment
+        return min(start - (segmentTime - time) // period, end)
+
+class TableCatalog:
+    """
+    The chains of a pulse table, ordered by time. Only searchable (ordered) if each chain
+    is ordered and starts after the previous one ended. The lookups give the
+    (chainIndex, pulseIndex, time) of a pulse, or None if there is no such pulse
+    """
+    def __init__(self, chains):
+        self.chains = sorted(chains, key=lambda chain: chain.firstTime)
+        self.firstTimes = [chain.firstTime for chain in self.chains]
+        self.ordered = all(chain.ordered for chain in self.chains) and all(
+            previous.lastTime < chain.firstTime for previous, chain in zip(self.chains, self.chains[1:])
+        )
+
+    def atOrAfter(self, time):
+        """
+        The first pulse at or after a time
+        """
+        # in the last chain starting at or before that time, or the first pulse of the next one
+        i = max(bisect_right(self.firstTimes, time) - 1, 0)
+        for chain in self.chains[i:i + 2]:
+            index = chain.countBefore(time)
+            if index <= chain.lastIndex:
+                return (chain.chainIndex, index, chain.time(index))
+        return None
+
+    def after(self, time):
+        """
+        The first pulse after a time
+        """
+        return self.atOrAfter(time + 1)
+
+    def before(self, time):
+        """
+        The last pulse before a time
+        """
+        i = bisect_left(self.firstTimes, time) - 1
+        if i < 0:
+            return None
+        chain = self.chains[i]
+        index = chain.countBefore(time) - 1
+        return (chain.chainIndex, index, chain.time(index))
+
+    def at(self, time):
+        """
+        The pulse at exactly that time
+        """
+        found = self.atOrAfter(time)
+        if found is None or found[2] != time:
+            return None
+        return found
@@ -1,7 +1,13 @@
+import os
 from datetime import timedelta
 
-BEACON_VERSION='1.0'
-CYPHER_SUITE=0 # '0: SHA512 hashing and RSA signatures with PKCSv1.5 padding'
+# 1.1: the external fields are signed (see beacon_shared/pulse.py)
+BEACON_VERSION='1.1'
+# see cypher_suites.py
+# 0: SHA512 hashing and RSA signatures with PKCSv1.5 padding
+# 1: SHA512 hashing and Ed25519 signatures of the digest
+# 2: SHA512 hashing and ECDSA signatures on curve P-384
+CYPHER_SUITE=int(os.getenv('CYPHER_SUITE', 0))
 SKIP_LIST_LAYER_SIZE=27
 SKIP_LIST_NUM_LAYERS=5
 
@@ -12,3 +18,35 @@ TIMINGS={
     "max_local_skew_behind": timedelta(seconds=0.5),
     "max_local_skew_ahead": timedelta(seconds=0.5)
 }
+
+# chains with a period up to this are high rate: they only log a summary
+# of the released pulses every STATUS_INTERVAL (see PulseScheduler)
+HIGH_RATE_PERIOD = timedelta(seconds=1)
+STATUS_INTERVAL = timedelta(seconds=10)
+
+# proportions of the high rate timings: most of the period to generate the
+# pulse, as the 1/10 of TIMINGS leaves no room for scheduling noise at 10Hz
+HIGH_RATE_TIMINGS={
+    "period": timedelta(seconds=1),
+    "anticipation": timedelta(seconds=0.7),
+    "delay": timedelta(seconds=0.1),
+    "max_local_skew_behind": timedelta(seconds=0.05),
+    "max_local_skew_ahead": timedelta(seconds=0.05)
+}
+
+# the chain profile of the original pulse table and uri path (see beacon/multi_chain.py)
+DEFAULT_PROFILE='default'
+
+def profile_names(config):
+    """
+    The profile names of a BEACON_PROFILES list of `<name>:<period in seconds>`
+    """
+    return [spec.split(':', 1)[0].strip() for spec in config.split(',') if spec.strip()]
+
+def scaled_timings(period):
+    """
+    TIMINGS (or HIGH_RATE_TIMINGS for high rate chains) scaled to another period
+    """
+    timings = HIGH_RATE_TIMINGS if period <= HIGH_RATE_PERIOD else TIMINGS
+    scale = period / timings['period']
+    return { key: value * scale for key, value in timings.items() }
@@ -0,0 +1,98 @@
+"""
+Cypher suites (the `cypherSuite` pulse field).
+
+A cypher suite defines how the digest of the signed pulse fields is
+signed and verified. Signers and verifiers look the suite up by the
+pulse's `cypherSuite` value with get_cypher_suite().
+
+All suites hash with SHA512 (see hashing.py), so the PulseDigest
+is shared by every suite.
+"""
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ec, ed25519, utils
+
+class CypherSuite:
+    id = None
+    description = None
+    # hash used to produce the signed digest
+    hash_strategy = hashes.SHA512()
+    # hash used when signing the X.509 certificate
+    certificate_hash_strategy = hashes.SHA512()
+
+    def generate_private_key(self):
+        raise NotImplementedError()
+
+    def sign_digest(self, private_key, digest):
+        raise NotImplementedError()
+
+    def verify_digest(self, public_key, signature, digest):
+        """
+        raises cryptography.exceptions.InvalidSignature if the signature does not match
+        """
+        raise NotImplementedError()
+
+class RSAPKCS1v15Suite(CypherSuite):
+    id = 0
+    description = 'SHA512 hashing and RSA signatures with PKCSv1.5 padding'
+
+    def generate_private_key(self):
+        return rsa.generate_private_key(public_exponent=0x10001, key_size=2048, backend=default_backend())
+
+    def sign_digest(self, private_key, digest):
+        return private_key.sign(
+            digest,
+            padding.PKCS1v15(),
+            utils.Prehashed(self.hash_strategy)
+        )
+
+    def verify_digest(self, public_key, signature, digest):
+        public_key.verify(
+            signature,
+            digest,
+            padding.PKCS1v15(),
+            utils.Prehashed(self.hash_strategy)
+        )
+
+class Ed25519Suite(CypherSuite):
+    id = 1
+    description = 'SHA512 hashing and Ed25519 signatures of the digest'
+    # Ed25519 does not take a separate hash algorithm
+    certificate_hash_strategy = None
+
+    def generate_private_key(self):
+        return ed25519.Ed25519PrivateKey.generate()
+
+    def sign_digest(self, private_key, digest):
+        # the message signed is the SHA512 digest itself
+        return private_key.sign(digest)
+
+    def verify_digest(self, public_key, signature, digest):
+        public_key.verify(signature, digest)
+
+class ECDSAP384Suite(CypherSuite):
+    id = 2
+    description = 'SHA512 hashing and ECDSA signatures on curve P-384'
+
+    def generate_private_key(self):
+        return ec.generate_private_key(ec.SECP384R1(), default_backend())
+
+    def sign_digest(self, private_key, digest):
+        return private_key.sign(digest, ec.ECDSA(utils.Prehashed(self.hash_strategy)))
+
+    def verify_digest(self, public_key, signature, digest):
+        public_key.verify(signature, digest, ec.ECDSA(utils.Prehashed(self.hash_strategy)))
+
+CYPHER_SUITES = {
+    suite.id: suite for suite in [
+        RSAPKCS1v15Suite(),
+        Ed25519Suite(),
+        ECDSAP384Suite()
+    ]
+}
+
+def get_cypher_suite(suite_id):
+    suite = CYPHER_SUITES.get(suite_id)
+    if suite is None:
+        raise ValueError('Unknown cypher suite {}'.format(suite_id))
+    return suite
@@ -1,6 +1,6 @@
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
-from beacon_shared.serialization import serialize_field_value
+from beacon_shared.serialization import serialize_field_value, encode_uint32, encode_bytes
 
 DEFAULT_HASH_STRATEGY = hashes.SHA512()
 
@@ -14,3 +14,64 @@ def hash(value, hash_strategy = DEFAULT_HASH_STRATEGY):
     hasher = hashes.Hash(hash_strategy, default_backend())
     hasher.update(serialize_field_value(value))
     return hasher.finalize()
+
+def hash_bytes(data, hash_strategy = DEFAULT_HASH_STRATEGY):
+    hasher = hashes.Hash(hash_strategy, default_backend())
+    hasher.update(data)
+    return hasher.finalize()
+
+class PulseDigest:
+    """
+    Incremental digest of a pulse that shares the hash state between
+    the signature and the output value.
+
+    The serialized fields before `statusCode` are fed into the hash once.
+    The state is then copied and extended with the status code (signature
+    boundary) and then with the signature (output value boundary), so
+    changing the status (eg: a late pulse) only rehashes from `statusCode`
+    onward.
+
+    prefix - serialization of the pulse fields up until `statusCode`
+    """
+    def __init__(self, prefix, status_code = None, hash_strategy = DEFAULT_HASH_STRATEGY):
+        self.prefix_state = hashes.Hash(hash_strategy, default_backend())
+        self.prefix_state.update(prefix)
+        self.signed_state = None
+        if status_code is not None:
+            self.set_status(status_code)
+
+    def set_status(self, status_code):
+        """
+        (Re)compute the signature boundary for the given status code
+        """
+        state = self.prefix_state.copy()
+        state.update(encode_uint32(status_code))
+        self.signed_state = state
+
+    def with_status(self, status_code):
+        """
+        New digest of the same pulse fields with a different status code.
+        The prefix hash state is shared (it is only ever copied)
+        """
+        digest = PulseDigest.__new__(PulseDigest)
+        digest.prefix_state = self.prefix_state
+        digest.set_status(status_code)
+        return digest
+
+    def signature_digest(self):
+        """
+        Digest of the fields covered by the signature (up until `signatureValue`)
+        """
+        if self.signed_state is None:
+            raise ValueError('Pulse status has not been set on the digest')
+        return self.signed_state.copy().finalize()
+
+    def output_value(self, signature):
+        """
+        Digest of the fields up until `outputValue`, using the provided signature
+        """
+        if self.signed_state is None:
+            raise ValueError('Pulse status has not been set on the digest')
+        state = self.signed_state.copy()
+        state.update(encode_bytes(signature))
+        return state.finalize()
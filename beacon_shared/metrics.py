@@ -0,0 +1,204 @@
+"""
+Minimal in-process metrics (counters, histograms and streaming quantiles)
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+# default histogram buckets (seconds), roughly logarithmic from 10us to 60s
+DEFAULT_BUCKETS = [
+    0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1, 2.5, 5,
+    10, 30, 60
+]
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n = 1):
+        with self.lock:
+            self.value += n
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+class Histogram:
+    """
+    Fixed bucket histogram. Quantiles are estimated by linear
+    interpolation inside the bucket.
+    """
+    def __init__(self, name, buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = list(buckets)
+        # last count is the overflow bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        with self.lock:
+            if self.count == 0:
+                return None
+            rank = q * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                if c == 0:
+                    continue
+                if seen + c >= rank:
+                    lower = self.buckets[i - 1] if i > 0 else self.min
+                    upper = self.buckets[i] if i < len(self.buckets) else self.max
+                    lower = max(lower, self.min)
+                    upper = min(upper, self.max)
+                    return lower + (upper - lower) * (rank - seen) / c
+                seen += c
+            return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": list(zip(self.buckets + ['+Inf'], self.counts))
+        }
+
+class P2Quantile:
+    """
+    Streaming estimate of the q quantile with the P-square algorithm
+    (Jain and Chlamtac, 1985): five markers whose heights are adjusted
+    with a piecewise parabolic fit, in constant memory and time.
+    """
+    def __init__(self, name, q):
+        self.name = name
+        self.q = q
+        self.count = 0
+        # marker heights, actual and desired positions (1 based)
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            h = self.heights
+            if len(h) < 5:
+                insort(h, value)
+                return
+
+            if value < h[0]:
+                h[0] = value
+                k = 0
+            elif value >= h[4]:
+                h[4] = value
+                k = 3
+            else:
+                # h[k] <= value < h[k + 1]
+                k = bisect_right(h, value, 1, 4) - 1
+            for i in range(k + 1, 5):
+                self.positions[i] += 1
+            for i in range(5):
+                self.desired[i] += self.increments[i]
+
+            n = self.positions
+            for i in (1, 2, 3):
+                d = self.desired[i] - n[i]
+                if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                    d = 1 if d > 0 else -1
+                    height = self.parabolic(i, d)
+                    if not h[i - 1] < height < h[i + 1]:
+                        height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                    h[i] = height
+                    n[i] += d
+
+    def parabolic(self, i, d):
+        h = self.heights
+        n = self.positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            if self.count < 5:
+                # exact quantile of the first values
+                return self.heights[round(self.q * (self.count - 1))]
+            return self.heights[2]
+
+    def snapshot(self):
+        return {
+            "q": self.q,
+            "count": self.count,
+            "value": self.value()
+        }
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get_or_create(self, cls, name, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise TypeError('Metric "{}" is already registered as a {}'.format(name, type(metric).__name__))
+            return metric
+
+    def counter(self, name):
+        return self.get_or_create(Counter, name)
+
+    def gauge(self, name):
+        return self.get_or_create(Gauge, name)
+
+    def histogram(self, name, buckets = DEFAULT_BUCKETS):
+        return self.get_or_create(Histogram, name, buckets)
+
+    def p2_quantile(self, name, q):
+        return self.get_or_create(P2Quantile, name, q)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return { m.name: m.snapshot() for m in metrics }
+
+# process wide registry
+METRICS = MetricsRegistry()
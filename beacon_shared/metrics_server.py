@@ -0,0 +1,59 @@
+"""
+Local metrics endpoint.
+
+GET /metrics - METRICS snapshot (JSON), with the spans exported first
+GET /spans - spans still in the trace buffer (JSON lines)
+"""
+import json
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from .metrics import METRICS
+from .tracing import span_to_json
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    exporter - the SpanExporter of the process
+    port - 0 picks a free port
+    """
+    daemon_threads = True
+
+    def __init__(self, exporter, port = 0, host = '127.0.0.1'):
+        self.exporter = exporter
+        super().__init__((host, port), MetricsHandler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address[:2])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.server.exporter.export()
+            body = json.dumps(METRICS.snapshot()).encode()
+            content_type = 'application/json'
+        elif self.path == '/spans':
+            entries, _ = self.server.exporter.tracer.ring.read()
+            body = ''.join(span_to_json(seq, span) + '\n' for seq, span in entries).encode()
+            content_type = 'application/x-ndjson'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,199 @@
+"""
+Online migration of the version 1 pulse tables to version 2 (see PULSE_TABLE_VERSION in store.py).
+
+The rows are copied in batches, each in its own short transaction, into
+a <table>_v2 table while the beacon and the API keep running (WAL mode:
+readers aren't blocked, the writer waits for one batch at most). The
+rows inserted meanwhile are then copied and the tables swapped in one
+transaction holding the write lock. The old table is kept as <table>_v1
+unless --drop is given. The stores notice the new layout on their next
+query (see BeaconStore.tableVersion). The chain catalog of the table (see
+chain_catalog.py) is then built.
+
+The skiplist anchors of the version 2 tables (migrated or not) are then
+stored by reference where the referenced pulses match (see
+get_anchor_references in store.py), and --check verifies them.
+
+usage: python3 -m beacon_shared.migrate [--db beacon.db] [--table beacon_records ...] [--batch 1000] [--drop] [--check]
+"""
+import time
+import argparse
+from datetime import datetime
+from .pulse import PULSE_KEYS
+from .store import (
+    BeaconStore, connect, from_row, from_row_v2, to_row_v2, to_epoch, create_pulse_table_v2, get_table_version,
+    get_anchor_references, pack_anchor_references, BEACON_DB_PATH
+)
+
+MIGRATE_BATCH_SIZE = 1000
+
+_COLUMNS = PULSE_KEYS + ['releasedAt', 'releaseError']
+
+def get_pulse_tables(con, version):
+    """
+    The pulse tables of the database with that layout version
+    """
+    names = [row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return [
+        name for name in names
+        if not name.endswith('_v1') and get_table_version(con, name) == version
+        # not the certificates and checkpoints tables
+        and 'outputValue' in set(row[1] for row in con.execute('PRAGMA table_info({})'.format(name)))
+    ]
+
+def get_v1_tables(con):
+    return get_pulse_tables(con, 1)
+
+def get_v2_tables(con):
+    return get_pulse_tables(con, 2)
+
+def convert_row(row):
+    """
+    Version 1 row (id, pulse columns, releasedAt, releaseError) to version 2
+    """
+    releasedAt, releaseError = row[-2:]
+    pulse = from_row(row[1:-2])
+    return to_row_v2(pulse) + (None if releasedAt is None else to_epoch(datetime.fromisoformat(releasedAt)), releaseError)
+
+def copy_rows(con, table, staging, after, batch):
+    """
+    Copy up to `batch` rows with an id greater than `after`. Returns the number of rows and the last id
+    """
+    rows = con.execute('SELECT id, {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?'.format(
+        columns = ', '.join(_COLUMNS),
+        table = table
+    ), (after, batch)).fetchall()
+    if not rows:
+        return 0, after
+    con.executemany('INSERT INTO {staging}({columns}) VALUES ({placeholders})'.format(
+        staging = staging,
+        columns = ', '.join(_COLUMNS),
+        placeholders = ', '.join(['?'] * len(_COLUMNS))
+    ), [convert_row(row) for row in rows])
+    return len(rows), rows[-1][0]
+
+def migrate_table(con, table, batch = MIGRATE_BATCH_SIZE, drop = False, progress = None):
+    """
+    Migrate a version 1 pulse table. Returns the number of pulses copied
+    con - a connection in autocommit mode (isolation_level None)
+    progress - Optional function called with the number of pulses copied so far
+    """
+    staging = table + '_v2'
+    # a table never opened since the release columns were added
+    BeaconStore(connection=con, table=table).addMissingColumns(con.cursor())
+    # start over if a previous migration was interrupted
+    con.execute('DROP TABLE IF EXISTS {}'.format(staging))
+    create_pulse_table_v2(con, staging, '{}_time'.format(table))
+
+    copied = 0
+    last_id = 0
+    while True:
+        con.execute('BEGIN IMMEDIATE')
+        n, last_id = copy_rows(con, table, staging, last_id, batch)
+        con.execute('COMMIT')
+        copied += n
+        if progress is not None:
+            progress(copied)
+        if n < batch:
+            break
+
+    # catch up with the pulses released meanwhile and swap, holding the write lock
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        while True:
+            n, last_id = copy_rows(con, table, staging, last_id, batch)
+            copied += n
+            if n < batch:
+                break
+        con.execute('ALTER TABLE {table} RENAME TO {table}_v1'.format(table=table))
+        con.execute('ALTER TABLE {staging} RENAME TO {table}'.format(staging=staging, table=table))
+        if drop:
+            con.execute('DROP TABLE {}_v1'.format(table))
+        con.execute('COMMIT')
+    except Exception:
+        con.execute('ROLLBACK')
+        raise
+    # in its own transaction, including the pulses released since the swap
+    BeaconStore(connection=con, table=table).buildCatalog()
+    return copied
+
+def compact_anchors(store, batch = MIGRATE_BATCH_SIZE, progress = None):
+    """
+    Store by reference the anchors of the pulses of a version 2 table stored as they are
+    (eg: migrated), when the referenced pulses match. Returns the number of pulses compacted
+    store - on a connection in autocommit mode
+    """
+    con = store.dbConnection
+    compacted = 0
+    after = (-1, -1)
+    while True:
+        rows = con.execute(' '.join((
+            'SELECT {fields} FROM {tableName}',
+            'WHERE skipListAnchorRefs IS NULL AND (chainIndex, pulseIndex) > (?, ?)',
+            'ORDER BY chainIndex, pulseIndex LIMIT ?'
+        )).format(
+            tableName = store.table,
+            fields = ', '.join(PULSE_KEYS)
+        ), after + (batch,)).fetchall()
+        if not rows:
+            return compacted
+        pulses = [from_row_v2(row) for row in rows]
+        after = (pulses[-1].chainIndex, pulses[-1].pulseIndex)
+
+        references = [get_anchor_references(pulse) for pulse in pulses]
+        wanted = {}
+        for pulse, refs in zip(pulses, references):
+            if refs is not None:
+                wanted.setdefault(pulse.chainIndex, set()).update(refs)
+        con.execute('BEGIN IMMEDIATE')
+        outputs = { chain: store.fetchOutputValues(chain, ids) for chain, ids in wanted.items() }
+        updates = [
+            (pack_anchor_references(refs), pulse.chainIndex, pulse.pulseIndex)
+            for pulse, refs in zip(pulses, references)
+            if refs is not None and all(outputs[pulse.chainIndex].get(i) == anchor for i, anchor in zip(refs, pulse.skipListAnchors))
+        ]
+        con.executemany(
+            "UPDATE {tableName} SET skipListAnchors = x'', skipListAnchorRefs = ? WHERE chainIndex = ? AND pulseIndex = ?".format(
+                tableName = store.table
+            ),
+            updates
+        )
+        con.execute('COMMIT')
+        compacted += len(updates)
+        if progress is not None:
+            progress(compacted)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='migrate')
+    parser.add_argument('--db', default=BEACON_DB_PATH, help='database path (default: BEACON_DB_PATH)')
+    parser.add_argument('--table', action='append', help='pulse table to migrate (default: every version 1 table)')
+    parser.add_argument('--batch', type=int, default=MIGRATE_BATCH_SIZE, help='pulses copied per transaction')
+    parser.add_argument('--drop', action='store_true', help='drop the version 1 tables once migrated')
+    parser.add_argument('--check', action='store_true', help='verify the anchors stored by reference')
+    args = parser.parse_args(argv)
+
+    con = connect(args.db)
+    con.isolation_level = None
+    try:
+        tables = args.table or get_v1_tables(con)
+        for table in tables:
+            if get_table_version(con, table) != 1:
+                print('{}: not a version 1 pulse table, skipped'.format(table))
+                continue
+            started_at = time.perf_counter()
+            copied = migrate_table(con, table, args.batch, args.drop, lambda n: print('{}: {} pulses'.format(table, n), end='\r', flush=True))
+            print('{}: {} pulses migrated in {:.1f}s'.format(table, copied, time.perf_counter() - started_at))
+        for table in args.table or get_v2_tables(con):
+            store = BeaconStore(connection=con, table=table)
+            compacted = compact_anchors(store, args.batch, lambda n: print('{}: {} anchors'.format(table, n), end='\r', flush=True))
+            print('{}: anchors of {} pulses stored by reference'.format(table, compacted))
+            if args.check:
+                invalid = list(store.checkAnchors(args.batch))
+                print('{}: {} pulses with invalid anchors {}'.format(table, len(invalid), invalid[:10]))
+                if invalid:
+                    exit(1)
+    finally:
+        con.close()
+
+if __name__ == '__main__':
+    main()
@@ -5,174 +5,310 @@ from .status_codes import *
 from .types import *
 from .config import BEACON_VERSION, CYPHER_SUITE, TIMINGS, SKIP_LIST_LAYER_SIZE, SKIP_LIST_NUM_LAYERS
 from .skiplist import getHighestLayerPower
-from .hashing import hash, hash_many
+from .serialization import PulseSerializer
+from .hashing import hash, hash_bytes, PulseDigest
+from .cypher_suites import get_cypher_suite
+from .tracing import TRACER
 
 PERIOD = TIMINGS["period"]
 
 EMPTY_HASH = '0'*128
-PULSE_KEYS = [
-    'uri',
-    'version',
-    'cypherSuite',
-    'period',
-    'certificateId',
-    'chainIndex',
-    'pulseIndex',
-    'timeStamp',
-    'localRandomValue',
-    # TODO external sources
-    # ...
-    'skipListLayerSize',
-    'skipListNumLayers',
-    'skipListAnchors',
-    'precommitmentValue',
-    'statusCode',
-    'signatureValue',
-    'outputValue'
-]
-
-
-def get_pulse_uri(chain_index, pulse_index):
+EMPTY_HASH_BYTES = bytes.fromhex(EMPTY_HASH)
+
+# the type of each pulse field, in serialization order
+PULSE_FIELD_TYPES = OrderedDict([
+    ('uri', String),
+    ('version', String),
+    ('cypherSuite', UInt32),
+    ('period', Duration),
+    ('certificateId', ByteHash),
+    ('chainIndex', UInt64),
+    ('pulseIndex', UInt64),
+    ('timeStamp', DateTime),
+    ('localRandomValue', ByteHash),
+    # external randomness (see beacon/external_sources.py)
+    ('externalSourceId', ByteHash),
+    ('externalStatusCode', UInt32),
+    ('externalValue', ByteHash),
+    ('skipListLayerSize', UInt32),
+    ('skipListNumLayers', UInt32),
+    ('skipListAnchors', SkipAnchors),
+    ('precommitmentValue', ByteHash),
+    ('statusCode', UInt32),
+    ('signatureValue', ByteHash),
+    ('outputValue', ByteHash)
+])
+PULSE_KEYS = list(PULSE_FIELD_TYPES.keys())
+PULSE_SERIALIZER = PulseSerializer(PULSE_FIELD_TYPES)
+
+# pulses of these versions were signed before the external fields existed:
+# they are left out of their serialization (the fields hold the defaults)
+PRE_EXTERNAL_VERSIONS = frozenset(['1.0'])
+EXTERNAL_FIELDS = ('externalSourceId', 'externalStatusCode', 'externalValue')
+PRE_EXTERNAL_FIELD_TYPES = OrderedDict(
+    (key, T) for key, T in PULSE_FIELD_TYPES.items() if key not in EXTERNAL_FIELDS
+)
+PRE_EXTERNAL_SERIALIZER = PulseSerializer(PRE_EXTERNAL_FIELD_TYPES)
+
+# values of the external fields when no external value is included
+NO_EXTERNAL_VALUE = (EMPTY_HASH_BYTES, EXTERNAL_STATUS_NONE, EMPTY_HASH_BYTES)
+# used for fields missing from pulses produced before they existed
+PULSE_FIELD_DEFAULTS = {
+    'externalSourceId': EMPTY_HASH,
+    'externalStatusCode': EXTERNAL_STATUS_NONE,
+    'externalValue': EMPTY_HASH
+}
+
+
+def get_pulse_uri(chain_index, pulse_index, path = '/api'):
     return "https://{domain}{path}/{version}/chain/{chain_index}/pulse/{pulse_index}".format(
         domain='beacon-prototype.nist.gov',
-        path='/api',
+        path=path,
         version=BEACON_VERSION,
         chain_index=chain_index,
         pulse_index=pulse_index
     )
 
+class Pulse:
+    """
+    Fixed layout pulse record.
+
+    Fields are stored as raw python values (str, int, bytes, datetime,
+    timedelta and a list of bytes for the skiplist anchors) and are
+    accessed as attributes, eg: `pulse.pulseIndex`.
+
+    Mapping style access (`pulse['pulseIndex'].get()`) is still supported
+    for compatibility. Item lookup returns a new BeaconType wrapper around
+    the raw value, so modifications must be done by item assignment
+    (`pulse['statusCode'] = 2`) rather than through the wrapper's set().
+    """
+    __slots__ = tuple(PULSE_KEYS)
+
+    def __init__(self, fields = None):
+        if fields is None:
+            return
+        for key, T in PULSE_FIELD_TYPES.items():
+            setattr(self, key, T.parse(fields[key]))
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Create a pulse from raw values given in PULSE_KEYS order.
+        No conversion is done.
+        """
+        pulse = cls()
+        for key, value in zip(PULSE_KEYS, values):
+            setattr(pulse, key, value)
+        return pulse
+
+    def values(self):
+        """
+        Raw values in PULSE_KEYS order
+        """
+        return [getattr(self, key) for key in PULSE_KEYS]
+
+    def copy(self):
+        pulse = Pulse.from_values(self.values())
+        pulse.skipListAnchors = list(self.skipListAnchors)
+        return pulse
+
+    # mapping compatibility
+    def keys(self):
+        return list(PULSE_KEYS)
+
+    def items(self):
+        return [(key, self[key]) for key in PULSE_KEYS]
+
+    def __iter__(self):
+        return iter(PULSE_KEYS)
+
+    def __len__(self):
+        return len(PULSE_KEYS)
+
+    def __contains__(self, key):
+        return key in PULSE_FIELD_TYPES
+
+    def __getitem__(self, key):
+        if key not in PULSE_FIELD_TYPES:
+            raise KeyError(key)
+        return PULSE_FIELD_TYPES[key](getattr(self, key))
+
+    def __setitem__(self, key, value):
+        if key not in PULSE_FIELD_TYPES:
+            raise KeyError(key)
+        setattr(self, key, PULSE_FIELD_TYPES[key].parse(value))
+
+    def __eq__(self, other):
+        if not isinstance(other, Pulse):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self):
+        return 'Pulse(chainIndex={}, pulseIndex={})'.format(self.chainIndex, self.pulseIndex)
+
 def pulse_from_dict(fields):
-    return OrderedDict([
-        ('uri', String(fields['uri'])),
-        ('version', String(fields['version'])),
-        ('cypherSuite', UInt32(fields['cypherSuite'])),
-        ('period', Duration(fields['period'])),
-        ('certificateId', ByteHash(fields['certificateId'])),
-        ('chainIndex', UInt64(fields['chainIndex'])),
-        ('pulseIndex', UInt64(fields['pulseIndex'])),
-        ('timeStamp', DateTime(fields['timeStamp'])),
-        ('localRandomValue', ByteHash(fields['localRandomValue'])),
-        # TODO external sources
-        # ...
-        ('skipListLayerSize', UInt32(fields['skipListLayerSize'])),
-        ('skipListNumLayers', UInt32(fields['skipListNumLayers'])),
-        ('skipListAnchors', SkipAnchors(fields['skipListAnchors'])),
-        ('precommitmentValue', ByteHash(fields['precommitmentValue'])),
-        ('statusCode', UInt32(fields['statusCode'])),
-        ('signatureValue', ByteHash(fields['signatureValue'])),
-        ('outputValue', ByteHash(fields['outputValue']))
-    ])
+    if any(key not in fields for key in PULSE_FIELD_DEFAULTS):
+        fields = dict(PULSE_FIELD_DEFAULTS, **fields)
+    return Pulse(fields)
+
+def get_serialized_field_types(pulse):
+    """
+    The fields serialized for the version of the pulse, in order
+    """
+    if pulse.version in PRE_EXTERNAL_VERSIONS:
+        return PRE_EXTERNAL_FIELD_TYPES
+    return PULSE_FIELD_TYPES
 
 # get values from the pulse, in order, up until specified field
 def get_pulse_values(pulse, until_field = None):
     pulse_values = []
-    for key, value in pulse.items():
+    for key, T in get_serialized_field_types(pulse).items():
         if key == until_field:
             break
-        pulse_values.append(value)
+        pulse_values.append(T(getattr(pulse, key)))
     return pulse_values
 
+def serialize_pulse(pulse, until_field = None):
+    """
+    Serialize (Ref 4.1.2) the pulse fields of its version, in order, up until specified field.
+    Returns a SerializedPulse whose views can be passed to the signer and hasher
+    """
+    if pulse.version in PRE_EXTERNAL_VERSIONS:
+        return PRE_EXTERNAL_SERIALIZER.pack(pulse, until_field)
+    return PULSE_SERIALIZER.pack(pulse, until_field)
+
 def get_pulse_hash(pulse, until_field = None):
-    return hash_many(get_pulse_values(pulse, until_field))
+    return hash_bytes(serialize_pulse(pulse, until_field).view())
 
 def get_skip_list_anchors(previous_pulse):
 
     if previous_pulse is None:
-        return SkipAnchors([EMPTY_HASH] * SKIP_LIST_NUM_LAYERS)
+        return [EMPTY_HASH_BYTES] * SKIP_LIST_NUM_LAYERS
 
     n = 1 + getHighestLayerPower(
-        previous_pulse['skipListLayerSize'].get(),
-        previous_pulse['skipListNumLayers'].get(),
-        previous_pulse['pulseIndex'].get()
+        previous_pulse.skipListLayerSize,
+        previous_pulse.skipListNumLayers,
+        previous_pulse.pulseIndex
     )
 
     # first n values are previous pulse's output value
-    hashes = [ previous_pulse['outputValue'] ] * n
+    hashes = [ previous_pulse.outputValue ] * n
     # the rest are the existing layer anchors
-    hashes += (previous_pulse['skipListAnchors'].get())[n:]
-    return SkipAnchors(hashes)
+    hashes += previous_pulse.skipListAnchors[n:]
+    return hashes
 
 def set_pulse_status(pulse, *statuses):
-    code = pulse['statusCode'].get()
+    code = pulse.statusCode
     for s in statuses:
         code = code | s
-    pulse['statusCode'].set(code)
+    pulse.statusCode = code
 
 def get_pulse_output_value(pulse):
     """
     Get the pulse output value.
     TODO: this should apply recommendation 8.3.1
     """
-    return ByteHash(get_pulse_hash(pulse, 'outputValue'))
+    return get_pulse_hash(pulse, 'outputValue')
 
-def assemble_pulse(chain_index, local_random_value, next_local_random_value, previous_pulse):
+def assemble_pulse(chain_index, local_random_value, next_local_random_value, previous_pulse, external = NO_EXTERNAL_VALUE, period = PERIOD, now = None, path = '/api'):
     """
     Fully assemble a pulse based on the previous pulse, provided random value,
     and the chain index.
+    external - the (externalSourceId, externalStatusCode, externalValue) fields
+    now - the current time, used for the first pulse of a chain. Defaults to datetime.now()
+    path - path of the pulse uri (see get_pulse_uri)
     """
-    global EMPTY_HASH
+    external_source_id, external_status_code, external_value = external
     # meta information
     # Pulse index starts at zero
     pulse_index = 0
-    last_time = datetime.now() - PERIOD
+    last_time = (datetime.now() if now is None else now) - period
     status_code = STATUS_NO_PRIOR_PRECOMMIT
-    certId = EMPTY_HASH
+    certId = EMPTY_HASH_BYTES
 
     if previous_pulse != None:
         # otherwise this should be the start of a new chain
-        if previous_pulse['chainIndex'].get() != chain_index:
+        if previous_pulse.chainIndex != chain_index:
             raise ValueError("Chain index provided does not match previous pulse!")
 
-        pulse_index = previous_pulse['pulseIndex'].get() + 1
-        last_time = previous_pulse['timeStamp'].get()
+        pulse_index = previous_pulse.pulseIndex + 1
+        last_time = previous_pulse.timeStamp
         status_code = STATUS_OK
-        certId = previous_pulse['certificateId']
-
-    time_stamp = last_time + PERIOD
-
-    pulse = pulse_from_dict({
-        'uri': get_pulse_uri(chain_index, pulse_index),
-        'version': BEACON_VERSION,
-        'cypherSuite': CYPHER_SUITE,
-        'period': PERIOD,
-        'certificateId': certId,
-        'chainIndex': chain_index,
-        'pulseIndex': pulse_index,
-        'timeStamp': time_stamp,
-        'localRandomValue': local_random_value,
-        # TODO external sources
-        # ...
-        'skipListLayerSize': SKIP_LIST_LAYER_SIZE,
-        'skipListNumLayers': SKIP_LIST_NUM_LAYERS,
-        'skipListAnchors': get_skip_list_anchors(previous_pulse),
-        'precommitmentValue': ByteHash(hash(next_local_random_value)),
-        'statusCode': status_code,
-        'signatureValue': EMPTY_HASH, # set later
-        'outputValue': EMPTY_HASH # set later
-    })
+        certId = previous_pulse.certificateId
 
-    return pulse
+    time_stamp = last_time + period
 
-def sign_pulse(signer, pulse):
-    prevCert = pulse['certificateId'].get()
+    return Pulse.from_values([
+        get_pulse_uri(chain_index, pulse_index, path), # uri
+        BEACON_VERSION, # version
+        CYPHER_SUITE, # cypherSuite
+        period, # period
+        certId, # certificateId
+        chain_index, # chainIndex
+        pulse_index, # pulseIndex
+        time_stamp, # timeStamp
+        ByteHash.parse(local_random_value), # localRandomValue
+        external_source_id, # externalSourceId
+        external_status_code, # externalStatusCode
+        external_value, # externalValue
+        SKIP_LIST_LAYER_SIZE, # skipListLayerSize
+        SKIP_LIST_NUM_LAYERS, # skipListNumLayers
+        get_skip_list_anchors(previous_pulse), # skipListAnchors
+        hash(ByteHash(next_local_random_value)), # precommitmentValue
+        status_code, # statusCode
+        EMPTY_HASH_BYTES, # signatureValue, set later
+        EMPTY_HASH_BYTES # outputValue, set later
+    ])
+
+def get_pulse_digest(pulse):
+    """
+    Create a PulseDigest from the pulse fields before `statusCode`
+    """
+    with TRACER.span('serialize'):
+        prefix = serialize_pulse(pulse, 'statusCode').view()
+        return PulseDigest(prefix, pulse.statusCode)
+
+def prepare_pulse_digest(signer, pulse):
+    """
+    Set the signer's certificate and cypher suite on the pulse and create its digest.
+    The digest can be reused to (re)sign the pulse if only the status changes.
+    """
+    pulse.cypherSuite = signer.get_cypher_suite_id()
+    prevCert = pulse.certificateId
     certId = signer.get_certificate_id()
-    pulse['certificateId'].set(certId)
+    pulse.certificateId = certId
 
-    if prevCert != certId and prevCert != EMPTY_HASH:
+    if prevCert != certId and prevCert != EMPTY_HASH_BYTES:
         # different cert id, so set status
         set_pulse_status(pulse, STATUS_CERT_ID_CHANGE)
 
-    values_to_sign = get_pulse_values(pulse, 'signatureValue')
-    pulse['signatureValue'] = ByteHash(signer.sign_values(values_to_sign))
-    pulse['outputValue'] = get_pulse_output_value(pulse)
+    return get_pulse_digest(pulse)
+
+def sign_pulse_digest(signer, pulse, digest, deadline = None):
+    """
+    Sign the pulse and set its output value from a prepared digest.
+    Only the fields from `statusCode` onward are rehashed.
+    The deadline (datetime) after which the signature is useless is passed to the signer.
+    """
+    digest.set_status(pulse.statusCode)
+    pulse.signatureValue = signer.sign_digest(digest.signature_digest(), deadline)
+    with TRACER.span('output_hash'):
+        pulse.outputValue = digest.output_value(pulse.signatureValue)
     return pulse
 
+def sign_pulse(signer, pulse):
+    digest = prepare_pulse_digest(signer, pulse)
+    return sign_pulse_digest(signer, pulse, digest)
+
 # helpful for preparing a pulse for transit, or encoding to json
 def pulse_to_plain_dict(pulse):
-    return { key: value.get_json_value() for key, value in pulse.items() }
+    return { key: T.to_json(getattr(pulse, key)) for key, T in PULSE_FIELD_TYPES.items() }
 
 class PulseJSONEncoder(json.JSONEncoder):
     def default(self, value):
+        if isinstance(value, Pulse):
+            return pulse_to_plain_dict(value)
+
         if isinstance(value, BeaconType):
             return value.get_json_value()
 
@@ -187,18 +323,35 @@ def pulse_to_json(pulse, **kwargs):
 class PulseChainException(Exception):
     pass
 
+class PulseOutputValueException(Exception):
+    pass
+
+def verify_pulse(pulse, public_key):
+    """
+    Verify the pulse signature, using the pulse's cypher suite, and its output value.
+    The signed fields are hashed once for both checks.
+
+    If the signature does not match, a cryptography InvalidSignature exception is raised.
+    """
+    suite = get_cypher_suite(pulse.cypherSuite)
+    digest = get_pulse_digest(pulse)
+    suite.verify_digest(public_key, pulse.signatureValue, digest.signature_digest())
+
+    if digest.output_value(pulse.signatureValue) != pulse.outputValue:
+        raise PulseOutputValueException('Pulse {} output value does not match'.format(pulse.pulseIndex))
+
 def assert_next_in_chain(lastPulse, currentPulse):
     # TODO make this check signatures
     if lastPulse is None:
-        if currentPulse['chainIndex'].get() != 0 or currentPulse['pulseIndex'].get() != 0:
-            raise PulseChainException('Expecting first pulse in first chain but received chain {}, pulse {}'.format(currentPulse['chainIndex'].get(), currentPulse['pulseIndex'].get()))
+        if currentPulse.chainIndex != 0 or currentPulse.pulseIndex != 0:
+            raise PulseChainException('Expecting first pulse in first chain but received chain {}, pulse {}'.format(currentPulse.chainIndex, currentPulse.pulseIndex))
         return
-    if lastPulse['chainIndex'].get() != currentPulse['chainIndex'].get():
-        if currentPulse['pulseIndex'].get() != 0:
+    if lastPulse.chainIndex != currentPulse.chainIndex:
+        if currentPulse.pulseIndex != 0:
             raise PulseChainException('Current Pulse has new chain index but is not first pulse')
     else:
-        if currentPulse['pulseIndex'].get() != lastPulse['pulseIndex'].get() + 1:
+        if currentPulse.pulseIndex != lastPulse.pulseIndex + 1:
             raise PulseChainException('Current Pulse is not next in chain')
 
-        if lastPulse['outputValue'].get() != currentPulse['skipListAnchors'].get()[0].get():
+        if lastPulse.outputValue != currentPulse.skipListAnchors[0]:
             raise PulseChainException('Previous pulse value does not match current pulse "outputValue"')
@@ -1,3 +1,7 @@
+import struct
+
+# bound on the number of distinct pulse layouts kept compiled
+MAX_COMPILED_FORMATS = 256
 
 def encode_uint64(n):
     # big endian byte encoding
@@ -18,6 +22,13 @@ def encode_str(str):
     # variable length types will have their byte length prefixed
     return encode_bytes(str.encode('utf-8')) # to byte string
 
+def pack_bytes(bstr, fmt, args):
+    # struct equivalent of encode_bytes
+    l = len(bstr)
+    fmt.append('Q%ds' % l)
+    args.append(l)
+    args.append(bstr)
+
 from .types import BeaconType
 
 # Ref: 4.1.2 Byte serialization of fields
@@ -30,3 +41,85 @@ def serialize_field_value(value):
 def concat_serialize(values):
     serialized = map(serialize_field_value, values)
     return b"".join(serialized)
+
+class SerializedPulse:
+    """
+    The Ref 4.1.2 serialization of a whole pulse held in one buffer.
+
+    view() returns zero-copy memoryview slices of the buffer
+    """
+    __slots__ = ('buffer', 'offsets')
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def view(self, until_field = None, from_field = None):
+        """
+        Serialization of the fields from the `from_field` (inclusive) up until
+        the `until_field` (not inclusive). Defaults to the whole buffer.
+        """
+        start = 0 if from_field is None else self.offsets[from_field]
+        end = len(self.buffer) if until_field is None else self.offsets[until_field]
+        return memoryview(self.buffer)[start:end]
+
+    def signed_view(self):
+        """
+        The bytes covered by the pulse signature
+        """
+        return self.view('signatureValue')
+
+    def output_view(self):
+        """
+        The bytes hashed to produce the pulse output value
+        """
+        return self.view('outputValue')
+
+class PulseSerializer:
+    """
+    Single pass serializer for whole pulses.
+
+    Every field type appends its struct format and arguments and the
+    resulting format is compiled once (and cached) into a struct.Struct
+    together with the offset of each field. The whole pulse is then
+    written into one preallocated bytearray with pack_into.
+
+    The output is byte for byte identical to concat_serialize().
+    """
+    def __init__(self, field_types):
+        self.fields = [(key, T.pack_struct) for key, T in field_types.items()]
+        self.compiled = {}
+
+    def compile(self, fmt):
+        parts = fmt.split(' ')
+        offsets = {}
+        offset = 0
+        for i, (key, _) in enumerate(self.fields):
+            offsets[key] = offset
+            if i == len(parts):
+                break
+            offset += struct.calcsize('>' + parts[i])
+        return struct.Struct('>' + fmt), offsets
+
+    def pack(self, pulse, until_field = None):
+        fmt = []
+        args = []
+        parts = []
+        for key, pack_struct in self.fields:
+            if key == until_field:
+                break
+            pack_struct(getattr(pulse, key), fmt, args)
+            parts.append(''.join(fmt))
+            fmt.clear()
+
+        key = ' '.join(parts)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            if len(self.compiled) >= MAX_COMPILED_FORMATS:
+                self.compiled.clear()
+            compiled = self.compiled[key] = self.compile(key)
+        s, offsets = compiled
+
+        buffer = bytearray(s.size)
+        s.pack_into(buffer, 0, *args)
+        return SerializedPulse(buffer, offsets)
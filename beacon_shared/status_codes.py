@@ -3,3 +3,12 @@ STATUS_NO_PRIOR_PRECOMMIT = 1
 STATUS_GAP = 2
 STATUS_CERT_ID_CHANGE = 4
 STATUS_CHAIN_END = 8
+# not part of the NIST spec: a local randomness source was left out
+STATUS_SOURCE_MISSING = 16
+
+# externalStatusCode values
+EXTERNAL_STATUS_OK = 0
+# no external value is included
+EXTERNAL_STATUS_NONE = 1
+# some external sources had no fresh value and were left out
+EXTERNAL_STATUS_PARTIAL = 2
@@ -1,86 +1,537 @@
 import os
+import copy
+import struct
 import sqlite3
-from .types import ByteHash
-from .pulse import PULSE_KEYS, pulse_to_plain_dict, pulse_from_dict, assert_next_in_chain
+import itertools
+import threading
+from datetime import datetime, timedelta
+from urllib.request import pathname2url
+from .tracing import TRACER
+from .config import DEFAULT_PROFILE
+from .chain_catalog import ChainCatalog, TableCatalog
+from .types import to_milliseconds
+from .pulse import PULSE_KEYS, PULSE_FIELD_TYPES, PULSE_FIELD_DEFAULTS, Pulse, assert_next_in_chain, get_pulse_output_value, PulseChainException
 
 BEACON_DB_PATH=os.getenv('BEACON_DB_PATH', './beacon.db')
 BEACON_DB_TABLE = 'beacon_records'
 BEACON_DB_CERT_TABLE = 'beacon_certificates'
+# latest sealed scheduler checkpoint of each pulse table (see beacon/checkpoint.py)
+BEACON_DB_CHECKPOINT_TABLE = 'beacon_checkpoints'
+# where the pulses of each chain of the version 2 pulse tables are in time (see chain_catalog.py)
+BEACON_DB_CHAIN_TABLE = 'beacon_chains'
+# bytes of the database file memory mapped by each connection
+BEACON_DB_MMAP_SIZE = int(os.getenv('BEACON_DB_MMAP_SIZE', 256 * 1024 * 1024))
+# page cache of each connection, negative: in KiB
+BEACON_DB_CACHE_SIZE = int(os.getenv('BEACON_DB_CACHE_SIZE', -16 * 1024))
+# seconds a connection waits for a lock before failing
+BEACON_DB_BUSY_TIMEOUT = 5
+# pulses per executemany of addPulses
+BEACON_DB_INSERT_CHUNK = 1000
+
+# layout of the pulse tables created by initDB (see migrate.py to convert version 1 tables)
+# 1: hashes as hex text, timestamps as ISO text, rowid primary key
+# 2: hashes as blobs, timestamps as integer epoch microseconds, (chainIndex, pulseIndex) primary key
+PULSE_TABLE_VERSION = 2
+
+_ROW_PARSERS = [T.parse for T in PULSE_FIELD_TYPES.values()]
+_ROW_ENCODERS = [T.to_json for T in PULSE_FIELD_TYPES.values()]
+_ANCHORS_COLUMN = PULSE_KEYS.index('skipListAnchors')
+_CHAIN_COLUMN = PULSE_KEYS.index('chainIndex')
+_PULSE_COLUMN = PULSE_KEYS.index('pulseIndex')
+_NUM_LAYERS_COLUMN = PULSE_KEYS.index('skipListNumLayers')
+_PERIOD_COLUMN = PULSE_KEYS.index('period')
+_TIMESTAMP_COLUMN = PULSE_KEYS.index('timeStamp')
+_EPOCH = datetime(1970, 1, 1)
+# below the default SQLITE_MAX_VARIABLE_NUMBER of older sqlite versions (999)
+_MAX_QUERY_PARAMS = 900
+_MICROSECOND = timedelta(microseconds=1)
+
+# columns added after the table was first created
+_ADDED_COLUMNS = [
+    ('externalSourceId', 'text'),
+    ('externalStatusCode', 'integer'),
+    ('externalValue', 'text')
+]
+# when each pulse was actually released and the error (seconds) against
+# timeStamp + delay. Not part of the pulse, NULL if not recorded.
+_RELEASE_COLUMNS = [
+    ('releasedAt', 'text'),
+    ('releaseError', 'real')
+]
 
 # convert sql row to pulse
+def profile_table(name):
+    """
+    The pulse table of a chain profile (see beacon/multi_chain.py)
+    """
+    if name == DEFAULT_PROFILE:
+        return BEACON_DB_TABLE
+    return '{}_{}'.format(BEACON_DB_TABLE, name)
+
 def from_row(row):
-    d = dict( zip(PULSE_KEYS, row) )
+    row = list(row)
 
     # unserialize the anchors
-    d['skipListAnchors'] = d['skipListAnchors'].split(':')
+    row[_ANCHORS_COLUMN] = row[_ANCHORS_COLUMN].split(':')
 
-    return pulse_from_dict( d )
+    return Pulse.from_values([parse(v) for parse, v in zip(_ROW_PARSERS, row)])
 
 
 # convert pulse to sql row
 def to_row( pulse ):
-    get_pulse_val = lambda k: pulse[k].get_json_value()
-    ret = list(map(get_pulse_val, PULSE_KEYS))
+    ret = [to_json(v) for to_json, v in zip(_ROW_ENCODERS, pulse.values())]
 
-    n = PULSE_KEYS.index('skipListAnchors')
     # serialize the anchors
-    ret[n] = ':'.join(ret[n])
+    ret[_ANCHORS_COLUMN] = ':'.join(ret[_ANCHORS_COLUMN])
 
     return tuple(ret)
 
-class BeaconStore:
-    def __init__(self):
-        con = None
-        try:
-            con = self.dbConnection = sqlite3.connect(BEACON_DB_PATH)
-        except Exception as e:
-            if con:
+def to_epoch(dt):
+    """
+    Integer microseconds since the epoch of a (naive, UTC) datetime. Not milliseconds:
+    the timestamps of the pulses have microseconds and are signed as they are
+    """
+    return (dt - _EPOCH) // _MICROSECOND
+
+def from_epoch(us):
+    return _EPOCH + timedelta(microseconds=us)
+
+# convert version 2 sql row to pulse
+# anchors - the skiplist anchors if stored by reference (see resolveRows)
+def from_row_v2(row, anchors = None):
+    row = list(row)
+    row[_PERIOD_COLUMN] = timedelta(milliseconds=row[_PERIOD_COLUMN])
+    row[_TIMESTAMP_COLUMN] = from_epoch(row[_TIMESTAMP_COLUMN])
+
+    if anchors is None:
+        # the anchors are concatenated hashes of the same size
+        anchors = row[_ANCHORS_COLUMN]
+        size = len(anchors) // row[_NUM_LAYERS_COLUMN]
+        anchors = [anchors[i:i + size] for i in range(0, len(anchors), size)]
+    row[_ANCHORS_COLUMN] = anchors
+
+    return Pulse.from_values(row)
+
+def get_anchor_references(pulse):
+    """
+    The pulses (of the same chain) whose outputValue are the skiplist anchors of a pulse:
+    for layer k the latest pulse before it with an index multiple of skipListLayerSize ** k
+    (see get_skip_list_anchors). None for the first pulse of a chain (no anchors yet)
+    """
+    if pulse.pulseIndex == 0:
+        return None
+    return [
+        (pulse.pulseIndex - 1) // pulse.skipListLayerSize ** k * pulse.skipListLayerSize ** k
+        for k in range(len(pulse.skipListAnchors))
+    ]
+
+def pack_anchor_references(references):
+    return struct.pack('>{}Q'.format(len(references)), *references)
+
+def unpack_anchor_references(packed):
+    return struct.unpack('>{}Q'.format(len(packed) // 8), packed)
+
+# convert pulse to version 2 sql row
+def to_row_v2(pulse):
+    ret = pulse.values()
+    ret[_PERIOD_COLUMN] = to_milliseconds(pulse.period)
+    ret[_TIMESTAMP_COLUMN] = to_epoch(pulse.timeStamp)
+
+    anchors = pulse.skipListAnchors
+    if len(anchors) != pulse.skipListNumLayers or len(set(len(a) for a in anchors)) > 1:
+        raise ValueError('Pulse {}-{}: the skiplist anchors must be skipListNumLayers hashes of the same size'.format(
+            pulse.chainIndex,
+            pulse.pulseIndex
+        ))
+    ret[_ANCHORS_COLUMN] = b''.join(anchors)
+
+    return tuple(ret)
+
+def create_pulse_table_v2(c, table, index):
+    """
+    Create a version 2 pulse table and its timeStamp index (named `index`)
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS {tableName}
+        (
+            chainIndex integer NOT NULL,
+            pulseIndex integer NOT NULL,
+            uri text NOT NULL,
+            version text NOT NULL,
+            cypherSuite integer NOT NULL,
+            period integer NOT NULL,
+            certificateId blob NOT NULL,
+            timeStamp integer NOT NULL,
+            localRandomValue blob NOT NULL,
+            externalSourceId blob NOT NULL,
+            externalStatusCode integer NOT NULL,
+            externalValue blob NOT NULL,
+            skipListLayerSize integer NOT NULL,
+            skipListNumLayers integer NOT NULL,
+            -- empty when stored by reference
+            skipListAnchors blob NOT NULL,
+            precommitmentValue blob NOT NULL,
+            statusCode integer NOT NULL,
+            signatureValue blob NOT NULL,
+            -- rejects the rows of a store which didn't notice the migration yet
+            outputValue blob NOT NULL CHECK (typeof(outputValue) = 'blob'),
+            releasedAt integer,
+            releaseError real,
+            -- the pulseIndex of the pulse of each anchor (see get_anchor_references), NULL if stored as they are
+            skipListAnchorRefs blob,
+            -- not WITHOUT ROWID: the rows (~1KB) would spill into overflow pages
+            PRIMARY KEY (chainIndex, pulseIndex)
+        )
+    """.format(
+        tableName=table
+    ))
+    c.execute('CREATE INDEX IF NOT EXISTS {index} ON {tableName} (timeStamp)'.format(tableName=table, index=index))
+    # created before the anchors were stored by reference
+    columns = set(row[1] for row in c.execute('PRAGMA table_info({tableName})'.format(tableName=table)))
+    if 'skipListAnchorRefs' not in columns:
+        c.execute('ALTER TABLE {tableName} ADD COLUMN skipListAnchorRefs blob'.format(tableName=table))
+
+def create_chain_table(c):
+    """
+    Create the chain catalog table (see ChainCatalog.from_row for the columns)
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS {tableName}
+        (
+            pulseTable text NOT NULL,
+            chainIndex integer NOT NULL,
+            -- epoch microseconds of pulse 0
+            firstTime integer NOT NULL,
+            -- microseconds
+            period integer NOT NULL,
+            lastIndex integer NOT NULL,
+            -- packed (pulseIndex, time, period) where the timestamps stop following the period
+            gaps blob NOT NULL,
+            ordered integer NOT NULL,
+            PRIMARY KEY (pulseTable, chainIndex)
+        )
+    """.format(
+        tableName=BEACON_DB_CHAIN_TABLE
+    ))
+
+def get_table_version(c, table):
+    """
+    Layout version of a pulse table (see PULSE_TABLE_VERSION), None if it doesn't exist
+    """
+    columns = set(row[1] for row in c.execute('PRAGMA table_info({tableName})'.format(tableName=table)))
+    if not columns:
+        return None
+    return 1 if 'id' in columns else 2
+
+def connect(db_path, read_only = False, check_same_thread = True):
+    """
+    Open a connection to the database in WAL mode, so that the readers and
+    the writer don't block each other, with BEACON_DB_MMAP_SIZE and BEACON_DB_CACHE_SIZE
+
+    read_only - open it with a read-only URI (eg: the API workers). WAL mode is set by the writer
+    """
+    con = None
+    try:
+        if read_only:
+            uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(db_path)))
+            con = sqlite3.connect(uri, uri=True, timeout=BEACON_DB_BUSY_TIMEOUT, check_same_thread=check_same_thread)
+        else:
+            con = sqlite3.connect(db_path, timeout=BEACON_DB_BUSY_TIMEOUT, check_same_thread=check_same_thread)
+            con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA mmap_size={:d}'.format(BEACON_DB_MMAP_SIZE))
+        con.execute('PRAGMA cache_size={:d}'.format(BEACON_DB_CACHE_SIZE))
+        return con
+    except Exception as e:
+        if con:
+            con.close()
+        raise e
+
+def catalog_pulse(chain, pulse):
+    """
+    Add a pulse to the ChainCatalog of its chain. Returns the catalog, a new one for the first pulse of a chain
+    """
+    time = to_epoch(pulse.timeStamp)
+    period = pulse.period // _MICROSECOND
+    if chain is None or chain.chainIndex != pulse.chainIndex:
+        return ChainCatalog.start(pulse.chainIndex, pulse.pulseIndex, time, period)
+    chain.append(pulse.pulseIndex, time, period)
+    return chain
+
+class ConnectionPool:
+    """
+    One connection to the database per thread, opened on first use (see connect).
+    The connections opened before a fork (eg: gunicorn preloading the app) aren't reused by the child.
+    """
+    def __init__(self, db_path, read_only = False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.connections = []
+
+    def get(self):
+        if self.pid != os.getpid():
+            self.reset()
+        con = getattr(self.local, 'connection', None)
+        if con is None:
+            # closed by close(), from any thread
+            con = self.local.connection = connect(self.db_path, self.read_only, check_same_thread=False)
+            with self.lock:
+                self.connections.append(con)
+        return con
+
+    def close(self):
+        """
+        Close the connections of every thread
+        """
+        with self.lock:
+            for con in self.connections:
                 con.close()
-            raise e
+            self.reset()
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_connection_pool(db_path = None, read_only = False):
+    """
+    The process wide ConnectionPool of a database
+    """
+    db_path = os.path.abspath(BEACON_DB_PATH if db_path is None else db_path)
+    with _POOLS_LOCK:
+        pool = _POOLS.get((db_path, read_only))
+        if pool is None:
+            pool = _POOLS[(db_path, read_only)] = ConnectionPool(db_path, read_only)
+        return pool
+
+class BeaconStore:
+    """
+    db_path - defaults to BEACON_DB_PATH
+    table - the table of the pulses (one per chain profile, see beacon/multi_chain.py)
+    connection - share an existing sqlite connection (see withTable)
+    read_only - see connect
+    pooled - use the connection of the current thread from the process wide pool (see get_connection_pool)
+    instead of a connection of its own. For stores used from several threads (eg: the API)
+    """
+    def __init__(self, db_path = None, table = BEACON_DB_TABLE, connection = None, read_only = False, pooled = False):
+        self.db_path = BEACON_DB_PATH if db_path is None else db_path
+        self.table = table
+        self.pool = None
+        self.connection = None
+        # (schema_version, layout version of the table), see tableVersion
+        self.schema = None
+        # {table: (connection, data_version, latest pulse)}, see fetchLatestPulse
+        self.tips = {}
+        # {table: (entry of tips, TableCatalog or None)}, see chainCatalog
+        self.catalogs = {}
+        if connection is not None:
+            self.connection = connection
+        elif pooled:
+            self.pool = get_connection_pool(self.db_path, read_only)
+        else:
+            self.connection = connect(self.db_path, read_only)
+
+    @property
+    def dbConnection(self):
+        if self.pool is not None:
+            return self.pool.get()
+        return self.connection
+
+    def withTable(self, table):
+        """
+        A store of another pulse table using the same connection (or pool)
+        """
+        store = copy.copy(self)
+        store.table = table
+        store.schema = None
+        return store
+
+    def tableVersion(self):
+        """
+        Layout version of the pulse table (see PULSE_TABLE_VERSION). Checked again whenever
+        the schema changes, so that the stores keep working after an online migration
+        """
+        con = self.dbConnection
+        schema_version = con.execute('PRAGMA schema_version').fetchone()[0]
+        if self.schema is None or self.schema[0] != schema_version:
+            version = get_table_version(con, self.table)
+            self.schema = (schema_version, PULSE_TABLE_VERSION if version is None else version)
+        return self.schema[1]
+
+    def encodeTime(self, dt):
+        """
+        The value of a datetime in the timeStamp and releasedAt columns
+        """
+        return dt.isoformat() if self.tableVersion() == 1 else to_epoch(dt)
+
+    def encodeRows(self, items, version, tip):
+        """
+        The columns and the sql rows of (pulse, release) items (see addPulses) following the pulse `tip`
+        in a table of that layout version. In version 2 the anchors are stored by reference if they match
+        (see get_anchor_references), the outputValue of the referenced pulses being taken from the
+        items and the tip first, and looked up with one query per chain otherwise
+        """
+        keys = PULSE_KEYS + [name for name, _ in _RELEASE_COLUMNS]
+        releases = [(None, None) if release is None else release for _, release in items]
+        if version == 1:
+            return keys, [
+                to_row(pulse) + (None if releasedAt is None else releasedAt.isoformat(), releaseError)
+                for (pulse, _), (releasedAt, releaseError) in zip(items, releases)
+            ]
 
-    def initDB(self):
+        outputs = {}
+        if tip is not None:
+            outputs[(tip.chainIndex, tip.pulseIndex)] = tip.outputValue
+        for pulse, _ in items:
+            outputs[(pulse.chainIndex, pulse.pulseIndex)] = pulse.outputValue
+        references = [get_anchor_references(pulse) for pulse, _ in items]
+        wanted = {}
+        for (pulse, _), refs in zip(items, references):
+            for i in refs or ():
+                if (pulse.chainIndex, i) not in outputs:
+                    wanted.setdefault(pulse.chainIndex, set()).add(i)
+        for chain, ids in wanted.items():
+            outputs.update(((chain, i), output) for i, output in self.fetchOutputValues(chain, ids).items())
+
+        rows = []
+        for (pulse, _), refs, (releasedAt, releaseError) in zip(items, references, releases):
+            row = list(to_row_v2(pulse)) + [None if releasedAt is None else to_epoch(releasedAt), releaseError]
+            packed = None
+            if refs is not None and all(outputs.get((pulse.chainIndex, i)) == anchor for i, anchor in zip(refs, pulse.skipListAnchors)):
+                packed = pack_anchor_references(refs)
+                row[_ANCHORS_COLUMN] = b''
+            rows.append(tuple(row) + (packed,))
+        return keys + ['skipListAnchorRefs'], rows
+
+    def fetchOutputValues(self, chain, pulseIds):
+        """
+        {pulseIndex: outputValue} of the pulses of a chain found in a version 2 table
+        """
+        pulseIds = sorted(set(pulseIds))
+        outputs = {}
+        for i in range(0, len(pulseIds), _MAX_QUERY_PARAMS):
+            chunk = pulseIds[i:i + _MAX_QUERY_PARAMS]
+            outputs.update(self.dbConnection.execute(
+                'SELECT pulseIndex, outputValue FROM {tableName} WHERE chainIndex=? AND pulseIndex IN ({seq})'.format(
+                    tableName = self.table,
+                    seq = ','.join(['?'] * len(chunk))
+                ),
+                (chain,) + tuple(chunk)
+            ))
+        return outputs
+
+    def pulseColumns(self, version):
+        """
+        The columns selected to build pulses (see decodeRows)
+        """
+        return PULSE_KEYS if version == 1 else PULSE_KEYS + ['skipListAnchorRefs']
+
+    def decodeRows(self, rows, version):
+        """
+        Convert sql rows of pulseColumns to pulses
+        """
+        if version == 1:
+            return [from_row(row) for row in rows]
+        return self.resolveRows(rows)
+
+    def resolveRows(self, rows, strict = True):
+        """
+        Convert version 2 rows to pulses, looking up the anchors stored by reference with one query per chain.
+        strict - raise a PulseChainException if a referenced pulse is missing, otherwise its row gives None
+        """
+        references = [None if row[-1] is None else unpack_anchor_references(row[-1]) for row in rows]
+        wanted = {}
+        for row, refs in zip(rows, references):
+            if refs is not None:
+                wanted.setdefault(row[_CHAIN_COLUMN], set()).update(refs)
+        outputs = { chain: self.fetchOutputValues(chain, ids) for chain, ids in wanted.items() }
+
+        pulses = []
+        for row, refs in zip(rows, references):
+            anchors = None
+            if refs is not None:
+                chainOutputs = outputs[row[_CHAIN_COLUMN]]
+                missing = [i for i in refs if i not in chainOutputs]
+                if missing:
+                    if strict:
+                        raise PulseChainException('Pulse {}-{}: the pulses {} of its skiplist anchors are missing'.format(
+                            row[_CHAIN_COLUMN],
+                            row[_PULSE_COLUMN],
+                            missing
+                        ))
+                    pulses.append(None)
+                    continue
+                anchors = [chainOutputs[i] for i in refs]
+            pulses.append(from_row_v2(row, anchors))
+        return pulses
+
+    def checkAnchors(self, batch = 1000):
+        """
+        Integrity check of the anchors stored by reference in a version 2 table. Yields the
+        (chainIndex, pulseIndex) of the pulses whose referenced pulses are missing or which,
+        with the anchors looked up, don't hash to their outputValue
+        """
+        after = (-1, -1)
+        while True:
+            rows = self.dbConnection.execute(' '.join((
+                'SELECT {fields} FROM {tableName}',
+                'WHERE skipListAnchorRefs IS NOT NULL AND (chainIndex, pulseIndex) > (?, ?)',
+                'ORDER BY chainIndex, pulseIndex LIMIT ?'
+            )).format(
+                tableName = self.table,
+                fields = ', '.join(self.pulseColumns(2))
+            ), after + (batch,)).fetchall()
+            if not rows:
+                return
+            for row, pulse in zip(rows, self.resolveRows(rows, False)):
+                if pulse is None or get_pulse_output_value(pulse) != pulse.outputValue:
+                    yield (row[_CHAIN_COLUMN], row[_PULSE_COLUMN])
+            after = (rows[-1][_CHAIN_COLUMN], rows[-1][_PULSE_COLUMN])
+
+    def initDB(self, version = PULSE_TABLE_VERSION):
+        """
+        version - layout of the pulse table if it doesn't exist yet (see PULSE_TABLE_VERSION).
+        An existing table keeps its layout
+        """
         con = self.dbConnection
         c = None
         try:
             c = con.cursor()
+            existing = get_table_version(c, self.table)
+            if existing == 2 or (existing is None and version == 2):
+                create_pulse_table_v2(c, self.table, '{}_time'.format(self.table))
+            else:
+                self.createTableV1(c)
+            con.commit()
+
             c.execute("""
                 CREATE TABLE IF NOT EXISTS {tableName}
                 (
-                    id integer PRIMARY KEY AUTOINCREMENT,
-                    uri text NOT NULL,
-                    version text NOT NULL,
-                    cypherSuite text NOT NULL,
-                    period integer NOT NULL,
-                    certificateId text NOT NULL,
-                    chainIndex integer NOT NULL,
-                    pulseIndex integer NOT NULL,
-                    timeStamp text NOT NULL,
-                    localRandomValue text NOT NULL,
-
-                    skipListLayerSize integer NOT NULL,
-                    skipListNumLayers integer NOT NULL,
-                    skipListAnchors text NOT NULL,
-                    precommitmentValue text NOT NULL,
-                    statusCode integer NOT NULL,
-                    signatureValue text NOT NULL,
-                    outputValue text NOT NULL
+                    id text PRIMARY KEY,
+                    certificate text NOT NULL
                 )
             """.format(
-                tableName=BEACON_DB_TABLE
+                tableName=BEACON_DB_CERT_TABLE
             ))
-            c.execute('CREATE INDEX IF NOT EXISTS {tableName}_ts ON {tableName} (timeStamp)'.format(tableName=BEACON_DB_TABLE))
-            con.commit()
-
             c.execute("""
                 CREATE TABLE IF NOT EXISTS {tableName}
                 (
-                    id text PRIMARY KEY,
-                    certificate text NOT NULL
+                    pulseTable text PRIMARY KEY,
+                    chainIndex integer NOT NULL,
+                    pulseIndex integer NOT NULL,
+                    sealed blob NOT NULL
                 )
             """.format(
-                tableName=BEACON_DB_CERT_TABLE
+                tableName=BEACON_DB_CHECKPOINT_TABLE
             ))
+            create_chain_table(c)
             con.commit()
+            # tables filled before the catalog existed
+            if self.tableVersion() == 2 and self.fetchLatestPulse() is not None and self.fetchChainCatalog() is None:
+                self.buildCatalog()
 
         except Exception as e:
             if con:
@@ -89,6 +540,66 @@ class BeaconStore:
         finally:
             c.close()
 
+    def createTableV1(self, c):
+        """
+        Version 1 pulse table (see migrate.py), with the columns it is missing
+        """
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS {tableName}
+            (
+                id integer PRIMARY KEY AUTOINCREMENT,
+                uri text NOT NULL,
+                version text NOT NULL,
+                cypherSuite text NOT NULL,
+                period integer NOT NULL,
+                certificateId text NOT NULL,
+                chainIndex integer NOT NULL,
+                pulseIndex integer NOT NULL,
+                timeStamp text NOT NULL,
+                localRandomValue text NOT NULL,
+                externalSourceId text NOT NULL,
+                externalStatusCode integer NOT NULL,
+                externalValue text NOT NULL,
+                skipListLayerSize integer NOT NULL,
+                skipListNumLayers integer NOT NULL,
+                skipListAnchors text NOT NULL,
+                precommitmentValue text NOT NULL,
+                statusCode integer NOT NULL,
+                signatureValue text NOT NULL,
+                outputValue text NOT NULL,
+                releasedAt text,
+                releaseError real
+            )
+        """.format(
+            tableName=self.table
+        ))
+        self.addMissingColumns(c)
+        c.execute('CREATE INDEX IF NOT EXISTS {tableName}_ts ON {tableName} (timeStamp)'.format(tableName=self.table))
+
+    def addMissingColumns(self, c):
+        """
+        Add the columns of fields introduced after the table was created.
+        Existing rows get the field's default value (no release recorded).
+        """
+        c.execute('PRAGMA table_info({tableName})'.format(tableName=self.table))
+        columns = set(row[1] for row in c.fetchall())
+        for name, sql_type in _RELEASE_COLUMNS:
+            if name not in columns:
+                c.execute('ALTER TABLE {tableName} ADD COLUMN {name} {sql_type}'.format(
+                    tableName=self.table,
+                    name=name,
+                    sql_type=sql_type
+                ))
+        for name, sql_type in _ADDED_COLUMNS:
+            if name in columns:
+                continue
+            c.execute('ALTER TABLE {tableName} ADD COLUMN {name} {sql_type} NOT NULL DEFAULT {default}'.format(
+                tableName=self.table,
+                name=name,
+                sql_type=sql_type,
+                default=repr(PULSE_FIELD_DEFAULTS[name])
+            ))
+
     def addCertificate(self, id, cert):
         con = self.dbConnection
         c = None
@@ -96,7 +607,7 @@ class BeaconStore:
             c = con.cursor()
             keys = PULSE_KEYS
             c.execute(
-                "INSERT INTO {tableName}(id, certificate) VALUES (?, ?)".format(
+                "INSERT OR IGNORE INTO {tableName}(id, certificate) VALUES (?, ?)".format(
                     tableName = BEACON_DB_CERT_TABLE
                 ),
                 (id, cert)
@@ -133,36 +644,138 @@ class BeaconStore:
             if c:
                 c.close()
 
-    def addPulse(self, pulse):
-        lastPulse = self.fetchLatestPulse()
-        assert_next_in_chain(lastPulse, pulse)
+    def addPulse(self, pulse, commit = True, release = None):
+        """
+        commit - False to leave the commit to the caller (eg: to commit several pulses at once)
+        release - Optional (release datetime, release error in seconds) of the pulse
+        """
+        with TRACER.span('store_insert'):
+            self.addPulses([pulse], False, [release])
+        if commit:
+            with TRACER.span('store_commit'):
+                self.dbConnection.commit()
 
+    def addPulses(self, pulses, commit = True, releases = None):
+        """
+        Insert pulses following the latest one (see fetchLatestPulse), checking the chain across the batch
+        in one pass and inserting with executemany in a single transaction. If a pulse doesn't follow the
+        previous one none of the pulses is inserted. Returns the number of pulses inserted
+        pulses - iterable of pulses in chain order (eg: an import, a simulated chain), read in chunks of BEACON_DB_INSERT_CHUNK
+        commit - see addPulse
+        releases - Optional iterable of the release (see addPulse) of each pulse
+        """
         con = self.dbConnection
-        c = None
+        began = not con.in_transaction
+        if began:
+            # hold the write lock: the latest pulse and the table version can't change until the commit
+            con.execute('BEGIN IMMEDIATE')
+        con.execute('SAVEPOINT addPulses')
+        added = 0
         try:
-            c = con.cursor()
-            keys = PULSE_KEYS
-            c.execute(
-                "INSERT INTO {tableName}({fields}) VALUES ({placeholders})".format(
-                    tableName = BEACON_DB_TABLE,
-                    fields = ', '.join(keys),
-                    placeholders = ', '.join(['?'] * len(keys))
-                ),
-                to_row(pulse)
-            )
-            con.commit()
-        except Exception as e:
-            raise e
-        finally:
-            if c:
-                c.close()
+            tip = self.fetchLatestPulse()
+            cached = self.tips[self.table]
+            version = self.tableVersion()
+            # the chain catalog is maintained if it was complete (see chainCatalog)
+            chain = None
+            if version == 2 and tip is None:
+                create_chain_table(con)
+                self.deleteCatalog()
+            elif version == 2:
+                chain = self.fetchChainCatalog()
+            maintained = version == 2 and (tip is None or chain is not None)
+            chains = []
+            items = zip(pulses, itertools.repeat(None) if releases is None else releases)
+            while True:
+                chunk = list(itertools.islice(items, BEACON_DB_INSERT_CHUNK))
+                if not chunk:
+                    break
+                previous = tip
+                for pulse, _ in chunk:
+                    assert_next_in_chain(previous, pulse)
+                    previous = pulse
+                    if maintained:
+                        chain = catalog_pulse(chain, pulse)
+                        if not chains or chains[-1] is not chain:
+                            chains.append(chain)
+                keys, rows = self.encodeRows(chunk, version, tip)
+                con.executemany(self.insertQuery(keys), rows)
+                tip = previous
+                added += len(chunk)
+            if chains:
+                self.saveCatalog(chains)
+            con.execute('RELEASE addPulses')
+        except BaseException:
+            self.resetTip()
+            if began:
+                con.rollback()
+            else:
+                con.execute('ROLLBACK TO addPulses')
+                con.execute('RELEASE addPulses')
+            raise
+        # our own changes leave data_version as it is
+        self.tips[self.table] = (cached[0], cached[1], tip)
+        if commit:
+            try:
+                con.commit()
+            except BaseException:
+                self.resetTip()
+                raise
+        return added
+
+    def insertQuery(self, keys):
+        return "INSERT INTO {tableName}({fields}) VALUES ({placeholders})".format(
+            tableName = self.table,
+            fields = ', '.join(keys),
+            placeholders = ', '.join(['?'] * len(keys))
+        )
+
+    def fetchRelease(self, chain, pulse):
+        """
+        The (release datetime, release error in seconds) recorded with a pulse, or None
+        """
+        row = self.dbConnection.execute(
+            'SELECT releasedAt, releaseError FROM {tableName} WHERE chainIndex=? AND pulseIndex=?'.format(
+                tableName = self.table
+            ),
+            (chain, pulse)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        releasedAt = datetime.fromisoformat(row[0]) if self.tableVersion() == 1 else from_epoch(row[0])
+        return (releasedAt, row[1])
+
+    def saveCheckpoint(self, chainIndex, pulseIndex, sealed, commit = True):
+        """
+        Replace the checkpoint of the table, taken when pulse (chainIndex, pulseIndex) was released
+        commit - see addPulse (eg: to save it atomically with the pulse)
+        """
+        self.dbConnection.execute(
+            'INSERT OR REPLACE INTO {tableName}(pulseTable, chainIndex, pulseIndex, sealed) VALUES (?, ?, ?, ?)'.format(
+                tableName = BEACON_DB_CHECKPOINT_TABLE
+            ),
+            (self.table, chainIndex, pulseIndex, sealed)
+        )
+        if commit:
+            self.dbConnection.commit()
+
+    def fetchCheckpoint(self):
+        """
+        The (chainIndex, pulseIndex, sealed) checkpoint of the table, or None
+        """
+        return self.dbConnection.execute(
+            'SELECT chainIndex, pulseIndex, sealed FROM {tableName} WHERE pulseTable = ?'.format(
+                tableName = BEACON_DB_CHECKPOINT_TABLE
+            ),
+            (self.table,)
+        ).fetchone()
 
     def queryOnePulse(self, where = '', order = '', params = ()):
         con = self.dbConnection
         c = None
         try:
             c = con.cursor()
-            keys = PULSE_KEYS
+            version = self.tableVersion()
+            keys = self.pulseColumns(version)
             query = ' '.join((
                 'SELECT {fields} FROM {tableName}',
                 where,
@@ -170,13 +783,13 @@ class BeaconStore:
                 'LIMIT 1'
             ))
             c.execute(query.format(
-                tableName = BEACON_DB_TABLE,
+                tableName = self.table,
                 fields = ', '.join(keys),
             ), params)
             row = c.fetchone()
             if row == None:
                 return None
-            return from_row(row)
+            return self.decodeRows([row], version)[0]
         except Exception as e:
             raise e
         finally:
@@ -184,7 +797,113 @@ class BeaconStore:
                 c.close()
 
     def fetchLatestPulse(self):
-        return self.queryOnePulse('ORDER BY timeStamp DESC')
+        """
+        The latest pulse of the table (the tip of the chain). Kept in memory, shared with the stores
+        of withTable, and queried again only when another connection changed the database
+        (PRAGMA data_version). Don't modify it: it is the pulse inserted by addPulses or returned earlier
+        """
+        con = self.dbConnection
+        dataVersion = con.execute('PRAGMA data_version').fetchone()[0]
+        cached = self.tips.get(self.table)
+        if cached is None or cached[0] is not con or cached[1] != dataVersion:
+            cached = self.tips[self.table] = (con, dataVersion, self.queryOnePulse(order='ORDER BY timeStamp DESC'))
+        return cached[2]
+
+    def resetTip(self):
+        """
+        Forget the latest pulse (and the chain catalog) kept in memory. Needed after changing the pulses
+        of the table with other queries on the connection of the store (eg: a rollback after addPulse(commit=False))
+        """
+        self.tips.pop(self.table, None)
+
+    def chainCatalog(self):
+        """
+        The TableCatalog (see chain_catalog.py) of the table, kept in memory until the latest pulse changes.
+        None if it can't be searched: version 1 table, catalog not maintained (its latest chain doesn't end
+        with the latest pulse), unordered timestamps
+        """
+        tip = self.fetchLatestPulse()
+        entry = self.tips[self.table]
+        cached = self.catalogs.get(self.table)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        catalog = None
+        if tip is None:
+            catalog = TableCatalog([])
+        elif self.tableVersion() == 2 and self.fetchChainCatalog() is not None:
+            catalog = TableCatalog(self.fetchChainCatalogs())
+            if not catalog.ordered:
+                catalog = None
+        self.catalogs[self.table] = (entry, catalog)
+        return catalog
+
+    def fetchChainCatalogs(self, chainIndex = None):
+        """
+        The ChainCatalog of every chain of the table (or of one chain). None if the catalog table doesn't exist yet
+        """
+        con = self.dbConnection
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (BEACON_DB_CHAIN_TABLE,)).fetchone() is None:
+            return None
+        query = 'SELECT chainIndex, firstTime, period, lastIndex, gaps, ordered FROM {tableName} WHERE pulseTable = ?'
+        params = (self.table,)
+        if chainIndex is not None:
+            query += ' AND chainIndex = ?'
+            params += (chainIndex,)
+        return [ChainCatalog.from_row(row) for row in con.execute(query.format(tableName = BEACON_DB_CHAIN_TABLE), params)]
+
+    def fetchChainCatalog(self):
+        """
+        The ChainCatalog of the chain of the latest pulse, None if it doesn't end with that pulse (not maintained)
+        """
+        tip = self.fetchLatestPulse()
+        chains = self.fetchChainCatalogs(tip.chainIndex)
+        if not chains or chains[0].lastIndex != tip.pulseIndex:
+            return None
+        return chains[0]
+
+    def saveCatalog(self, chains):
+        self.dbConnection.executemany(
+            'INSERT OR REPLACE INTO {tableName}(pulseTable, chainIndex, firstTime, period, lastIndex, gaps, ordered) VALUES (?, ?, ?, ?, ?, ?, ?)'.format(
+                tableName = BEACON_DB_CHAIN_TABLE
+            ),
+            [(self.table,) + chain.to_row() for chain in chains]
+        )
+
+    def deleteCatalog(self):
+        self.dbConnection.execute('DELETE FROM {tableName} WHERE pulseTable = ?'.format(tableName = BEACON_DB_CHAIN_TABLE), (self.table,))
+
+    def buildCatalog(self):
+        """
+        Build the chain catalog of a version 2 table from its pulses (eg: a table filled or migrated
+        before the catalog existed), holding the write lock. Returns the number of chains
+        """
+        con = self.dbConnection
+        began = not con.in_transaction
+        if began:
+            con.execute('BEGIN IMMEDIATE')
+        try:
+            create_chain_table(con)
+            chains = []
+            chain = None
+            rows = con.execute('SELECT chainIndex, pulseIndex, timeStamp, period FROM {tableName} ORDER BY chainIndex, pulseIndex'.format(
+                tableName = self.table
+            ))
+            for chainIndex, pulseIndex, time, period in rows:
+                if chain is None or chain.chainIndex != chainIndex:
+                    chain = ChainCatalog.start(chainIndex, pulseIndex, time, 1000 * period)
+                    chains.append(chain)
+                else:
+                    chain.append(pulseIndex, time, 1000 * period)
+            self.deleteCatalog()
+            self.saveCatalog(chains)
+        except BaseException:
+            if began:
+                con.rollback()
+            raise
+        if began:
+            con.commit()
+        self.resetTip()
+        return len(chains)
 
     def fetchPulse(self, chain, pulse):
         return self.queryOnePulse(where='WHERE chainIndex=? AND pulseIndex=?', params=(chain, pulse))
@@ -194,36 +913,62 @@ class BeaconStore:
         c = None
         try:
             c = con.cursor()
-            keys = PULSE_KEYS
+            version = self.tableVersion()
+            keys = self.pulseColumns(version)
             c.execute("""
                 SELECT {fields} FROM {tableName} WHERE chainIndex=? AND pulseIndex IN ({seq})
             """.format(
-                tableName = BEACON_DB_TABLE,
+                tableName = self.table,
                 fields = ', '.join(keys),
                 seq=','.join(['?'] * len(pulseIds))
             ), (chain,) + tuple(pulseIds))
             rows = c.fetchall()
             if len(rows) is not len(pulseIds):
                 raise Exception("Could not retrieve all pulses")
-            return [from_row(row) for row in rows]
+            return self.decodeRows(rows, version)
         except Exception as e:
             raise e
         finally:
             if c:
                 c.close()
 
+    def queryPulseByTime(self, dt, locate, where, order = ''):
+        """
+        The pulse at the (chainIndex, pulseIndex, time) given by `locate` from the chain catalog (see chainCatalog)
+        and the epoch microseconds of dt, fetched by primary key. Queried with the timeStamp index (where, order)
+        if the table has no searchable catalog or the pulse isn't found where the catalog says
+        """
+        catalog = self.chainCatalog()
+        if catalog is not None:
+            found = locate(catalog, to_epoch(dt))
+            if found is None:
+                return None
+            pulse = self.queryOnePulse(where='WHERE chainIndex=? AND pulseIndex=? AND timeStamp=?', params=found)
+            if pulse is not None:
+                return pulse
+        time = self.encodeTime(dt)
+        return self.queryOnePulse(where=where, order=order, params=(time,))
+
+    def fetchPulseIdByExactTime(self, dt):
+        """
+        The (chainIndex, pulseIndex) of the pulse at exactly that time, or None. Without fetching the pulse
+        if the table has a searchable chain catalog
+        """
+        catalog = self.chainCatalog()
+        if catalog is not None:
+            found = catalog.at(to_epoch(dt))
+            return None if found is None else found[:2]
+        pulse = self.fetchPulseByExactTime(dt)
+        return None if pulse is None else (pulse.chainIndex, pulse.pulseIndex)
+
     def fetchPulseByExactTime(self, dt):
-        datestr = dt.isoformat()
-        return self.queryOnePulse(where='WHERE timeStamp = ?', params=(datestr,))
+        return self.queryPulseByTime(dt, TableCatalog.at, 'WHERE timeStamp = ?')
 
     def fetchPulseByGeaterEqualTime(self, dt):
-        datestr = dt.isoformat()
-        return self.queryOnePulse(where='WHERE timeStamp >= ?', order='ORDER BY timeStamp ASC', params=(datestr,))
+        return self.queryPulseByTime(dt, TableCatalog.atOrAfter, 'WHERE timeStamp >= ?', 'ORDER BY timeStamp ASC')
 
     def fetchNextPulseByTime(self, dt):
-        datestr = dt.isoformat()
-        return self.queryOnePulse(where='WHERE timeStamp > ?', order='ORDER BY timeStamp ASC', params=(datestr,))
+        return self.queryPulseByTime(dt, TableCatalog.after, 'WHERE timeStamp > ?', 'ORDER BY timeStamp ASC')
 
     def fetchPreviousPulseByTime(self, dt):
-        datestr = dt.isoformat()
-        return self.queryOnePulse(where='WHERE timeStamp < ?', order='ORDER BY timeStamp DESC', params=(datestr,))
+        return self.queryPulseByTime(dt, TableCatalog.before, 'WHERE timeStamp < ?', 'ORDER BY timeStamp DESC')
@@ -0,0 +1,70 @@
+import unittest
+from ..chain_catalog import ChainCatalog, TableCatalog
+
+def make_catalog(chainIndex, times, period):
+    chain = ChainCatalog.start(chainIndex, 0, times[0], period)
+    for i, time in enumerate(times[1:], 1):
+        chain.append(i, time, period)
+    return chain
+
+class TestChainCatalog(unittest.TestCase):
+
+    def test_segments(self):
+        # pulses 3 and 4 late, then a period of 5
+        chain = make_catalog(0, [100, 110, 120, 135, 145], 10)
+        chain.append(5, 150, 5)
+        chain.append(6, 155, 5)
+        self.assertEqual(chain.gaps, [(3, 135, 10), (5, 150, 5)])
+        self.assertTrue(chain.ordered)
+        self.assertEqual([chain.time(i) for i in range(7)], [100, 110, 120, 135, 145, 150, 155])
+        self.assertEqual(chain.lastTime, 155)
+        self.assertEqual([chain.countBefore(t) for t in [50, 100, 101, 130, 135, 136, 150, 155, 156, 1000]], [0, 0, 1, 3, 3, 4, 5, 6, 7, 7])
+
+        row = chain.to_row()
+        self.assertEqual(row[:4], (0, 100, 10, 6))
+        copy = ChainCatalog.from_row(row)
+        self.assertEqual(copy.segments, chain.segments)
+        self.assertEqual(copy.lastIndex, 6)
+
+    def test_unordered(self):
+        self.assertFalse(make_catalog(0, [100, 110, 105], 10).ordered)
+        self.assertFalse(make_catalog(0, [100, 100], 10).ordered)
+        self.assertFalse(ChainCatalog.start(0, 3, 100, 10).ordered)
+        chain = make_catalog(0, [100, 110], 10)
+        chain.append(3, 130, 10)
+        self.assertFalse(chain.ordered)
+
+class TestTableCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = TableCatalog([
+            make_catalog(1, [200, 210, 220], 10),
+            make_catalog(0, [100, 110, 125], 10)
+        ])
+
+    def test_lookups(self):
+        self.assertTrue(self.catalog.ordered)
+        self.assertEqual(self.catalog.atOrAfter(0), (0, 0, 100))
+        self.assertEqual(self.catalog.atOrAfter(111), (0, 2, 125))
+        self.assertEqual(self.catalog.atOrAfter(126), (1, 0, 200))
+        self.assertEqual(self.catalog.atOrAfter(210), (1, 1, 210))
+        self.assertIsNone(self.catalog.atOrAfter(221))
+        self.assertEqual(self.catalog.after(200), (1, 1, 210))
+        self.assertIsNone(self.catalog.before(100))
+        self.assertEqual(self.catalog.before(125), (0, 1, 110))
+        self.assertEqual(self.catalog.before(199), (0, 2, 125))
+        self.assertEqual(self.catalog.before(1000), (1, 2, 220))
+        self.assertEqual(self.catalog.at(125), (0, 2, 125))
+        self.assertIsNone(self.catalog.at(120))
+
+    def test_empty(self):
+        catalog = TableCatalog([])
+        self.assertTrue(catalog.ordered)
+        self.assertIsNone(catalog.atOrAfter(0))
+        self.assertIsNone(catalog.before(0))
+
+    def test_overlapping_chains(self):
+        self.assertFalse(TableCatalog([make_catalog(0, [100, 110], 10), make_catalog(1, [105, 115], 10)]).ordered)
+
+if __name__ == '__main__':
+    unittest.main()
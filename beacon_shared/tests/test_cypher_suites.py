@@ -0,0 +1,26 @@
+import unittest
+import os
+from cryptography.exceptions import InvalidSignature
+from ..cypher_suites import CYPHER_SUITES, get_cypher_suite
+from ..hashing import hash_bytes
+
+class TestCypherSuites(unittest.TestCase):
+
+    def test_sign_verify(self):
+        digest = hash_bytes(os.urandom(100))
+        other = hash_bytes(os.urandom(100))
+        for suite_id, suite in CYPHER_SUITES.items():
+            key = suite.generate_private_key()
+            signature = suite.sign_digest(key, digest)
+            suite.verify_digest(key.public_key(), signature, digest)
+            self.assertRaises(
+                InvalidSignature,
+                lambda: suite.verify_digest(key.public_key(), signature, other)
+            )
+
+    def test_unknown_suite(self):
+        self.assertEqual(get_cypher_suite(0).id, 0)
+        self.assertRaises(ValueError, lambda: get_cypher_suite(1000))
+
+if __name__ == '__main__':
+    unittest.main()
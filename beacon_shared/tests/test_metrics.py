@@ -0,0 +1,47 @@
+import unittest
+import random
+from ..metrics import MetricsRegistry, Histogram, P2Quantile
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_quantiles(self):
+        h = Histogram('test', buckets=[1, 2, 3, 4])
+        for v in [0.5, 1.5, 1.5, 2.5, 3.5, 3.5, 3.5, 3.5, 3.5, 10]:
+            h.observe(v)
+        self.assertEqual(h.count, 10)
+        self.assertEqual(h.min, 0.5)
+        self.assertEqual(h.max, 10)
+        self.assertTrue(1 <= h.quantile(0.2) <= 2)
+        self.assertTrue(3 <= h.quantile(0.5) <= 4)
+        self.assertTrue(4 <= h.quantile(0.99) <= 10)
+        self.assertIsNone(Histogram('empty').quantile(0.5))
+
+    def test_p2_quantile(self):
+        rand = random.Random(0)
+        values = [rand.expovariate(1) for _ in range(10000)]
+        for q in [0.5, 0.9, 0.99]:
+            estimate = P2Quantile('test', q)
+            for v in values:
+                estimate.observe(v)
+            exact = sorted(values)[int(q * len(values))]
+            self.assertAlmostEqual(estimate.value(), exact, delta=0.05 * exact)
+
+    def test_p2_quantile_few_values(self):
+        estimate = P2Quantile('test', 0.5)
+        self.assertIsNone(estimate.value())
+        for v in [3, 1, 2]:
+            estimate.observe(v)
+        self.assertEqual(estimate.value(), 2)
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        registry.counter('a').inc()
+        registry.counter('a').inc(2)
+        registry.histogram('b').observe(0.1)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['a'], 3)
+        self.assertEqual(snapshot['b']['count'], 1)
+        self.assertRaises(TypeError, lambda: registry.histogram('a'))
+
+if __name__ == '__main__':
+    unittest.main()
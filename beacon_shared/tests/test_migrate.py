@@ -0,0 +1,85 @@
+import unittest
+import io
+import os
+import tempfile
+import contextlib
+from beacon_shared import store
+from beacon_shared.migrate import migrate_table, compact_anchors, get_v1_tables, main
+from beacon_shared.tests.test_store import make_chain
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'beacon.db')
+        self.pulses = make_chain(10)
+        self.store = store.BeaconStore(self.path)
+        self.addCleanup(self.store.dbConnection.close)
+        self.store.initDB(1)
+        for pulse in self.pulses[:7]:
+            self.store.addPulse(pulse, release=(pulse.timeStamp, 0.001))
+
+    def connect(self):
+        con = store.connect(self.path)
+        self.addCleanup(con.close)
+        con.isolation_level = None
+        return con
+
+    def test_migrate(self):
+        con = self.connect()
+        self.assertEqual(get_v1_tables(con), [store.BEACON_DB_TABLE])
+        # the beacon keeps releasing pulses (on a v1 store) during the migration
+        progress = []
+        def released(copied):
+            progress.append(copied)
+            if len(progress) == 1:
+                self.store.addPulse(self.pulses[7])
+        self.assertEqual(migrate_table(con, store.BEACON_DB_TABLE, batch=3, progress=released), 8)
+        self.assertEqual(progress, [3, 6, 8])
+
+        self.assertEqual(self.store.tableVersion(), 2)
+        self.assertEqual(get_v1_tables(con), [])
+        self.store.addPulse(self.pulses[8])
+        self.assertEqual(self.store.fetchManyPulses(0, list(range(9))), self.pulses[:9])
+        # the chain catalog was built, then maintained
+        self.assertEqual(self.store.chainCatalog().chains[0].lastIndex, 8)
+        self.assertEqual(self.store.fetchPulseIdByExactTime(self.pulses[8].timeStamp), (0, 8))
+        self.assertEqual(self.store.fetchRelease(0, 3), (self.pulses[3].timeStamp, 0.001))
+        self.assertEqual(self.store.fetchPulseByExactTime(self.pulses[5].timeStamp), self.pulses[5])
+        # the version 1 table is kept
+        backup = self.store.withTable(store.BEACON_DB_TABLE + '_v1')
+        self.assertEqual(backup.tableVersion(), 1)
+        self.assertEqual(backup.fetchLatestPulse(), self.pulses[7])
+
+    def test_stale_writer(self):
+        # the store knew the version 1 table and its latest pulse before the migration
+        self.assertEqual(self.store.tableVersion(), 1)
+        self.assertEqual(self.store.fetchLatestPulse(), self.pulses[6])
+        migrate_table(self.connect(), store.BEACON_DB_TABLE)
+        self.store.addPulses(self.pulses[7:])
+        self.assertEqual(self.store.tableVersion(), 2)
+        self.assertEqual(self.store.fetchManyPulses(0, list(range(10))), self.pulses)
+
+    def test_compact_anchors(self):
+        con = self.connect()
+        migrate_table(con, store.BEACON_DB_TABLE)
+        migrated = store.BeaconStore(connection=con)
+        self.assertEqual(compact_anchors(migrated, batch=4), 6)
+        self.assertEqual(compact_anchors(migrated), 0)
+        self.assertEqual(self.store.fetchManyPulses(0, list(range(7))), self.pulses[:7])
+        self.assertEqual(list(self.store.checkAnchors()), [])
+
+    def test_main(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['--db', self.path, '--drop'])
+            main(['--db', self.path, '--table', store.BEACON_DB_TABLE, '--check'])
+        self.assertIn('0 pulses with invalid anchors', output.getvalue())
+        self.assertEqual(self.store.tableVersion(), 2)
+        self.assertEqual(self.store.fetchLatestPulse(), self.pulses[6])
+        # dropped
+        self.assertIsNone(store.get_table_version(self.store.dbConnection, store.BEACON_DB_TABLE + '_v1'))
+
+if __name__ == '__main__':
+    unittest.main()
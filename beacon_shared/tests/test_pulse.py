@@ -1,11 +1,111 @@
 import unittest
-from beacon_shared.pulse import get_pulse_uri
+from datetime import datetime, timedelta
+from cryptography.exceptions import InvalidSignature
+from beacon_shared.pulse import get_pulse_uri, pulse_from_dict, pulse_to_plain_dict, Pulse, PULSE_KEYS, EMPTY_HASH_BYTES
+from beacon_shared.pulse import PULSE_FIELD_TYPES, EXTERNAL_FIELDS, verify_pulse
+from beacon_shared.status_codes import EXTERNAL_STATUS_NONE
+from beacon_shared.cypher_suites import get_cypher_suite
+from beacon_shared.hashing import hash_many
+from beacon_shared.store import from_row, to_row
+from beacon_shared.types import ByteHash, SkipAnchors
+
+PULSE_DICT = {
+    'uri': get_pulse_uri(1, 3),
+    'version': '1.0',
+    'cypherSuite': 0,
+    'period': 10000,
+    'certificateId': 'ab' * 64,
+    'chainIndex': 1,
+    'pulseIndex': 3,
+    'timeStamp': '2019-04-03T13:34:23.234234',
+    'localRandomValue': '01' * 64,
+    'externalSourceId': '0a' * 64,
+    'externalStatusCode': 0,
+    'externalValue': '0b' * 64,
+    'skipListLayerSize': 27,
+    'skipListNumLayers': 5,
+    'skipListAnchors': ['02' * 64, '03' * 64, '04' * 64, '05' * 64, '06' * 64],
+    'precommitmentValue': '07' * 64,
+    'statusCode': 0,
+    'signatureValue': '08' * 256,
+    'outputValue': '09' * 64
+}
 
 class TestPulse(unittest.TestCase):
 
     def test_uri(self):
         url = get_pulse_uri(1, 1)
-        self.assertEqual('https://beacon-prototype.nist.gov/api/1.0/chain/1/pulse/1', url)
+        self.assertEqual('https://beacon-prototype.nist.gov/api/1.1/chain/1/pulse/1', url)
+
+    def test_raw_fields(self):
+        pulse = pulse_from_dict(PULSE_DICT)
+        self.assertIsInstance(pulse, Pulse)
+        self.assertEqual(pulse.pulseIndex, 3)
+        self.assertEqual(pulse.period, timedelta(seconds=10))
+        self.assertEqual(pulse.timeStamp, datetime(2019, 4, 3, 13, 34, 23, 234234))
+        self.assertEqual(pulse.certificateId, bytes.fromhex('ab' * 64))
+        self.assertEqual(pulse.skipListAnchors[1], bytes.fromhex('03' * 64))
+        self.assertEqual(pulse_to_plain_dict(pulse), PULSE_DICT)
+
+    def test_missing_external_fields(self):
+        fields = dict(PULSE_DICT)
+        for key in ['externalSourceId', 'externalStatusCode', 'externalValue']:
+            del fields[key]
+        pulse = pulse_from_dict(fields)
+        self.assertEqual(pulse.externalSourceId, EMPTY_HASH_BYTES)
+        self.assertEqual(pulse.externalStatusCode, EXTERNAL_STATUS_NONE)
+        self.assertEqual(pulse.externalValue, EMPTY_HASH_BYTES)
+        self.assertEqual(pulse.localRandomValue, bytes.fromhex('01' * 64))
+
+    def test_pre_external_signature(self):
+        # a version 1.0 pulse, signed before the external fields existed
+        pulse = pulse_from_dict(PULSE_DICT)
+        suite = get_cypher_suite(0)
+        key = suite.generate_private_key()
+        def values(until):
+            keys = [k for k in PULSE_KEYS if k not in EXTERNAL_FIELDS]
+            return [PULSE_FIELD_TYPES[k](getattr(pulse, k)) for k in keys[:keys.index(until)]]
+        pulse.signatureValue = suite.sign_digest(key, hash_many(values('signatureValue')))
+        pulse.outputValue = hash_many(values('outputValue'))
+        verify_pulse(pulse, key.public_key())
+
+        # the external fields are signed from version 1.1
+        pulse.version = '1.1'
+        self.assertRaises(InvalidSignature, lambda: verify_pulse(pulse, key.public_key()))
+
+    def test_mapping_compat(self):
+        pulse = pulse_from_dict(PULSE_DICT)
+        self.assertEqual(list(pulse.keys()), PULSE_KEYS)
+        self.assertEqual(pulse['chainIndex'].get(), 1)
+        self.assertEqual(pulse['outputValue'].get_json_value(), '09' * 64)
+        self.assertEqual(
+            pulse['localRandomValue'].serialize(),
+            ByteHash(PULSE_DICT['localRandomValue']).serialize()
+        )
+        self.assertEqual(
+            pulse['skipListAnchors'].serialize(),
+            SkipAnchors(PULSE_DICT['skipListAnchors']).serialize()
+        )
+
+        pulse['statusCode'] = 2
+        self.assertEqual(pulse.statusCode, 2)
+        pulse['outputValue'] = ByteHash('0a' * 64)
+        self.assertEqual(pulse.outputValue, bytes.fromhex('0a' * 64))
+
+    def test_copy(self):
+        pulse = pulse_from_dict(PULSE_DICT)
+        other = pulse.copy()
+        self.assertEqual(pulse, other)
+        other.skipListAnchors[0] = b''
+        other.statusCode = 2
+        self.assertNotEqual(pulse, other)
+        self.assertEqual(pulse.statusCode, 0)
+
+    def test_row(self):
+        pulse = pulse_from_dict(PULSE_DICT)
+        row = to_row(pulse)
+        self.assertEqual(row[PULSE_KEYS.index('skipListAnchors')], ':'.join(PULSE_DICT['skipListAnchors']))
+        self.assertEqual(from_row(row), pulse)
 
 if __name__ == '__main__':
     unittest.main()
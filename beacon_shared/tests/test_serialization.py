@@ -0,0 +1,118 @@
+import unittest
+import random
+from datetime import datetime, timedelta
+from ..pulse import Pulse, PULSE_KEYS, get_pulse_values, serialize_pulse, get_pulse_uri
+from ..serialization import concat_serialize
+from ..hashing import hash_many
+from ..pulse import get_pulse_digest
+
+def random_bytes(rand, n):
+    return bytes(rand.getrandbits(8) for _ in range(n))
+
+def random_pulse(rand):
+    chain = rand.randrange(2**64)
+    index = rand.randrange(2**rand.choice([1, 8, 32, 64]))
+    # include timestamps with a zero microsecond (shorter isoformat)
+    microsecond = rand.choice([0, rand.randrange(1000000)])
+    return Pulse.from_values([
+        get_pulse_uri(chain, index) + 'é' * rand.randrange(3),
+        rand.choice(['1.0', '2.0-beta']),
+        rand.randrange(2**32),
+        timedelta(milliseconds=rand.randrange(2**32)),
+        random_bytes(rand, rand.choice([0, 32, 64])),
+        chain,
+        index,
+        datetime(rand.randrange(1970, 2100), 1, 1, microsecond=microsecond) + timedelta(seconds=rand.randrange(10**7)),
+        random_bytes(rand, 64),
+        random_bytes(rand, rand.choice([0, 64])),
+        rand.randrange(2**32),
+        random_bytes(rand, 64),
+        rand.randrange(2**32),
+        rand.randrange(2**32),
+        [random_bytes(rand, 64) for _ in range(rand.randrange(7))],
+        random_bytes(rand, 64),
+        rand.randrange(2**32),
+        random_bytes(rand, rand.choice([64, 256, 512])),
+        random_bytes(rand, 64)
+    ])
+
+class TestPulseSerializer(unittest.TestCase):
+
+    def test_matches_field_serialization(self):
+        rand = random.Random(4121)
+        for _ in range(300):
+            pulse = random_pulse(rand)
+            until = rand.choice(PULSE_KEYS + [None])
+            expected = concat_serialize(get_pulse_values(pulse, until))
+            self.assertEqual(bytes(serialize_pulse(pulse, until).view()), expected)
+
+    def test_views(self):
+        rand = random.Random(412)
+        pulse = random_pulse(rand)
+        serialized = serialize_pulse(pulse)
+        self.assertEqual(
+            bytes(serialized.signed_view()),
+            concat_serialize(get_pulse_values(pulse, 'signatureValue'))
+        )
+        self.assertEqual(
+            bytes(serialized.output_view()),
+            concat_serialize(get_pulse_values(pulse, 'outputValue'))
+        )
+        self.assertEqual(
+            bytes(serialized.view('outputValue', 'statusCode')),
+            pulse['statusCode'].serialize() + pulse['signatureValue'].serialize()
+        )
+
+class TestPulseDigest(unittest.TestCase):
+
+    def test_matches_full_hash(self):
+        rand = random.Random(3)
+        for _ in range(50):
+            pulse = random_pulse(rand)
+            digest = get_pulse_digest(pulse)
+            self.assertEqual(
+                digest.signature_digest(),
+                hash_many(get_pulse_values(pulse, 'signatureValue'))
+            )
+            self.assertEqual(
+                digest.output_value(pulse.signatureValue),
+                hash_many(get_pulse_values(pulse, 'outputValue'))
+            )
+
+    def test_status_change(self):
+        rand = random.Random(5)
+        pulse = random_pulse(rand)
+        digest = get_pulse_digest(pulse)
+        before = digest.signature_digest()
+
+        pulse.statusCode = pulse.statusCode ^ 2
+        digest.set_status(pulse.statusCode)
+        self.assertNotEqual(digest.signature_digest(), before)
+        self.assertEqual(
+            digest.signature_digest(),
+            hash_many(get_pulse_values(pulse, 'signatureValue'))
+        )
+        self.assertEqual(
+            digest.output_value(pulse.signatureValue),
+            hash_many(get_pulse_values(pulse, 'outputValue'))
+        )
+
+    def test_with_status(self):
+        rand = random.Random(7)
+        pulse = random_pulse(rand)
+        digest = get_pulse_digest(pulse)
+        late = pulse.copy()
+        late.statusCode = pulse.statusCode | 2
+        late_digest = digest.with_status(late.statusCode)
+        self.assertEqual(
+            late_digest.signature_digest(),
+            hash_many(get_pulse_values(late, 'signatureValue'))
+        )
+        # the original digest is unchanged
+        self.assertEqual(
+            digest.signature_digest(),
+            hash_many(get_pulse_values(pulse, 'signatureValue'))
+        )
+
+if __name__ == '__main__':
+    unittest.main()
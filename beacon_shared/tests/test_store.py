@@ -0,0 +1,337 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from beacon_shared import store
+from beacon_shared.pulse import pulse_from_dict, get_skip_list_anchors, get_pulse_output_value, PulseChainException, EMPTY_HASH_BYTES
+from beacon_shared.status_codes import EXTERNAL_STATUS_NONE
+from beacon_shared.tests.test_pulse import PULSE_DICT
+
+def make_chain(n, layer_size = 3):
+    """
+    n pulses of chain 0 with skiplist anchors and output values
+    """
+    pulses = []
+    for i in range(n):
+        pulse = pulse_from_dict(dict(
+            PULSE_DICT,
+            chainIndex=0,
+            pulseIndex=i,
+            timeStamp='2019-04-03T13:34:{:02d}.{:06d}'.format(i % 60, i),
+            skipListLayerSize=layer_size,
+            skipListAnchors=[a.hex() for a in get_skip_list_anchors(pulses[-1] if pulses else None)]
+        ))
+        pulse.outputValue = get_pulse_output_value(pulse)
+        pulses.append(pulse)
+    return pulses
+
+def make_timed_chains(times):
+    """
+    Pulses of consecutive chains from their (chainIndex, timeStamp, period in ms)
+    """
+    pulses = []
+    for chain, timeStamp, period in times:
+        previous = pulses[-1] if pulses and pulses[-1].chainIndex == chain else None
+        pulses.append(pulse_from_dict(dict(
+            PULSE_DICT,
+            chainIndex=chain,
+            pulseIndex=0 if previous is None else previous.pulseIndex + 1,
+            timeStamp=timeStamp.isoformat(),
+            period=period,
+            skipListAnchors=[a.hex() for a in get_skip_list_anchors(previous)]
+        )))
+    return pulses
+
+class TestBeaconStore(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'beacon.db')
+        self.original_path = store.BEACON_DB_PATH
+        store.BEACON_DB_PATH = self.path
+        self.addCleanup(setattr, store, 'BEACON_DB_PATH', self.original_path)
+
+    def open_store(self):
+        s = store.BeaconStore()
+        self.addCleanup(s.dbConnection.close)
+        s.initDB()
+        return s
+
+    def test_add_and_fetch(self):
+        s = self.open_store()
+        pulse = pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0))
+        s.addPulse(pulse)
+        self.assertEqual(s.fetchLatestPulse(), pulse)
+
+    def test_release(self):
+        s = self.open_store()
+        pulse = pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0))
+        released_at = datetime(2019, 4, 3, 13, 34, 24, 234246)
+        s.addPulse(pulse, release=(released_at, 0.000012))
+        self.assertEqual(s.fetchRelease(0, 0), (released_at, 0.000012))
+        self.assertEqual(s.fetchLatestPulse(), pulse)
+        self.assertIsNone(s.fetchRelease(0, 1))
+
+    def test_checkpoint(self):
+        s = self.open_store()
+        other = s.withTable(store.BEACON_DB_TABLE + '_other')
+        self.assertIsNone(s.fetchCheckpoint())
+        s.saveCheckpoint(0, 1, b'sealed 1')
+        s.saveCheckpoint(0, 2, b'sealed 2')
+        other.saveCheckpoint(3, 0, b'other')
+        self.assertEqual(s.fetchCheckpoint(), (0, 2, b'sealed 2'))
+        self.assertEqual(other.fetchCheckpoint(), (3, 0, b'other'))
+
+    def test_tables(self):
+        s = self.open_store()
+        other = s.withTable(store.BEACON_DB_TABLE + '_other')
+        other.initDB()
+        pulse = pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0))
+        other.addPulse(pulse)
+        self.assertEqual(other.fetchLatestPulse(), pulse)
+        self.assertIsNone(s.fetchLatestPulse())
+
+    def test_adds_missing_columns(self):
+        # a table created before the external fields existed
+        con = sqlite3.connect(self.path)
+        columns = [key for key in store.PULSE_KEYS if key not in store.PULSE_FIELD_DEFAULTS]
+        con.execute('CREATE TABLE {} (id integer PRIMARY KEY AUTOINCREMENT, {})'.format(
+            store.BEACON_DB_TABLE,
+            ', '.join(columns)
+        ))
+        row = store.to_row(pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0)))
+        row = [v for key, v in zip(store.PULSE_KEYS, row) if key in columns]
+        con.execute('INSERT INTO {} ({}) VALUES ({})'.format(
+            store.BEACON_DB_TABLE,
+            ', '.join(columns),
+            ', '.join(['?'] * len(columns))
+        ), row)
+        con.commit()
+        con.close()
+
+        pulse = self.open_store().fetchLatestPulse()
+        self.assertEqual(pulse.pulseIndex, 0)
+        self.assertEqual(pulse.externalSourceId, EMPTY_HASH_BYTES)
+        self.assertEqual(pulse.externalStatusCode, EXTERNAL_STATUS_NONE)
+        self.assertEqual(pulse.externalValue, EMPTY_HASH_BYTES)
+        self.assertIsNone(self.open_store().fetchRelease(0, 0))
+
+    def test_layouts(self):
+        for version in [1, 2]:
+            with self.subTest(version=version):
+                s = self.open_store().withTable('pulses_v{}'.format(version))
+                s.initDB(version)
+                self.assertEqual(s.tableVersion(), version)
+                pulses = [pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0))]
+                pulses.append(pulse_from_dict(dict(
+                    PULSE_DICT,
+                    chainIndex=0,
+                    pulseIndex=1,
+                    timeStamp='2019-04-03T13:35:23.234235',
+                    skipListAnchors=[PULSE_DICT['outputValue']] * 5
+                )))
+                released_at = datetime(2019, 4, 3, 13, 35, 24, 1)
+                s.addPulse(pulses[0])
+                s.addPulse(pulses[1], release=(released_at, -0.5))
+                self.assertEqual(s.fetchPulse(0, 1), pulses[1])
+                self.assertEqual(s.fetchLatestPulse(), pulses[1])
+                self.assertEqual(s.fetchManyPulses(0, [0, 1]), pulses)
+                self.assertEqual(s.fetchRelease(0, 1), (released_at, -0.5))
+                self.assertEqual(s.fetchPulseByExactTime(pulses[1].timeStamp), pulses[1])
+                self.assertEqual(s.fetchNextPulseByTime(pulses[0].timeStamp), pulses[1])
+                self.assertEqual(s.fetchPreviousPulseByTime(pulses[1].timeStamp), pulses[0])
+
+    def test_v2_row(self):
+        s = self.open_store()
+        self.assertEqual(s.tableVersion(), 2)
+        pulse = pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0))
+        s.addPulse(pulse)
+        row = s.dbConnection.execute('SELECT timeStamp, outputValue, skipListAnchors FROM {}'.format(s.table)).fetchone()
+        self.assertEqual(row[0], store.to_epoch(pulse.timeStamp))
+        self.assertEqual(row[1], pulse.outputValue)
+        self.assertEqual(row[2], b''.join(pulse.skipListAnchors))
+        # (chainIndex, pulseIndex) is the primary key
+        with self.assertRaises(sqlite3.IntegrityError):
+            s.dbConnection.execute('INSERT INTO {} SELECT * FROM {}'.format(s.table, s.table))
+        with self.assertRaises(ValueError):
+            store.to_row_v2(pulse_from_dict(dict(PULSE_DICT, skipListAnchors=PULSE_DICT['skipListAnchors'][:4])))
+
+    def test_anchor_references(self):
+        s = self.open_store()
+        pulses = make_chain(40)
+        for pulse in pulses:
+            s.addPulse(pulse)
+            references = store.get_anchor_references(pulse)
+            if references is not None:
+                self.assertEqual([pulses[i].outputValue for i in references], pulse.skipListAnchors)
+        rows = s.dbConnection.execute('SELECT pulseIndex, skipListAnchors, skipListAnchorRefs FROM {}'.format(s.table)).fetchall()
+        self.assertEqual(rows[0][2], None)
+        self.assertEqual(rows[28][1:], (b'', store.pack_anchor_references([27, 27, 27, 27, 0])))
+        self.assertEqual(s.fetchPulse(0, 28), pulses[28])
+        self.assertEqual(s.fetchManyPulses(0, list(range(40))), pulses)
+        self.assertEqual(list(s.checkAnchors(batch=7)), [])
+
+        # anchors not matching the chain are stored as they are
+        pulse = pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=40, skipListAnchors=[pulses[-1].outputValue.hex()] * 5))
+        s.addPulse(pulse)
+        self.assertEqual(s.dbConnection.execute('SELECT skipListAnchorRefs FROM {} WHERE pulseIndex = 40'.format(s.table)).fetchone()[0], None)
+        self.assertEqual(s.fetchPulse(0, 40), pulse)
+
+        # a referenced pulse changed
+        s.dbConnection.execute('UPDATE {} SET outputValue = ? WHERE pulseIndex = 27'.format(s.table), (EMPTY_HASH_BYTES,))
+        self.assertEqual(list(s.checkAnchors()), [(0, i) for i in range(27, 40)])
+        # ... is missing
+        s.dbConnection.execute('DELETE FROM {} WHERE pulseIndex = 27'.format(s.table))
+        self.assertEqual(list(s.checkAnchors()), [(0, i) for i in range(28, 40)])
+        with self.assertRaises(PulseChainException):
+            s.fetchPulse(0, 28)
+
+    def test_add_pulses(self):
+        s = self.open_store()
+        pulses = make_chain(40)
+        releases = [(pulse.timeStamp, 0.001) for pulse in pulses]
+        self.assertEqual(s.addPulses(pulses[:2]), 2)
+        original_chunk = store.BEACON_DB_INSERT_CHUNK
+        store.BEACON_DB_INSERT_CHUNK = 7
+        self.addCleanup(setattr, store, 'BEACON_DB_INSERT_CHUNK', original_chunk)
+        self.assertEqual(s.addPulses(iter(pulses[2:]), releases=iter(releases[2:])), 38)
+        self.assertEqual(s.fetchManyPulses(0, list(range(40))), pulses)
+        self.assertEqual(s.fetchRelease(0, 30), releases[30])
+        self.assertEqual(s.dbConnection.execute('SELECT count(*) FROM {} WHERE skipListAnchorRefs IS NOT NULL'.format(s.table)).fetchone()[0], 39)
+        self.assertEqual(list(s.checkAnchors()), [])
+        self.assertEqual(s.addPulses([]), 0)
+
+    def test_add_pulses_broken_chain(self):
+        s = self.open_store()
+        pulses = make_chain(20)
+        s.addPulses(pulses[:5])
+        # pulse 12 missing: nothing is inserted, not even the first chunk
+        original_chunk = store.BEACON_DB_INSERT_CHUNK
+        store.BEACON_DB_INSERT_CHUNK = 3
+        self.addCleanup(setattr, store, 'BEACON_DB_INSERT_CHUNK', original_chunk)
+        with self.assertRaises(PulseChainException):
+            s.addPulses(pulses[5:12] + pulses[13:])
+        self.assertFalse(s.dbConnection.in_transaction)
+        self.assertEqual(s.fetchLatestPulse(), pulses[4])
+        # nor the pulses of the addPulses failing after uncommitted ones
+        s.addPulse(pulses[5], False)
+        with self.assertRaises(PulseChainException):
+            s.addPulses(pulses[7:])
+        s.dbConnection.commit()
+        self.assertEqual(s.fetchLatestPulse(), pulses[5])
+        self.assertIsNone(s.fetchPulse(0, 7))
+        self.assertEqual(s.addPulses(pulses[6:]), 14)
+
+    def test_tip(self):
+        s = self.open_store()
+        pulses = make_chain(6)
+        self.assertIsNone(s.fetchLatestPulse())
+        s.addPulses(pulses[:3])
+        self.assertIs(s.fetchLatestPulse(), pulses[2])
+        # shared with the stores of withTable, kept per table
+        self.assertIs(s.withTable(s.table).fetchLatestPulse(), pulses[2])
+        other_table = s.withTable('beacon_records_other')
+        other_table.initDB()
+        self.assertIsNone(other_table.fetchLatestPulse())
+
+        # queried again once another connection inserted pulses
+        other = store.BeaconStore()
+        self.addCleanup(other.dbConnection.close)
+        self.assertEqual(other.fetchLatestPulse(), pulses[2])
+        other.addPulses(pulses[3:5])
+        self.assertEqual(s.fetchLatestPulse(), pulses[4])
+        s.addPulse(pulses[5])
+
+        # or after changes on its own connection, with resetTip
+        s.dbConnection.execute('DELETE FROM {} WHERE pulseIndex = 5'.format(s.table))
+        s.dbConnection.commit()
+        s.resetTip()
+        self.assertEqual(s.fetchLatestPulse(), pulses[4])
+        self.assertEqual(other.fetchLatestPulse(), pulses[4])
+
+    def test_time_lookup(self):
+        s = self.open_store()
+        start = datetime(2020, 1, 1)
+        times = [(0, start + timedelta(minutes=i), 60000) for i in range(30)]
+        # late pulses, then the period changed
+        times += [(0, start + timedelta(minutes=i, seconds=17), 60000) for i in range(30, 40)]
+        times += [(0, start + timedelta(minutes=39, seconds=17 + 30 * i), 30000) for i in range(1, 11)]
+        # a new chain, with microseconds
+        times += [(1, start + timedelta(hours=2, seconds=i, microseconds=5), 1000) for i in range(20)]
+        pulses = make_timed_chains(times)
+        s.addPulses(pulses[:45])
+        s.addPulses(pulses[45:])
+
+        catalog = s.chainCatalog()
+        self.assertEqual([chain.chainIndex for chain in catalog.chains], [0, 1])
+        self.assertEqual(len(catalog.chains[0].gaps), 2)
+        self.assertEqual(catalog.chains[1].gaps, [])
+        # the same pulses as with the timeStamp index
+        indexed = s.withTable(s.table)
+        indexed.chainCatalog = lambda: None
+        queries = [start - timedelta(days=1), start + timedelta(days=1)]
+        for _, time, _ in times:
+            queries += [time - timedelta(microseconds=1), time, time + timedelta(microseconds=1), time + timedelta(seconds=20)]
+        for dt in queries:
+            for fetch in ['fetchPulseByExactTime', 'fetchPulseByGeaterEqualTime', 'fetchNextPulseByTime', 'fetchPreviousPulseByTime', 'fetchPulseIdByExactTime']:
+                self.assertEqual(getattr(s, fetch)(dt), getattr(indexed, fetch)(dt), (fetch, dt))
+        self.assertEqual(s.fetchPulseIdByExactTime(times[35][1]), (0, 35))
+
+        # seen by the readers, built for the tables filled without it
+        s.deleteCatalog()
+        s.dbConnection.commit()
+        reader = store.BeaconStore(read_only=True)
+        self.addCleanup(reader.dbConnection.close)
+        self.assertIsNone(reader.chainCatalog())
+        self.assertEqual(reader.fetchPulseByGeaterEqualTime(times[33][1]), pulses[33])
+        s.initDB()
+        self.assertEqual(reader.chainCatalog().chains[0].segments, catalog.chains[0].segments)
+        self.assertEqual(reader.fetchPulseByGeaterEqualTime(times[33][1]), pulses[33])
+
+        # unordered timestamps: the timeStamp index is used
+        pulse = make_timed_chains([(2, times[5][1], 60000)])[0]
+        s.addPulse(pulse)
+        self.assertIsNone(s.chainCatalog())
+        self.assertIn(s.fetchPulseByExactTime(times[5][1]), [pulses[5], pulse])
+
+    def test_wal(self):
+        s = self.open_store()
+        self.assertEqual(s.dbConnection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        s.addPulse(pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=0)))
+
+        reader = store.BeaconStore(read_only=True)
+        self.addCleanup(reader.dbConnection.close)
+        # the readers aren't blocked by a write transaction
+        s.addPulse(pulse_from_dict(dict(PULSE_DICT, chainIndex=0, pulseIndex=1, skipListAnchors=[PULSE_DICT['outputValue']] * 5)), False)
+        self.assertEqual(reader.fetchLatestPulse().pulseIndex, 0)
+        s.dbConnection.commit()
+        self.assertEqual(reader.fetchLatestPulse().pulseIndex, 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.addCertificate('id', 'certificate')
+
+    def test_pool(self):
+        self.open_store()
+        pool = store.get_connection_pool(read_only=True)
+        self.addCleanup(pool.close)
+        self.assertIs(store.get_connection_pool(self.path, True), pool)
+        self.assertIsNot(store.get_connection_pool(read_only=False), pool)
+        s = store.BeaconStore(read_only=True, pooled=True)
+        other = s.withTable(store.BEACON_DB_TABLE + '_other')
+        self.assertIs(s.dbConnection, other.dbConnection)
+        self.assertIs(s.dbConnection, store.BeaconStore(read_only=True, pooled=True).dbConnection)
+
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(s.dbConnection))
+        thread.start()
+        thread.join()
+        self.assertIsNot(connections[0], s.dbConnection)
+        self.assertEqual(len(pool.connections), 2)
+        pool.close()
+        self.assertEqual(len(pool.connections), 0)
+        self.assertIsNone(s.fetchLatestPulse())
+
+if __name__ == '__main__':
+    unittest.main()
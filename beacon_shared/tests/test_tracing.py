@@ -0,0 +1,106 @@
+import unittest
+import os
+import json
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+from ..tracing import SpanRing, Tracer, SpanExporter, NO_SPAN
+from ..metrics_server import MetricsServer
+from ..metrics import METRICS
+
+class TestTracing(unittest.TestCase):
+
+    def test_ring(self):
+        ring = SpanRing(4)
+        for i in range(3):
+            ring.append(('test', i, 1))
+        entries, dropped = ring.read()
+        self.assertEqual([seq for seq, _ in entries], [0, 1, 2])
+        self.assertEqual(dropped, 0)
+        self.assertEqual(ring.read(3), ([], 0))
+
+        # wrapped around: 0 to 2 were overwritten
+        for i in range(3, 10):
+            ring.append(('test', i, 1))
+        entries, dropped = ring.read(3)
+        self.assertEqual([seq for seq, _ in entries], [6, 7, 8, 9])
+        self.assertEqual(dropped, 3)
+
+    def test_ring_threads(self):
+        ring = SpanRing(100000)
+        def append():
+            for i in range(10000):
+                ring.append(('test', i, 1))
+        threads = [threading.Thread(target=append) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        entries, dropped = ring.read()
+        self.assertEqual([seq for seq, _ in entries], list(range(40000)))
+        self.assertEqual(dropped, 0)
+
+    def test_tracer(self):
+        tracer = Tracer(16)
+        with tracer.span('stage'):
+            pass
+        with self.assertRaises(ValueError):
+            with tracer.span('failed'):
+                raise ValueError()
+        entries, _ = tracer.ring.read()
+        self.assertEqual([span[0] for _, span in entries], ['stage', 'failed'])
+        self.assertTrue(all(span[2] >= 0 for _, span in entries))
+
+        disabled = Tracer(16, False)
+        self.assertIs(disabled.span('stage'), NO_SPAN)
+        with disabled.span('stage'):
+            pass
+        self.assertEqual(disabled.ring.read(), ([], 0))
+
+    def test_exporter(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'spans.jsonl')
+        tracer = Tracer(4)
+        exporter = SpanExporter(tracer, path)
+        histogram = METRICS.histogram('span_test_export_duration')
+        count = histogram.count
+        dropped = exporter.dropped.value
+
+        for _ in range(3):
+            with tracer.span('test_export'):
+                pass
+        self.assertEqual(len(exporter.export()), 3)
+        self.assertEqual(exporter.export(), [])
+        for _ in range(6):
+            with tracer.span('test_export'):
+                pass
+        self.assertEqual(len(exporter.export()), 4)
+
+        self.assertEqual(histogram.count, count + 7)
+        self.assertEqual(exporter.dropped.value, dropped + 2)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line['seq'] for line in lines], [0, 1, 2, 5, 6, 7, 8])
+        self.assertEqual(lines[0]['name'], 'test_export')
+
+    def test_metrics_server(self):
+        tracer = Tracer(16)
+        with tracer.span('test_server'):
+            pass
+        server = MetricsServer(SpanExporter(tracer))
+        server.start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(server.url + 'spans') as response:
+            lines = [json.loads(line) for line in response.read().decode().splitlines()]
+        self.assertEqual([line['name'] for line in lines], ['test_server'])
+        with urllib.request.urlopen(server.url + 'metrics') as response:
+            metrics = json.loads(response.read())
+        self.assertEqual(metrics['span_test_server_duration']['count'], 1)
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(server.url + 'other')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,12 @@ class TestPulse(unittest.TestCase):
             ,  b'\x00\x00\x07\xd0'
         )
 
+    def test_sub_second_duration(self):
+        for ms in [100, 570, 1001]:
+            v = Duration(timedelta(milliseconds=ms))
+            self.assertEqual(v.get_json_value(), ms)
+            self.assertEqual(v.serialize(), ms.to_bytes(4, byteorder='big'))
+
     def test_bytes(self):
         input = '4dff4ea340f0a823f15d3f4f01ab62eae0e5da579ccb851f8db9dfe84c58b2b37b89903a740e1ee172da793a6e79d560e5f7f9bd058a12a280433ed6fa46510a'
         v = ByteHash(input)
@@ -0,0 +1,147 @@
+"""
+Per-stage timing spans of the pulse pipeline.
+
+Spans are timed with perf_counter_ns and appended to a ring buffer
+without taking a lock: a slot is claimed with an itertools.count (atomic
+under the GIL) and written with a single assignment. The hot path does
+nothing else. A SpanExporter drains the buffer in the background into
+the span_<name>_duration histograms of METRICS and, optionally, into
+a JSON lines file. Spans overwritten before they were exported are
+counted in span_dropped.
+
+    with TRACER.span('assemble'):
+        ...
+"""
+import os
+import json
+import time
+import threading
+import itertools
+from .metrics import METRICS
+
+TRACE_BUFFER_SIZE = 4096
+# seconds between two exports
+TRACE_EXPORT_INTERVAL = 1
+BEACON_TRACING = int(os.getenv('BEACON_TRACING', 1)) == 1
+
+class SpanRing:
+    """
+    Fixed size buffer of (seq, (name, start_ns, duration_ns)) entries
+    """
+    def __init__(self, capacity = TRACE_BUFFER_SIZE):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.counter = itertools.count()
+
+    def append(self, span):
+        seq = next(self.counter)
+        self.slots[seq % self.capacity] = (seq, span)
+
+    def read(self, since = 0):
+        """
+        The entries from seq `since` on that are still in the buffer, in
+        order, and the number of entries that were overwritten before
+        being read. Stops before an entry still being written.
+        """
+        entries = sorted((e for e in list(self.slots) if e is not None and e[0] >= since), key=lambda e: e[0])
+        if not entries:
+            return [], 0
+        dropped = 0
+        if entries[0][0] != since:
+            if entries[-1][0] - since < self.capacity:
+                # the next entry is claimed but not written yet
+                return [], 0
+            dropped = entries[0][0] - since
+        contiguous = 1
+        while contiguous < len(entries) and entries[contiguous][0] == entries[contiguous - 1][0] + 1:
+            contiguous += 1
+        return entries[:contiguous], dropped
+
+class Span:
+    __slots__ = ('ring', 'name', 'started_at')
+
+    def __init__(self, ring, name):
+        self.ring = ring
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.ring.append((self.name, self.started_at, time.perf_counter_ns() - self.started_at))
+        return False
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class Tracer:
+    def __init__(self, capacity = TRACE_BUFFER_SIZE, enabled = BEACON_TRACING):
+        self.ring = SpanRing(capacity)
+        self.enabled = enabled
+
+    def span(self, name):
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self.ring, name)
+
+class SpanExporter:
+    """
+    tracer - defaults to TRACER
+    path - Optional JSON lines file the spans are appended to
+    interval - see TRACE_EXPORT_INTERVAL
+    """
+    def __init__(self, tracer = None, path = None, interval = TRACE_EXPORT_INTERVAL):
+        self.tracer = TRACER if tracer is None else tracer
+        self.path = path
+        self.interval = interval
+        self.next_seq = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.dropped = METRICS.counter('span_dropped')
+
+    def export(self):
+        """
+        Move the new spans of the buffer to the histograms (and the file). Returns them
+        """
+        with self.lock:
+            entries, dropped = self.tracer.ring.read(self.next_seq)
+            if dropped:
+                self.dropped.inc(dropped)
+            if not entries:
+                return []
+            self.next_seq = entries[-1][0] + 1
+            for _, (name, _, duration_ns) in entries:
+                METRICS.histogram('span_{}_duration'.format(name)).observe(duration_ns / 1e9)
+            if self.path is not None:
+                with open(self.path, 'a') as f:
+                    f.writelines(span_to_json(seq, span) + '\n' for seq, span in entries)
+            return entries
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='span-exporter', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+
+def span_to_json(seq, span):
+    name, start_ns, duration_ns = span
+    return json.dumps({ "seq": seq, "name": name, "start_ns": start_ns, "duration_ns": duration_ns })
+
+# process wide tracer
+TRACER = Tracer()
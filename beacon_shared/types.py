@@ -1,5 +1,10 @@
 """
 Types used in a pulse
+
+Each type exposes static `parse`, `to_json` and `encode` methods that work
+on raw python values (int, str, bytes, datetime, timedelta, list of bytes).
+Pulse records store those raw values directly and use these codecs, while
+the BeaconType instances remain available as lightweight wrappers.
 """
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
@@ -12,15 +17,27 @@ class BeaconType(ABC):
         self.set(value)
         super().__init__()
 
+    """
+    Convert a value (raw, json or BeaconType) to the raw python value
+    """
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            return value.get()
+        return value
+
+    """
+    Get a json-ready value from a raw value
+    """
+    @staticmethod
+    def to_json(value):
+        return value
+
     """
     Default set method
     """
     def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
-
-        self.value = value
+        self.value = self.parse(value)
 
     """
     Default get method
@@ -33,13 +50,30 @@ class BeaconType(ABC):
     This should also be a value accepted by the set() method
     """
     def get_json_value(self):
-        return self.value
+        return self.to_json(self.value)
 
     """
-    Get the serialized value for this type (abstract)
+    Get the serialized value for this type
     """
-    @abstractmethod
     def serialize(self):
+        return self.encode(self.value)
+
+    """
+    Get the serialized value of a raw value (abstract)
+    """
+    @staticmethod
+    @abstractmethod
+    def encode(value):
+        pass
+
+    """
+    Append the struct format and arguments that encode a raw value
+    (used by the single pass PulseSerializer). Must produce the same
+    bytes as encode()
+    """
+    @staticmethod
+    @abstractmethod
+    def pack_struct(value, fmt, args):
         pass
 
 from .serialization import *
@@ -48,36 +82,51 @@ from .serialization import *
 Type representing a 32 bit integer
 """
 class UInt32(BeaconType):
-    def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            return value.get()
+        return int(value)
 
-        self.value = int(value)
+    @staticmethod
+    def encode(value):
+        return encode_uint32(value)
 
-    def serialize(self):
-        return encode_uint32(self.value)
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        fmt.append('I')
+        args.append(value)
 
 """
 Type representing a 64 bit integer
 """
 class UInt64(BeaconType):
-    def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            return value.get()
+        return int(value)
 
-        self.value = int(value)
+    @staticmethod
+    def encode(value):
+        return encode_uint64(value)
 
-    def serialize(self):
-        return encode_uint64(self.value)
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        fmt.append('Q')
+        args.append(value)
 
 """
 Type representing a character string
 """
 class String(BeaconType):
-    def serialize(self):
-        return encode_str(self.value)
+    @staticmethod
+    def encode(value):
+        return encode_str(value)
+
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        pack_bytes(value.encode('utf-8'), fmt, args)
 
 """
 Type representing a datetime
@@ -85,86 +134,120 @@ Note: Does not match specs. Length is 16 and does not have "Z"
 as terminating value. This is ISO standard.
 """
 class DateTime(BeaconType):
-    def set(self, value):
-        DATETIME_RESOLUTION = timedelta(microseconds=1000)
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            value = value.get()
         if isinstance(value, datetime):
-            self.value = value
-            return
+            return value
         if type(value) is int or type(value) is float:
-            self.value = datetime.utcfromtimestamp(value)
-            return
+            return datetime.utcfromtimestamp(value)
         if isinstance(value, str):
-            self.value = datetime.fromisoformat(value)
-            return
+            return datetime.fromisoformat(value)
         raise TypeError('Can not set beacon DateTime type from value provided')
 
-    def get_json_value(self):
-        return self.value.isoformat()
+    @staticmethod
+    def to_json(value):
+        return value.isoformat()
 
-    def serialize(self):
-        return encode_str(self.value.isoformat())
+    @staticmethod
+    def encode(value):
+        return encode_str(value.isoformat())
+
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        pack_bytes(value.isoformat().encode('utf-8'), fmt, args)
+
+def to_milliseconds(value):
+    # exact (value.total_seconds() * 1000 can round down, eg: 1001ms)
+    return value // timedelta(milliseconds=1)
 
 """
 Type representing a duration (eg: period)
 """
 class Duration(BeaconType):
-    def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            value = value.get()
         if isinstance(value, timedelta):
-            self.value = value
-            return
+            return value
         if type(value) is int:
-            self.value = timedelta(milliseconds=value)
-            return
+            return timedelta(milliseconds=value)
         raise TypeError('Can not set beacon Duration type from value provided')
 
-    def get_json_value(self):
-        return int(self.value.total_seconds() * 1000)
+    @staticmethod
+    def to_json(value):
+        return to_milliseconds(value)
 
-    def serialize(self):
-        return encode_uint32(int(self.value.total_seconds() * 1000))
+    @staticmethod
+    def encode(value):
+        return encode_uint32(to_milliseconds(value))
+
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        fmt.append('I')
+        args.append(to_milliseconds(value))
 
 """
 Type representing a bytehash (eg: signature, randOut, ...)
 """
 class ByteHash(BeaconType):
-    def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
+    @staticmethod
+    def parse(value):
+        if isinstance(value, BeaconType):
+            value = value.get()
         if isinstance(value, str):
             value = bytes.fromhex(value)
 
         if type(value) is not bytes:
             raise TypeError('Can not set beacon ByteHash type from value provided')
 
-        self.value = value
+        return value
 
-    def get_json_value(self):
-        return self.value.hex()
+    @staticmethod
+    def to_json(value):
+        return value.hex()
 
-    def serialize(self):
-        return encode_bytes(self.value)
+    @staticmethod
+    def encode(value):
+        return encode_bytes(value)
+
+    @staticmethod
+    def pack_struct(value, fmt, args):
+        pack_bytes(value, fmt, args)
 
 """
 Type representing a list of skiplist anchors
+
+The raw value is a list of bytes. For backwards compatibility the
+wrapper instance holds (and get() returns) a list of ByteHash types.
 """
 class SkipAnchors(BeaconType):
-    def set(self, value):
-        if isinstance(value, type(self)):
-            self.value = value.get()
-            return
-        if type(value) is not list:
+    @staticmethod
+    def parse(value):
+        if isinstance(value, SkipAnchors):
+            value = value.get()
+        if type(value) is not list and type(value) is not tuple:
             raise TypeError('Can not set beacon SkipAnchors type from value provided. Must be a list of ByteHash types')
 
-        self.value = []
+        return [ByteHash.parse(b) for b in value]
+
+    @staticmethod
+    def to_json(value):
+        return [b.hex() for b in value]
+
+    @staticmethod
+    def encode(value):
+        return b''.join([encode_bytes(b) for b in value])
+
+    @staticmethod
+    def pack_struct(value, fmt, args):
         for b in value:
-            if isinstance(b, ByteHash):
-                self.value.append(ByteHash(b.get()))
-            else:
-                self.value.append(ByteHash(b))
+            pack_bytes(b, fmt, args)
+
+    def set(self, value):
+        self.value = [ByteHash(b) for b in self.parse(value)]
 
     def get_json_value(self):
         return [b.get_json_value() for b in self.value]
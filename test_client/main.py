@@ -3,11 +3,9 @@ import urllib.request, json
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding, utils
 from cryptography.exceptions import InvalidSignature
 from cryptography import x509
-from beacon_shared.pulse import pulse_from_dict, get_pulse_values, pulse_to_plain_dict
-from beacon_shared.hashing import hash_many
+from beacon_shared.pulse import pulse_from_dict, pulse_to_plain_dict, verify_pulse, PulseOutputValueException
 import pprint
 
 ADDR=(sys.argv[1] if len(sys.argv) > 1 else 'localhost')
@@ -37,18 +35,11 @@ def fetchCertificate(hashid):
 
 def validatePulse(pulse, cert = None):
     if cert == None:
-        cert = fetchCertificate(pulse['certificateId'].get_json_value())
+        cert = fetchCertificate(pulse.certificateId.hex())
 
-    signed_values = get_pulse_values(pulse, 'signatureValue')
-    digest = hash_many(signed_values)
-
-    # If the signature does not match, verify() will raise an InvalidSignature exception.
-    return cert.public_key().verify(
-        pulse['signatureValue'].get(),
-        digest,
-        padding.PKCS1v15(),
-        utils.Prehashed(hashes.SHA512())
-    )
+    # If the signature does not match, this will raise an InvalidSignature exception.
+    # The signature algorithm is chosen by the pulse's cypherSuite
+    verify_pulse(pulse, cert.public_key())
 
 def validateSkiplist(chain, src, dest):
     skiplist = fetch_json('http://{}:8080/skiplist/chain/{}/{}/{}'.format(ADDR, chain, src, dest))
@@ -62,9 +53,8 @@ def validateSkiplist(chain, src, dest):
             prev = pulse
             continue
 
-        anchorValues = [x.get() for x in pulse['skipListAnchors'].get()]
-        if prev['outputValue'].get() not in anchorValues:
-            raise Exception('Invalid skiplist. No link between pulses {} and {}'.format(prev['pulseIndex'].get(), pulse['pulseIndex'].get()))
+        if prev.outputValue not in pulse.skipListAnchors:
+            raise Exception('Invalid skiplist. No link between pulses {} and {}'.format(prev.pulseIndex, pulse.pulseIndex))
 
         prev = pulse
 
@@ -74,7 +64,7 @@ def validateSkiplist(chain, src, dest):
 if __name__ == '__main__':
     pp = pprint.PrettyPrinter(indent=4)
     pulse = fetchLastPulse()
-    cert = fetchCertificate(pulse['certificateId'].get_json_value())
+    cert = fetchCertificate(pulse.certificateId.hex())
     print('\n*** Latest Pulse ***')
     pp.pprint(pulse_to_plain_dict(pulse))
     print('\n*** Got Cert ***')
@@ -83,15 +73,15 @@ if __name__ == '__main__':
     try:
         validatePulse(pulse, cert)
         print('>>> OK <<<')
-    except InvalidSignature as e:
+    except (InvalidSignature, PulseOutputValueException) as e:
         print('!!!! INVALID PULSE !!!!')
 
 
     srcid = 2
-    chainid = pulse["chainIndex"].get()
-    print('\n\n*** Validating skiplist in chain {} from last pulse ({}) to pulse {} ***'.format(chainid, pulse['pulseIndex'].get(), srcid))
+    chainid = pulse.chainIndex
+    print('\n\n*** Validating skiplist in chain {} from last pulse ({}) to pulse {} ***'.format(chainid, pulse.pulseIndex, srcid))
     try:
-        validateSkiplist(chainid, srcid, pulse['pulseIndex'].get())
+        validateSkiplist(chainid, srcid, pulse.pulseIndex)
         print('>>> Valid skiplist <<<')
     except Exception as e:
         print(e)